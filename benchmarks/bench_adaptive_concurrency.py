@@ -0,0 +1,88 @@
+"""
+Gemini API の同時実行数制御（AdaptiveConcurrencyController）のベンチマーク。
+同時に処理できるリクエスト数を超えると 429 を返す偽バックエンドに対して、
+固定の同時実行数と、AIMD による自動調整を比較する。
+
+使い方 (リポジトリのルートで実行):
+    python -m benchmarks.bench_adaptive_concurrency --capacity 6 --requests 300 --threads 32
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import errors as genai_errors
+
+from core.adaptive_concurrency import AdaptiveConcurrencyController
+
+
+class FakeGeminiBackend:
+    """同時実行数が capacity を超えたリクエストに 429 (RESOURCE_EXHAUSTED) を返す偽バックエンド。"""
+
+    def __init__(self, capacity: int, latency: float):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, **kwargs):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise genai_errors.ClientError(
+                    429, {"error": {"code": 429, "message": "Resource exhausted (fake)", "status": "RESOURCE_EXHAUSTED"}}
+                )
+            self.in_flight += 1
+        try:
+            time.sleep(self.latency)
+            return {"text": "ok"}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _run(label: str, controller: AdaptiveConcurrencyController, args):
+    backend = FakeGeminiBackend(args.capacity, args.latency)
+    failures = 0
+
+    def one_call(_):
+        nonlocal failures
+        try:
+            controller.call(backend.generate_content, model="fake", contents="prompt")
+        except genai_errors.ClientError:
+            failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(one_call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    stats = controller.get_stats()
+    print(
+        f"[Bench] {label}: {args.requests} 件 / {elapsed:.2f} 秒 ({args.requests / elapsed:.1f} 件/秒), "
+        f"429応答 {backend.throttled} 回, 失敗 {failures} 件, 最終上限 {stats['limit']:.1f} (最大 {stats['peak_limit']:.1f})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini同時実行数制御のベンチマーク")
+    parser.add_argument("--capacity", type=int, default=6, help="偽バックエンドが同時に処理できるリクエスト数")
+    parser.add_argument("--latency", type=float, default=0.05, help="1リクエストあたりの処理時間（秒）")
+    parser.add_argument("--requests", type=int, default=300, help="リクエスト数")
+    parser.add_argument("--threads", type=int, default=32, help="リクエストを発行するスレッド数")
+    args = parser.parse_args()
+
+    # バックオフはベンチマーク用に短くする（実運用のデフォルトは2秒から）
+    common = {"base_backoff": args.latency, "max_backoff": args.latency * 20, "max_retries": 10}
+    _run("固定 (同時実行1)", AdaptiveConcurrencyController("fixed-1", initial_limit=1, max_limit=1, **common), args)
+    _run(
+        f"固定 (同時実行{args.threads})",
+        AdaptiveConcurrencyController(f"fixed-{args.threads}", initial_limit=args.threads, min_limit=args.threads, max_limit=args.threads, **common),
+        args,
+    )
+    _run("自動調整 (AIMD)", AdaptiveConcurrencyController("aimd", initial_limit=2, max_limit=args.threads, **common), args)
+
+
+if __name__ == "__main__":
+    main()
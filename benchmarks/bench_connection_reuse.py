@@ -0,0 +1,84 @@
+"""
+クライアントを記事ごとに生成する方式と、ClientRegistry で共有する方式の比較ベンチマーク。
+ローカルの keep-alive 対応HTTPサーバーに対してダウンロードを繰り返し、
+新規TCP接続数と所要時間を計測する。
+
+使い方 (リポジトリのルートで実行):
+    python -m benchmarks.bench_connection_reuse --requests 200
+
+(ローカルサーバーは平文HTTPのため、実環境で発生するTLSハンドシェイクのコストは含まれない。
+ 実環境では接続1回ごとに更にTLSハンドシェイク分の遅延が加わる)
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.client_registry import ClientRegistry
+from utils.jstage_client import JStageClient
+from utils.rate_limiter import LimiterLanes
+
+PDF_BODY = b"%PDF-1.4\n" + b"0" * 64 * 1024
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connection_count = 0
+    _count_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _KeepAliveHandler._count_lock:
+            _KeepAliveHandler.connection_count += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(PDF_BODY)))
+        self.end_headers()
+        self.wfile.write(PDF_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run(label: str, n_requests: int, url: str, make_client):
+    _KeepAliveHandler.connection_count = 0
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        client = make_client()
+        content, content_type = client.download_article_content(url)
+        if content_type != "application/pdf":
+            raise SystemExit(f"[Bench] ダウンロードに失敗しました: {label}")
+    elapsed = time.perf_counter() - start
+    print(
+        f"[Bench] {label}: {n_requests} 件 / {elapsed:.2f} 秒 "
+        f"({n_requests / elapsed:.0f} 件/秒), 新規TCP接続 {_KeepAliveHandler.connection_count} 回"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="クライアント共有による接続再利用のベンチマーク")
+    parser.add_argument("--requests", type=int, default=200, help="ダウンロード回数 (デフォルト: 200)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/article/test/_pdf/"
+
+    # レート制限の待機を除外して、接続コストのみを比較する
+    lanes = LimiterLanes({"search": {"interval": 0}, "article": {"interval": 0}})
+
+    # 旧方式: 記事ごとに JStageClient を生成する（接続プールが毎回破棄される）
+    _run("記事ごとに生成", args.requests, url, lambda: JStageClient(lanes=lanes))
+
+    # 新方式: ClientRegistry から同じクライアントを受け取る
+    registry = ClientRegistry(lanes=lanes)
+    _run("レジストリで共有", args.requests, url, registry.get_jstage_client)
+
+    registry.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
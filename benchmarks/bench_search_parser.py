@@ -0,0 +1,68 @@
+"""
+search_articles の応答XML解析のベンチマーク。
+旧実装（ET.fromstring + ElementPath）と iterparse による1パス実装を比較する。
+
+使い方 (リポジトリのルートで実行):
+    python -m benchmarks.bench_search_parser
+    python -m benchmarks.bench_search_parser --fixture recorded_page1.xml recorded_page2.xml
+
+--fixture を省略した場合は、実際の応答の構造を模した1000件のフィクスチャを生成して使用する。
+--save-fixture を指定すると、生成したフィクスチャをファイルに保存する。
+"""
+import argparse
+import time
+import statistics
+
+from benchmarks.fixtures import build_search_response
+from utils.jstage_search_parser import parse_search_response, parse_search_response_etree
+
+
+def _time_parser(func, payload, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="J-STAGE検索応答XMLの解析ベンチマーク")
+    parser.add_argument("--fixture", nargs="*", default=[], help="記録済みの検索応答XMLファイル")
+    parser.add_argument("--entries", type=int, default=1000, help="生成するフィクスチャのエントリ数 (デフォルト: 1000)")
+    parser.add_argument("--repeat", type=int, default=20, help="各パーサーの実行回数 (デフォルト: 20)")
+    parser.add_argument("--save-fixture", type=str, default=None, help="生成したフィクスチャの保存先")
+    args = parser.parse_args()
+
+    if args.fixture:
+        fixtures = []
+        for path in args.fixture:
+            with open(path, "rb") as f:
+                fixtures.append((path, f.read()))
+    else:
+        payload = build_search_response(n_entries=args.entries)
+        if args.save_fixture:
+            with open(args.save_fixture, "wb") as f:
+                f.write(payload)
+        fixtures = [(f"generated ({args.entries} entries)", payload)]
+
+    for name, payload in fixtures:
+        legacy_result = parse_search_response_etree(payload.decode("utf-8"))
+        streaming_result = parse_search_response(payload)
+        if legacy_result != streaming_result:
+            raise SystemExit(f"[Bench] 解析結果が一致しません: {name}")
+
+        # 旧実装は response.text (デコード済み文字列) を受け取っていたため、デコードも計測に含める
+        legacy_times = _time_parser(lambda p: parse_search_response_etree(p.decode("utf-8")), payload, args.repeat)
+        streaming_times = _time_parser(parse_search_response, payload, args.repeat)
+
+        legacy_ms = statistics.median(legacy_times) * 1000
+        streaming_ms = statistics.median(streaming_times) * 1000
+        print(f"[Bench] {name}: {len(streaming_result[0])} 件, {len(payload) / 1024:.0f} KiB")
+        print(f"  -> 旧実装 (fromstring + ElementPath): 中央値 {legacy_ms:.1f} ms")
+        print(f"  -> iterparse (1パス):                 中央値 {streaming_ms:.1f} ms")
+        print(f"  -> 速度比: {legacy_ms / streaming_ms:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+SEARCH_RESPONSE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:prism="http://prismstandard.org/namespaces/basic/2.0/" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+<result><status>0</status><message/></result>
+<title>J-STAGE Web API 検索結果</title>
+<opensearch:totalResults>{total_results}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+<opensearch:itemsPerPage>{count}</opensearch:itemsPerPage>
+"""
+
+SEARCH_RESPONSE_FOOTER = "</feed>\n"
+
+JOURNALS = [
+    ("jspt", "理学療法学", "Physical Therapy Japan"),
+    ("cjpt", "理学療法学Supplement", "Japanese Physical Therapy Association Congress Proceedings"),
+    ("jjrmc", "The Japanese Journal of Rehabilitation Medicine", "The Japanese Journal of Rehabilitation Medicine"),
+    ("rika", "理学療法科学", "Rigakuryoho Kagaku"),
+]
+
+
+def build_search_entry(index: int, rng: random.Random, base_url: str = "https://www.jstage.jst.go.jp") -> str:
+    """J-STAGE検索APIの atom:entry を1件分生成する（実際の応答の構造を模したもの）。"""
+    code, journal_ja, journal_en = rng.choice(JOURNALS)
+    year = rng.randint(1995, 2024)
+    article_id = f"{year}.{rng.randint(1, 50)}_{index}"
+    article_url = f"{base_url}/article/{code}/{year}/0/{article_id}/_article/-char/ja/"
+    doi = f"10.{rng.randint(10000, 19999)}/{code}.{article_id}"
+
+    title_ja = f"<ja>{escape(f'変形性膝関節症に対する運動療法の効果 {index}')}</ja>" if rng.random() > 0.1 else "<ja/>"
+    links = [f'<link type="text/html" href={quoteattr(article_url)}/>']
+    if rng.random() < 0.3:
+        links.insert(0, f'<link type="application/pdf" href={quoteattr(article_url.replace("/_article/-char/ja/", "/_pdf"))}/>')
+
+    return f"""<entry>
+<article_title>{title_ja}<en>{escape(f'Effect of exercise therapy for knee osteoarthritis {index}')}</en></article_title>
+<article_link><ja>{escape(article_url)}</ja><en>{escape(article_url)}</en></article_link>
+<author><ja><name>山田 太郎</name><name>佐藤 花子</name></ja><en><name>Taro Yamada</name><name>Hanako Sato</name></en></author>
+<cdjournal>{code}</cdjournal>
+<material_title><ja>{escape(journal_ja)}</ja><en>{escape(journal_en)}</en></material_title>
+<prism:issn>0289-3770</prism:issn>
+<prism:publicationName>{escape(journal_en)}</prism:publicationName>
+<prism:volume>{rng.randint(1, 50)}</prism:volume>
+<prism:number>{rng.randint(1, 12)}</prism:number>
+<prism:startingPage>{rng.randint(1, 500)}</prism:startingPage>
+<prism:endingPage>{rng.randint(501, 900)}</prism:endingPage>
+<pubyear>{year}</pubyear>
+{"<prism:publicationDate>%d-%02d-01</prism:publicationDate>" % (year, rng.randint(1, 12)) if rng.random() > 0.2 else ""}
+<joi>JST.JSTAGE/{code}/{article_id}</joi>
+<prism:doi>{escape(doi)}</prism:doi>
+{"".join(links)}
+<id>{escape(article_url)}</id>
+<updated>{year}-01-01T00:00:00+09:00</updated>
+</entry>
+"""
+
+
+def build_search_response(
+    n_entries: int = 1000,
+    total_results: int | None = None,
+    start: int = 1,
+    seed: int = 0,
+    base_url: str = "https://www.jstage.jst.go.jp",
+) -> bytes:
+    """n_entries 件のエントリを含む検索APIの応答XMLを生成する。"""
+    rng = random.Random(seed)
+    header = SEARCH_RESPONSE_HEADER.format(
+        total_results=total_results if total_results is not None else n_entries, start=start, count=n_entries
+    )
+    entries = "".join(build_search_entry(start + i, rng, base_url) for i in range(n_entries))
+    return (header + entries + SEARCH_RESPONSE_FOOTER).encode("utf-8")
@@ -0,0 +1,167 @@
+import os
+import time
+import random
+import threading
+from typing import Callable, Any, Optional
+from dotenv import load_dotenv
+
+from google.genai import errors as genai_errors
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, TooManyRequests
+
+load_dotenv()
+
+# スロットリング（同時実行数を下げるべき応答）とみなすHTTPステータスコード
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    例外がレート制限・過負荷（429 / 503）によるものかを判定する。
+    google-genai の APIError（.code）と google.api_core の例外の両方に対応する。
+    """
+    if isinstance(error, (ResourceExhausted, ServiceUnavailable, TooManyRequests)):
+        return True
+    if isinstance(error, genai_errors.APIError):
+        return error.code in THROTTLE_STATUS_CODES
+    # テスト用の偽バックエンドなど、code / status_code 属性を持つ例外
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code in THROTTLE_STATUS_CODES
+
+
+class AdaptiveConcurrencyController:
+    """
+    Gemini API の同時実行数（処理中のリクエスト数の上限）を、応答に応じて自動調整するコントローラー。
+    AIMD（加算増加・乗算減少）で制御する。
+
+    - 成功するたびに上限を少しずつ増やす（上限1つ分の成功で +increase_step）。
+    - 429 / 503 を受けたら上限を decrease_factor 倍に下げ、バックオフ（ジッター付き）後に再試行する。
+      同じ混雑で一斉に失敗したリクエストが上限を何度も下げないよう、
+      直前の減少より前に開始したリクエストの失敗では下げない。
+    - latency_target（秒）を設定した場合、応答がそれより遅ければ増加を止め、上限を緩やかに下げる。
+
+    設定は環境変数でも変更できる:
+        GEMINI_INITIAL_CONCURRENCY（デフォルト: 2）, GEMINI_MAX_CONCURRENCY（デフォルト: 16）,
+        GEMINI_LATENCY_TARGET_SECONDS（デフォルト: 0 = 無効）, GEMINI_MAX_RETRIES（デフォルト: 5）
+    """
+
+    def __init__(
+        self,
+        name: str = "gemini",
+        initial_limit: Optional[float] = None,
+        min_limit: float = 1,
+        max_limit: Optional[float] = None,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_target: Optional[float] = None,
+        latency_decrease_factor: float = 0.9,
+        max_retries: Optional[int] = None,
+        base_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit if max_limit is not None else float(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+        initial = initial_limit if initial_limit is not None else float(os.getenv("GEMINI_INITIAL_CONCURRENCY", 2))
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        if latency_target is None:
+            latency_target = float(os.getenv("GEMINI_LATENCY_TARGET_SECONDS", 0)) or None
+        self.latency_target = latency_target
+        self.latency_decrease_factor = latency_decrease_factor
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GEMINI_MAX_RETRIES", 5))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+
+        self.in_flight = 0
+        self._last_decrease_at = 0.0
+        self._condition = threading.Condition()
+        # スレッドごとの、直前の call で行った再試行の回数（呼び出し側が用途ごとに集計するため）
+        self._local = threading.local()
+        self.stats = {"calls": 0, "successes": 0, "throttled": 0, "retries": 0, "failures": 0, "decreases": 0, "peak_limit": self.limit}
+
+    def acquire(self) -> float:
+        """処理中のリクエスト数が上限未満になるまで待ち、枠を確保する。開始時刻を返す。"""
+        with self._condition:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started_at: float, outcome: str):
+        """
+        枠を解放し、結果に応じて上限を調整する。
+        outcome: "success"（成功）, "throttled"（429/503）, "error"（その他のエラー。上限は変えない）
+        """
+        latency = time.monotonic() - started_at
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.stats["successes"] += 1
+                if self.latency_target and latency > self.latency_target:
+                    self._decrease(started_at, self.latency_decrease_factor)
+                else:
+                    self.limit = min(self.max_limit, self.limit + self.increase_step / max(self.limit, 1))
+                    self.stats["peak_limit"] = max(self.stats["peak_limit"], self.limit)
+            elif outcome == "throttled":
+                self.stats["throttled"] += 1
+                self._decrease(started_at, self.decrease_factor)
+            else:
+                self.stats["failures"] += 1
+            self._condition.notify_all()
+
+    def _decrease(self, started_at: float, factor: float):
+        """上限を factor 倍に下げる（ロック内で呼び出すこと）。直前の減少より前に開始したリクエストでは下げない。"""
+        if started_at < self._last_decrease_at:
+            return
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease_at = time.monotonic()
+        self.stats["decreases"] += 1
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        return min(self.max_backoff, self.base_backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        func(*args, **kwargs) を同時実行数の上限内で実行する。
+        429 / 503 の場合は上限を下げ、バックオフ後に最大 max_retries 回まで再試行する。
+        それ以外の例外はそのまま送出する。
+        """
+        with self._condition:
+            self.stats["calls"] += 1
+        self._local.retries = 0
+        for attempt in range(self.max_retries + 1):
+            started_at = self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    self.release(started_at, "error")
+                    raise
+                self.release(started_at, "throttled")
+                if attempt >= self.max_retries:
+                    print(f"[AdaptiveConcurrency] '{self.name}': {self.max_retries}回の再試行後もレート制限が続いたため失敗とします。")
+                    raise
+                wait_time = self._backoff_seconds(attempt)
+                print(
+                    f"[AdaptiveConcurrency] '{self.name}': レート制限またはサーバー過負荷 ({e.__class__.__name__})。"
+                    f"同時実行数の上限を {self.limit:.1f} に下げ、{wait_time:.1f}秒後に再試行します... ({attempt + 1}/{self.max_retries})"
+                )
+                with self._condition:
+                    self.stats["retries"] += 1
+                self._local.retries += 1
+                self._sleep(wait_time)
+                continue
+            self.release(started_at, "success")
+            return result
+
+    def last_call_retries(self) -> int:
+        """このスレッドで直前に呼び出した call が、429 / 503 のために再試行した回数を返す。"""
+        return getattr(self._local, "retries", 0)
+
+    def get_stats(self) -> dict:
+        """現在の上限と集計値を返す。"""
+        with self._condition:
+            return {"name": self.name, "limit": self.limit, "in_flight": self.in_flight, **self.stats}
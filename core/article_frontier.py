@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+from typing import Dict, List, Iterator, Optional
+
+DEFAULT_FRONTIER_PATH = os.path.join("output", "pipeline_1_frontier.jsonl")
+
+
+class ArticleFrontier:
+    """
+    全キーワードの検索結果をDOIで重複排除して保持する「フロンティア」。
+    論文ごとに、どのキーワードでヒットしたかも記録する。
+
+    検索（収集フェーズ）と変換（LLM処理）を分離するために使う。
+    先に全キーワードの検索を済ませてユニークな論文数を把握し、変換はフロンティアから重複なしで順に行う。
+
+    永続化は追記型のJSONL（1ヒット = 1行）で行い、中断しても再開時に読み込み直せる。
+    同じキーワード・DOIの組は最初の1回だけ数えて記録する（同じページを再取得した場合など）。
+    追記用のファイルは最初の書き込みで開いたまま使い回し、close() で閉じる。
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_FRONTIER_PATH):
+        self.path = path
+        self._entries: Dict[str, dict] = {}  # DOI -> {"article": {...}, "keywords": [...]}
+        self._keyword_hits: Dict[str, int] = {}  # キーワード -> ヒット件数（重複込み）
+        self._lock = threading.Lock()
+        self._file = None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断した最終行などは無視する
+                    continue
+                self._add_in_memory(record["article"], record["keyword"])
+        print(f"[ArticleFrontier] {len(self._entries)}件の論文をフロンティアから読み込みました。")
+
+    def _add_in_memory(self, article: dict, keyword: str) -> tuple:
+        """(新規のDOIか, 新規のキーワード・DOIの組か) を返す。既にある組は数えない。"""
+        doi = article["doi"]
+        entry = self._entries.get(doi)
+        if entry is not None and keyword in entry["keywords"]:
+            return False, False
+        self._keyword_hits[keyword] = self._keyword_hits.get(keyword, 0) + 1
+        if entry is None:
+            self._entries[doi] = {"article": article, "keywords": [keyword]}
+            return True, True
+        entry["keywords"].append(keyword)
+        return False, True
+
+    def add(self, article: dict, keyword: str) -> bool:
+        """
+        検索でヒットした論文を追加する。DOIのない論文は無視する。
+        新規のDOIだった場合は True、既にフロンティアにあった場合は False を返す。
+        """
+        if not article.get("doi"):
+            return False
+        with self._lock:
+            is_new, is_new_hit = self._add_in_memory(article, keyword)
+            if self.path and is_new_hit:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(json.dumps({"keyword": keyword, "article": article}, ensure_ascii=False) + "\n")
+                self._file.flush()
+            return is_new
+
+    def close(self):
+        """追記用のファイルを閉じる（次の add で開き直す）。"""
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reset(self):
+        """フロンティアを空にし、永続化ファイルも削除する。"""
+        with self._lock:
+            self._entries.clear()
+            self._keyword_hits.clear()
+            self._close_file()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, doi: str) -> bool:
+        return doi in self._entries
+
+    def get_keywords(self, doi: str) -> List[str]:
+        """論文にヒットしたキーワードの一覧を返す。"""
+        entry = self._entries.get(doi)
+        return list(entry["keywords"]) if entry else []
+
+    def iter_pending(self, processed_dois: set) -> Iterator[dict]:
+        """
+        未処理の論文を、収集した順に返す。
+        各要素は {"doi", "article", "keywords"} の辞書。
+        """
+        with self._lock:
+            snapshot = list(self._entries.items())
+        for doi, entry in snapshot:
+            if doi in processed_dois:
+                continue
+            yield {"doi": doi, "article": entry["article"], "keywords": list(entry["keywords"])}
+
+    def build_report(self, processed_dois: set) -> dict:
+        """
+        収集結果のレポートを作成する（LLM処理を始める前の見積もり用）。
+        - total_hits: 全キーワードのヒット件数の合計（重複込み）
+        - unique_articles: DOIで重複排除した論文数
+        - already_processed / pending: 処理済み / 未処理の論文数
+        - keywords: キーワードごとの hits（ヒット件数）, exclusive（そのキーワードでしかヒットしない論文数）,
+                    pending（未処理の論文数）
+        """
+        with self._lock:
+            keyword_stats = {
+                keyword: {"hits": hits, "exclusive": 0, "pending": 0}
+                for keyword, hits in self._keyword_hits.items()
+            }
+            already_processed = 0
+            for doi, entry in self._entries.items():
+                is_processed = doi in processed_dois
+                if is_processed:
+                    already_processed += 1
+                for keyword in entry["keywords"]:
+                    stats = keyword_stats[keyword]
+                    if len(entry["keywords"]) == 1:
+                        stats["exclusive"] += 1
+                    if not is_processed:
+                        stats["pending"] += 1
+
+            return {
+                "total_hits": sum(self._keyword_hits.values()),
+                "unique_articles": len(self._entries),
+                "already_processed": already_processed,
+                "pending": len(self._entries) - already_processed,
+                "keywords": keyword_stats,
+            }
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Callable, Optional, List, Tuple
+from dotenv import load_dotenv
+
+from google import genai
+from google.genai import types
+
+load_dotenv()
+
+DEFAULT_BATCH_STATE_DIR = os.path.join("output", "batch_jobs")
+# 1バッチあたりのリクエスト数
+DEFAULT_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", 20))
+# 1バッチあたりの合計リクエストサイズ（インラインのバッチリクエストは全体で約20MBまで）
+# サイズは送信時の大きさ（estimate_request_bytes: インラインのPDFは base64 エンコード後）で数える
+DEFAULT_BATCH_MAX_BYTES = int(os.getenv("GEMINI_BATCH_MAX_BYTES", 18 * 1024**2))
+# バッチジョブの状態を確認する間隔（秒）
+DEFAULT_BATCH_POLL_SECONDS = float(os.getenv("GEMINI_BATCH_POLL_SECONDS", 30))
+
+SUCCEEDED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+
+def base64_size(size: int) -> int:
+    """size バイトのデータを base64 でエンコードしたときのバイト数を返す。"""
+    return 4 * ((size + 2) // 3)
+
+
+def estimate_request_bytes(request: dict) -> int:
+    """
+    バッチに入れる generate_content の引数の送信サイズを見積もる。
+    インラインのデータ（PDF）は base64 エンコード後、テキストは UTF-8 のバイト数で数える。
+    """
+    contents = request["contents"]
+    total = 0
+    for item in contents if isinstance(contents, list) else [contents]:
+        if isinstance(item, str):
+            total += len(item.encode("utf-8"))
+        elif getattr(item, "inline_data", None) is not None and item.inline_data.data is not None:
+            total += base64_size(len(item.inline_data.data))
+        elif getattr(item, "text", None):
+            total += len(item.text.encode("utf-8"))
+    return total
+
+
+class GeminiBatchBackend:
+    """
+    Gemini Batch API（client.batches）を使うバックエンド。
+    リクエストはインラインで送信し、結果はジョブ完了後に inlined_responses から取得する（順序は送信順）。
+    """
+
+    name = "gemini"
+
+    def __init__(self, client: genai.Client):
+        self.client = client
+
+    def submit(self, requests: List[dict], display_name: str) -> str:
+        inlined_requests = [
+            types.InlinedRequest(contents=request["contents"], config=request.get("config")) for request in requests
+        ]
+        job = self.client.batches.create(
+            model=requests[0]["model"], src=inlined_requests, config={"display_name": display_name}
+        )
+        return job.name
+
+    def get_state(self, job_name: str) -> Tuple[str, Optional[List[dict]]]:
+        """(ジョブの状態, 完了していれば結果のリスト) を返す。結果は {"text": ...} または {"error": ...}。"""
+        job = self.client.batches.get(name=job_name)
+        state = job.state.name if job.state else "JOB_STATE_UNSPECIFIED"
+        if state not in SUCCEEDED_STATES:
+            return state, None
+
+        results = []
+        for inlined_response in (job.dest.inlined_responses if job.dest else None) or []:
+            if inlined_response.error:
+                results.append({"error": str(inlined_response.error)})
+            else:
+                results.append({"text": inlined_response.response.text if inlined_response.response else None})
+        return state, results
+
+
+class LocalBatchBackend:
+    """
+    Batch API のローカル代替バックエンド。
+    submit 時に各リクエストを generate 関数（generate_content の引数を受け取り本文を返す）で順に処理し、
+    結果をファイルに保存する。オフラインでの動作確認や、Batch API が使えない環境で使用する。
+    """
+
+    name = "local"
+
+    def __init__(self, generate: Callable[[dict], str], results_dir: str = os.path.join(DEFAULT_BATCH_STATE_DIR, "local")):
+        self.generate = generate
+        self.results_dir = results_dir
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def _results_path(self, job_name: str) -> str:
+        return os.path.join(self.results_dir, f"{job_name}.json")
+
+    def submit(self, requests: List[dict], display_name: str) -> str:
+        job_name = f"local-{uuid.uuid4().hex}"
+        results = []
+        for request in requests:
+            try:
+                results.append({"text": self.generate(request)})
+            except Exception as e:
+                results.append({"error": str(e)})
+        _write_json(self._results_path(job_name), {"display_name": display_name, "results": results})
+        return job_name
+
+    def get_state(self, job_name: str) -> Tuple[str, Optional[List[dict]]]:
+        try:
+            with open(self._results_path(job_name), "r", encoding="utf-8") as f:
+                return "JOB_STATE_SUCCEEDED", json.load(f)["results"]
+        except FileNotFoundError:
+            return "JOB_STATE_FAILED", None
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class BatchConversionManager:
+    """
+    変換リクエストをバッチにまとめて送信し、完了したジョブの結果を受け取るクラス。
+
+    - リクエストは batch_size 件、または合計 max_bytes に達した時点でバッチとして送信する。
+    - 送信したジョブの状態（ジョブ名・各リクエストのキーとメタデータ）は state_dir に JSON で保存し、
+      中断後の再実行時には未完了のジョブの確認から再開する（同じ論文を再送信しない）。
+    - 結果は on_result(meta, text)、失敗は on_error(meta, message) で呼び出し元に返す。
+    """
+
+    def __init__(
+        self,
+        backend,
+        on_result: Callable[[dict, str], None],
+        on_error: Callable[[dict, str], None],
+        state_dir: str = DEFAULT_BATCH_STATE_DIR,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+        poll_interval: float = DEFAULT_BATCH_POLL_SECONDS,
+    ):
+        self.backend = backend
+        self.on_result = on_result
+        self.on_error = on_error
+        self.state_dir = state_dir
+        self.batch_size = max(1, batch_size)
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        self._buffer: List[Tuple[str, dict, dict, int]] = []  # (key, meta, request, size)
+        self._buffer_bytes = 0
+        self._last_poll_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"submitted_jobs": 0, "submitted_requests": 0, "succeeded": 0, "failed": 0}
+        self._jobs = self._load_pending_jobs()
+
+    def _state_path(self, job_name: str) -> str:
+        safe_name = job_name.replace("/", "_")
+        return os.path.join(self.state_dir, f"{safe_name}.json")
+
+    def _load_pending_jobs(self) -> dict:
+        """前回の実行で送信済み・未完了のジョブを読み込む。"""
+        jobs = {}
+        for filename in sorted(os.listdir(self.state_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, filename), "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"[BatchConversion] ジョブ状態ファイルの読み込みに失敗しました（無視します）: {filename} ({e})")
+                continue
+            if state.get("status") != "submitted":
+                continue
+            if state.get("backend") != self.backend.name:
+                print(f"[BatchConversion] バックエンドが異なるため、ジョブ {state.get('job_name')} ({state.get('backend')}) は確認しません。")
+                continue
+            jobs[state["job_name"]] = state
+        if jobs:
+            print(f"[BatchConversion] 未完了のバッチジョブ {len(jobs)} 件を再開します。")
+        return jobs
+
+    def in_flight_keys(self) -> set:
+        """送信待ち・処理中のリクエストのキー（DOIなど）を返す。"""
+        with self._lock:
+            keys = {key for key, _, _, _ in self._buffer}
+            for state in self._jobs.values():
+                keys.update(item["key"] for item in state["items"])
+            return keys
+
+    def accepts(self, size_bytes: int) -> bool:
+        """1リクエストのサイズ（estimate_request_bytes の値）がバッチに収まるかどうかを返す。"""
+        return size_bytes <= self.max_bytes
+
+    def add(self, key: str, meta: dict, request: dict, size_bytes: int):
+        """
+        リクエストをバッチに追加する。バッチが一杯になったら送信する。
+        size_bytes は送信時のサイズ（estimate_request_bytes の値）を渡す。
+        meta は結果の受け取り時に on_result / on_error に渡される（JSONで保存できる値にすること）。
+        """
+        if not self.accepts(size_bytes):
+            raise ValueError(f"リクエストがバッチの上限サイズを超えています: {size_bytes} > {self.max_bytes} bytes")
+        if self._buffer and (len(self._buffer) >= self.batch_size or self._buffer_bytes + size_bytes > self.max_bytes):
+            self.flush()
+        self._buffer.append((key, meta, request, size_bytes))
+        self._buffer_bytes += size_bytes
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        # 追加の合間にも、一定間隔で処理中のジョブを確認して結果を保存する
+        if self._jobs and time.monotonic() - self._last_poll_at >= self.poll_interval:
+            self.poll()
+
+    def flush(self):
+        """送信待ちのリクエストをバッチジョブとして送信する。"""
+        if not self._buffer:
+            return
+        buffer, self._buffer, self._buffer_bytes = self._buffer, [], 0
+        display_name = f"p1-markdown-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        try:
+            job_name = self.backend.submit([request for _, _, request, _ in buffer], display_name)
+        except Exception as e:
+            print(f"[BatchConversion] バッチジョブの送信に失敗しました: {e}")
+            for _, meta, _, _ in buffer:
+                self.on_error(meta, f"バッチジョブの送信に失敗しました: {e}")
+            return
+
+        state = {
+            "job_name": job_name,
+            "display_name": display_name,
+            "backend": self.backend.name,
+            "status": "submitted",
+            "submitted_at": time.time(),
+            "items": [{"key": key, "meta": meta} for key, meta, _, _ in buffer],
+        }
+        _write_json(self._state_path(job_name), state)
+        with self._lock:
+            self._jobs[job_name] = state
+            self.stats["submitted_jobs"] += 1
+            self.stats["submitted_requests"] += len(buffer)
+        print(f"[BatchConversion] バッチジョブを送信しました: {job_name} ({len(buffer)} 件)")
+
+    def poll(self) -> int:
+        """処理中のジョブの状態を確認し、完了したジョブの結果を受け渡す。まだ処理中のジョブ数を返す。"""
+        self._last_poll_at = time.monotonic()
+        for job_name, state in list(self._jobs.items()):
+            try:
+                job_state, results = self.backend.get_state(job_name)
+            except Exception as e:
+                print(f"[BatchConversion] ジョブ {job_name} の状態確認に失敗しました（次回再確認します）: {e}")
+                continue
+
+            if job_state in SUCCEEDED_STATES:
+                self._dispatch_results(state, results or [])
+                self._finish(job_name, state, "done")
+            elif job_state in FAILED_STATES:
+                print(f"[BatchConversion] ジョブ {job_name} は {job_state} で終了しました。")
+                for item in state["items"]:
+                    self.on_error(item["meta"], f"バッチジョブが {job_state} で終了しました。")
+                self.stats["failed"] += len(state["items"])
+                self._finish(job_name, state, "failed")
+        return len(self._jobs)
+
+    def _dispatch_results(self, state: dict, results: List[dict]):
+        for index, item in enumerate(state["items"]):
+            result = results[index] if index < len(results) else {"error": "バッチの結果に対応する応答がありません。"}
+            if result.get("text"):
+                try:
+                    self.on_result(item["meta"], result["text"])
+                    self.stats["succeeded"] += 1
+                    continue
+                except Exception as e:
+                    result = {"error": f"結果の保存中にエラーが発生しました: {e}"}
+            self.on_error(item["meta"], result.get("error") or "空の応答がありました。")
+            self.stats["failed"] += 1
+
+    def _finish(self, job_name: str, state: dict, status: str):
+        state["status"] = status
+        state["finished_at"] = time.time()
+        _write_json(self._state_path(job_name), state)
+        with self._lock:
+            self._jobs.pop(job_name, None)
+
+    def wait_all(self):
+        """送信待ちのリクエストを送信し、すべてのジョブが終了するまで待つ。"""
+        self.flush()
+        while self.poll() > 0:
+            print(f"[BatchConversion] 処理中のバッチジョブ {len(self._jobs)} 件。{self.poll_interval:.0f}秒後に再確認します...")
+            time.sleep(self.poll_interval)
@@ -0,0 +1,229 @@
+import os
+import asyncio
+import threading
+from typing import Optional, Dict
+
+from google import genai
+
+from utils.jstage_client import JStageClient, AsyncJStageClient
+from utils.rate_limiter import LimiterLanes, get_shared_jstage_lanes
+from utils.search_cache import SearchCache
+from utils.article_resolver import ArticleResolver, PdfRewriteStats
+from utils.gemini_file_cache import GeminiFileCache
+from core.adaptive_concurrency import AdaptiveConcurrencyController
+from core.route_stats import RouteStats
+from core.llm_gateway import LLMGateway
+from core.context_cache import ContextCacheManager
+from core.model_router import ModelRouter
+from utils.llm_response_cache import LLMResponseCache
+
+
+class ClientRegistry:
+    """
+    プロセス全体で共有する長寿命クライアントを管理するクラス。
+    各パイプラインは記事ごとにクライアントを生成せず、このレジストリから受け取る。
+
+    - genai.Client: APIキーごとに1つ生成し、内部のHTTP接続プール（keep-alive）を使い回す。
+    - JStageClient: プロセスで1つだけ生成する。リミッターのレーンもプロセスで1組だけ持つ。
+    - AsyncJStageClient: httpx.AsyncClient はイベントループに紐づくため、ループごとに1つ生成する。
+    - ArticleResolver: 雑誌ごとのPDF書き換え実績を共有するため、プロセスで1つだけ生成する。
+    - AdaptiveConcurrencyController: Gemini API の同時実行数を全パイプラインで共有して制御する。
+    - GeminiFileCache: Files API にアップロードしたファイルのハンドルを共有し、同じPDFの再アップロードを避ける。
+    - RouteStats: Markdown変換の経路（PDF / 抽出テキストなど）ごとの処理時間・トークン数を集計する。
+    - LLMGateway: 全パイプラインの LLM 呼び出しの窓口。APIキー（または llm_backend）ごとに1つ生成する。
+      llm_backend を渡すと、genai.Client の代わりにそのバックエンド（偽のバックエンドなど）を使う。
+    - LLMResponseCache: response_cache を渡すと、全ゲートウェイで LLM の応答のキャッシュを共有する。
+    - ContextCacheManager: Gemini のコンテキストキャッシュ（論文の本文・固定のプロンプト）を APIキーごとに管理する。
+      llm_backend（偽のバックエンドなど）を使う場合はコンテキストキャッシュを使わない。
+    - ModelRouter: 呼び出しごとのモデル・思考予算の選択と昇格、雑誌ごとの失敗の実績を全パイプラインで共有する。
+    """
+
+    def __init__(
+        self,
+        gemini_api_key: Optional[str] = None,
+        lanes: Optional[LimiterLanes] = None,
+        search_cache: Optional[SearchCache] = None,
+        jstage_base_url: Optional[str] = None,
+        llm_backend=None,
+        response_cache: Optional[LLMResponseCache] = None,
+    ):
+        self.gemini_api_key = gemini_api_key
+        self.lanes = lanes or get_shared_jstage_lanes()
+        self.search_cache = search_cache
+        self.jstage_base_url = jstage_base_url
+        self.llm_backend = llm_backend
+        self.response_cache = response_cache
+        self._genai_clients: Dict[str, genai.Client] = {}
+        self._jstage_client: Optional[JStageClient] = None
+        self._async_jstage_clients: Dict[int, AsyncJStageClient] = {}
+        self._article_resolver: Optional[ArticleResolver] = None
+        self._gemini_controller: Optional[AdaptiveConcurrencyController] = None
+        self._gemini_file_cache: Optional[GeminiFileCache] = None
+        self._conversion_route_stats: Optional[RouteStats] = None
+        self._llm_gateways: Dict[str, LLMGateway] = {}
+        self._context_caches: Dict[str, ContextCacheManager] = {}
+        self._model_router: Optional[ModelRouter] = None
+        self._lock = threading.Lock()
+
+    def get_genai_client(self, api_key: Optional[str] = None) -> genai.Client:
+        """APIキーに対応する genai.Client を返す（初回のみ生成）。"""
+        api_key = api_key or self.gemini_api_key or os.getenv("GEMINI_API_KEY")
+        with self._lock:
+            client = self._genai_clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                self._genai_clients[api_key] = client
+            return client
+
+    def get_gemini_controller(self) -> AdaptiveConcurrencyController:
+        """Gemini API 呼び出しの同時実行数を制御するコントローラーを返す（初回のみ生成）。"""
+        with self._lock:
+            if self._gemini_controller is None:
+                self._gemini_controller = AdaptiveConcurrencyController(name="gemini")
+            return self._gemini_controller
+
+    def get_gemini_file_cache(self) -> GeminiFileCache:
+        """Files API にアップロードしたファイルのキャッシュを返す（初回のみ生成）。"""
+        with self._lock:
+            if self._gemini_file_cache is None:
+                self._gemini_file_cache = GeminiFileCache()
+            return self._gemini_file_cache
+
+    def get_conversion_route_stats(self) -> RouteStats:
+        """Markdown変換の経路ごとの集計を返す（初回のみ生成）。"""
+        with self._lock:
+            if self._conversion_route_stats is None:
+                self._conversion_route_stats = RouteStats()
+            return self._conversion_route_stats
+
+    def get_model_router(self) -> ModelRouter:
+        """モデル・思考予算を選ぶルーターを返す（初回のみ生成）。"""
+        with self._lock:
+            if self._model_router is None:
+                self._model_router = ModelRouter()
+            return self._model_router
+
+    def get_llm_gateway(self, api_key: Optional[str] = None) -> LLMGateway:
+        """LLM 呼び出しの窓口を返す（APIキーごとに初回のみ生成。同時実行数の制御は全体で共有する）。"""
+        api_key = api_key or self.gemini_api_key or os.getenv("GEMINI_API_KEY")
+        backend = self.llm_backend or self.get_genai_client(api_key)
+        controller = self.get_gemini_controller()
+        with self._lock:
+            gateway = self._llm_gateways.get(api_key)
+            if gateway is None:
+                context_cache = None
+                if self.llm_backend is None:
+                    context_cache = ContextCacheManager(backend)
+                    self._context_caches[api_key] = context_cache
+                gateway = LLMGateway(
+                    backend, controller, response_cache=self.response_cache, context_cache=context_cache
+                )
+                self._llm_gateways[api_key] = gateway
+            return gateway
+
+    def release_context_caches(self):
+        """作成したコンテキストキャッシュをすべて削除する（論文ごとの処理が終わったときに呼び出す）。"""
+        with self._lock:
+            managers = list(self._context_caches.values())
+        for manager in managers:
+            manager.release_all()
+
+    def get_context_cache_stats(self) -> dict:
+        """全APIキーのコンテキストキャッシュの作成・再利用・失敗などの回数を合算して返す。"""
+        with self._lock:
+            managers = list(self._context_caches.values())
+        stats = {}
+        for manager in managers:
+            for key, value in manager.stats.items():
+                stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def get_llm_stats(self) -> dict:
+        """全ゲートウェイの、用途ごとの呼び出しの集計を返す（APIキーが複数ある場合は回数・トークン数を合算する）。"""
+        with self._lock:
+            gateways = list(self._llm_gateways.values())
+        stats = {}
+        for gateway in gateways:
+            for purpose, purpose_stats in gateway.get_stats().items():
+                merged = stats.get(purpose)
+                if merged is None:
+                    stats[purpose] = dict(purpose_stats)
+                    continue
+                for key in ("calls", "failed", "retries", "throttle_retries", "prompt_tokens", "output_tokens", "cached_tokens", "total_seconds"):
+                    merged[key] += purpose_stats[key]
+                merged["p95_latency"] = max(merged["p95_latency"], purpose_stats["p95_latency"])
+                merged["avg_latency"] = merged["total_seconds"] / merged["calls"] if merged["calls"] else 0.0
+        return stats
+
+    def _jstage_kwargs(self) -> dict:
+        kwargs = {"lanes": self.lanes, "search_cache": self.search_cache}
+        if self.jstage_base_url:
+            kwargs["base_url"] = self.jstage_base_url
+        return kwargs
+
+    def get_jstage_client(self) -> JStageClient:
+        """プロセスで共有する JStageClient を返す（初回のみ生成）。"""
+        with self._lock:
+            if self._jstage_client is None:
+                self._jstage_client = JStageClient(**self._jstage_kwargs())
+            return self._jstage_client
+
+    def get_article_resolver(self) -> ArticleResolver:
+        """共有の JStageClient を使う ArticleResolver を返す（初回のみ生成）。"""
+        jstage_client = self.get_jstage_client()
+        with self._lock:
+            if self._article_resolver is None:
+                self._article_resolver = ArticleResolver(jstage_client, PdfRewriteStats())
+            return self._article_resolver
+
+    def get_async_jstage_client(self) -> AsyncJStageClient:
+        """実行中のイベントループで共有する AsyncJStageClient を返す（ループごとに1つ生成）。"""
+        loop_id = id(asyncio.get_running_loop())
+        with self._lock:
+            client = self._async_jstage_clients.get(loop_id)
+            if client is None:
+                client = AsyncJStageClient(**self._jstage_kwargs())
+                self._async_jstage_clients[loop_id] = client
+            return client
+
+    def flush(self):
+        """実行をまたいで引き継ぐ実績（モデルの振り分け・PDF URL の書き換え）の未保存分を書き込む。"""
+        with self._lock:
+            model_router = self._model_router
+            article_resolver = self._article_resolver
+        if model_router is not None:
+            model_router.flush()
+        if article_resolver is not None:
+            article_resolver.stats.flush()
+
+    def close(self):
+        """実績の未保存分を書き込み、同期クライアントの接続プールを閉じる。"""
+        self.flush()
+        with self._lock:
+            if self._jstage_client is not None:
+                self._jstage_client.client.close()
+                self._jstage_client = None
+            self._genai_clients.clear()
+
+
+_default_registry: Optional[ClientRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry() -> ClientRegistry:
+    """
+    プロセス既定のレジストリを返す。
+    パイプライン関数にレジストリが注入されなかった場合に使用する。
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry()
+        return _default_registry
+
+
+def set_default_registry(registry: ClientRegistry):
+    """プロセス既定のレジストリを差し替える（実行スクリプトの起動時に使用する）。"""
+    global _default_registry
+    with _default_registry_lock:
+        _default_registry = registry
@@ -0,0 +1,147 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+
+from google.genai import types
+from google.genai import errors as genai_errors
+
+load_dotenv()
+
+# 0 を指定すると、明示的なコンテキストキャッシュ（client.caches）を使わない
+DEFAULT_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "1") != "0"
+# キャッシュの有効期間（秒）。論文ごとのキャッシュは処理が終われば削除するため、短めにする
+DEFAULT_CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 900))
+# 明示的キャッシュには最小トークン数（Gemini 2.5 Flash 系は 1024）があるため、これより短い内容はキャッシュしない
+# (日本語はおよそ1文字1トークンのため、文字数で判定する)
+DEFAULT_CONTEXT_CACHE_MIN_CHARS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_CHARS", 2048))
+# あるモデルでキャッシュの作成に続けてこの回数失敗したら、この実行ではそのモデルでキャッシュを使わない
+# (利用枠の都合で使えない場合や、モデルごとに異なる最小トークン数に満たない場合など)
+MAX_CONSECUTIVE_FAILURES = 3
+# 期限切れ直前のキャッシュは使わない（呼び出し中に失効するのを避ける）
+EXPIRY_MARGIN_SECONDS = 60
+
+
+def is_cached_content_error(error: BaseException) -> bool:
+    """キャッシュが失効・削除されていたことによるエラーかどうかを判定する。"""
+    if not isinstance(error, genai_errors.ClientError) or error.code not in (400, 403, 404):
+        return False
+    return "cache" in str(error).lower()
+
+
+class ContextCacheManager:
+    """
+    繰り返し送る入力の先頭部分（論文の本文・固定のプロンプト）を Gemini のコンテキストキャッシュ（client.caches）に
+    一度だけ登録し、以降の呼び出しではキャッシュを参照させるクラス。LLMGateway の cache_prefix から使う。
+
+    - キャッシュは (モデル, 内容) ごとに1つ作成し、有効期限（TTL）が近いものは作り直す。
+    - 内容が短い・作成に失敗した・無効にした場合は None を返し、呼び出し側は内容をそのまま送る（フォールバック）。
+    - release で不要になったキャッシュを削除する（削除しなくても TTL で失効する）。
+    - 呼び出しごとのキャッシュからの入力トークン数（cached_content_token_count）は LLMGateway が集計する。
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl_seconds: Optional[float] = None,
+        min_chars: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else DEFAULT_CONTEXT_CACHE_TTL_SECONDS
+        self.min_chars = min_chars if min_chars is not None else DEFAULT_CONTEXT_CACHE_MIN_CHARS
+        self.enabled = enabled if enabled is not None else DEFAULT_CONTEXT_CACHE_ENABLED
+        self._lock = threading.Lock()
+        self._create_locks: dict = {}
+        # key -> {"name", "model", "expires_at"}
+        self._entries: dict = {}
+        # モデル -> 連続した作成の失敗回数
+        self._consecutive_failures: dict = {}
+        self._disabled_models: set = set()
+        self.stats = {"created": 0, "reused": 0, "skipped": 0, "failed": 0, "invalidated": 0, "released": 0}
+
+    @staticmethod
+    def _key(model: str, prefix: str) -> str:
+        return hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _create_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._create_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._create_locks[key] = lock
+            return lock
+
+    def acquire(self, model: str, prefix: str, ttl_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        prefix を登録したキャッシュの名前を返す（未登録・期限切れ間近であれば作成する）。
+        キャッシュを使えない場合は None を返す。
+        """
+        if not self.enabled or model in self._disabled_models or len(prefix) < self.min_chars:
+            self._count("skipped")
+            return None
+
+        key = self._key(model, prefix)
+        # 同じ内容のキャッシュを並行して二重に作らないよう、内容ごとに作成を直列化する
+        with self._create_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry["expires_at"] - time.time() > EXPIRY_MARGIN_SECONDS:
+                    self.stats["reused"] += 1
+                    return entry["name"]
+                if not self.enabled or model in self._disabled_models:
+                    self.stats["skipped"] += 1
+                    return None
+            return self._create(key, model, prefix, ttl_seconds or self.ttl_seconds)
+
+    def _create(self, key: str, model: str, prefix: str, ttl_seconds: float) -> Optional[str]:
+        try:
+            cache = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[prefix], ttl=f"{int(ttl_seconds)}s", display_name=f"kcr-{key[:16]}"
+                ),
+            )
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+                failures = self._consecutive_failures.get(model, 0) + 1
+                self._consecutive_failures[model] = failures
+                if failures >= MAX_CONSECUTIVE_FAILURES and model not in self._disabled_models:
+                    self._disabled_models.add(model)
+                    print(f"[ContextCacheManager] {model} でキャッシュの作成に {MAX_CONSECUTIVE_FAILURES} 回続けて失敗したため、以降はこのモデルでキャッシュを使いません。")
+            print(f"[ContextCacheManager] キャッシュを作成できませんでした。内容をそのまま送信します: {e}")
+            return None
+
+        expire_time = getattr(cache, "expire_time", None)
+        expires_at = expire_time.timestamp() if expire_time else time.time() + ttl_seconds
+        with self._lock:
+            self._entries[key] = {"name": cache.name, "model": model, "expires_at": expires_at}
+            self.stats["created"] += 1
+            self._consecutive_failures[model] = 0
+        print(f"[ContextCacheManager] キャッシュを作成しました: {cache.name} (約{len(prefix)}文字, TTL {int(ttl_seconds)}秒)")
+        return cache.name
+
+    def invalidate(self, model: str, prefix: str):
+        """サーバー側で失効・削除されていたキャッシュの記録を消す（次の acquire で作り直す）。"""
+        with self._lock:
+            if self._entries.pop(self._key(model, prefix), None) is not None:
+                self.stats["invalidated"] += 1
+
+    def release_all(self):
+        """作成したキャッシュをすべて削除する（論文の処理が終わったときなど）。削除に失敗しても TTL で失効する。"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            try:
+                self.client.caches.delete(name=entry["name"])
+                self._count("released")
+            except Exception as e:
+                print(f"[ContextCacheManager] キャッシュ {entry['name']} を削除できませんでした（TTLで失効します）: {e}")
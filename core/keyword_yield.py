@@ -0,0 +1,115 @@
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from core.p1_state_store import P1StateStore
+
+load_dotenv()
+
+# 新規論文の割合がこれを下回ったページで、そのキーワードのページ送りを終了する
+DEFAULT_MIN_PAGE_NOVELTY = float(os.getenv("P1_MIN_PAGE_NOVELTY", 0.1))
+# キーワード全体の新規論文の割合がこれを下回ったら、飽和したキーワードとして検索しない
+DEFAULT_SATURATION_NOVELTY = float(os.getenv("P1_SATURATION_NOVELTY", 0.05))
+# 飽和の判定に必要な、検索済みの論文数（少ない実績で判定しないため）
+DEFAULT_SATURATION_MIN_ARTICLES = int(os.getenv("P1_SATURATION_MIN_ARTICLES", 20))
+
+
+class KeywordYieldTracker:
+    """
+    キーワードの検索ページごとに、新規の DOI と既知の DOI（状態ストアに記録済み、またはこの実行で既に見つけたもの）を数え、
+    状態ストアに記録するクラス。scheduling=True の場合は、その実績を使って検索を絞り込む。
+
+    - 新規論文の割合が min_page_novelty を下回ったページで、そのキーワードのページ送りを終了する。
+    - 過去の実績で新規論文の割合が saturation_novelty を下回る（またはヒット0件の）キーワードは検索しない。
+    """
+
+    def __init__(
+        self,
+        state_store: P1StateStore,
+        scheduling: bool = False,
+        min_page_novelty: float = DEFAULT_MIN_PAGE_NOVELTY,
+        saturation_novelty: float = DEFAULT_SATURATION_NOVELTY,
+        saturation_min_articles: int = DEFAULT_SATURATION_MIN_ARTICLES,
+    ):
+        self.state_store = state_store
+        self.scheduling = scheduling
+        self.min_page_novelty = min_page_novelty
+        self.saturation_novelty = saturation_novelty
+        self.saturation_min_articles = saturation_min_articles
+        # この実行で既に見つけた DOI（状態ストアに未登録のフロンティアの論文などを含む）
+        self._seen: set = set()
+        self._lock = threading.Lock()
+        self.stats = {"pages": 0, "new_dois": 0, "duplicate_dois": 0, "stopped_queries": 0}
+
+    def add_known_dois(self, dois: Iterable[str]):
+        """状態ストアに未登録でも既知として扱う DOI（前回収集したフロンティアの論文など）を追加する。"""
+        with self._lock:
+            self._seen.update(dois)
+
+    def _is_known(self, doi: str) -> bool:
+        """DOI が既知かどうかを返し、この実行で見つけたものとして記録する（ロック内で呼び出すこと）。"""
+        if doi in self._seen:
+            return True
+        self._seen.add(doi)
+        return self.state_store.get_status(doi) is not None
+
+    def record_page(self, page: dict) -> dict:
+        """検索ページの新規/既知の DOI を数えて状態ストアに記録し、{"new", "duplicate", "novelty"} を返す。"""
+        with self._lock:
+            new_dois = duplicate_dois = 0
+            for article in page["articles"]:
+                doi = article.get("doi")
+                if not doi:
+                    continue
+                if self._is_known(doi):
+                    duplicate_dois += 1
+                else:
+                    new_dois += 1
+            self.stats["pages"] += 1
+            self.stats["new_dois"] += new_dois
+            self.stats["duplicate_dois"] += duplicate_dois
+
+        self.state_store.record_page_yield(
+            page["query"], page["start_index"], page["total_hits"], len(page["articles"]), new_dois, duplicate_dois
+        )
+        counted = new_dois + duplicate_dois
+        return {"new": new_dois, "duplicate": duplicate_dois, "novelty": new_dois / counted if counted else 0.0}
+
+    def on_page(self, page: dict) -> bool:
+        """
+        iter_search_pages / SearchPrefetcher の on_page に渡すコールバック。
+        ページの実績を記録し、このキーワードのページ送りを続けるかどうかを返す。
+        """
+        page_yield = self.record_page(page)
+        if not self.scheduling or not page["articles"]:
+            return True
+        if page_yield["novelty"] < self.min_page_novelty:
+            with self._lock:
+                self.stats["stopped_queries"] += 1
+            return False
+        return True
+
+    def is_saturated(self, keyword_yield: Optional[dict]) -> bool:
+        """キーワードの実績（P1StateStore.get_keyword_yields の要素）から、飽和したかどうかを返す。"""
+        if keyword_yield is None:
+            return False
+        if keyword_yield["pages"] > 0 and keyword_yield["total_hits"] == 0:
+            return True
+        return (
+            keyword_yield["articles"] >= self.saturation_min_articles
+            and keyword_yield["novelty_ratio"] < self.saturation_novelty
+        )
+
+    def filter_queries(self, queries: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        scheduling=True の場合、飽和したキーワードを除いたクエリリストと、除外したクエリリストを返す。
+        scheduling=False の場合はそのまま返す。
+        """
+        if not self.scheduling:
+            return list(queries), []
+        yields = self.state_store.get_keyword_yields()
+        to_run, skipped = [], []
+        for query in queries:
+            (skipped if self.is_saturated(yields.get(query)) else to_run).append(query)
+        return to_run, skipped
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Optional, Type
+from dotenv import load_dotenv
+
+import httpx
+from pydantic import BaseModel
+from google.genai import types
+from google.genai import errors as genai_errors
+
+from core.adaptive_concurrency import AdaptiveConcurrencyController, is_throttling_error
+from core.route_stats import RouteStats
+from core.context_cache import ContextCacheManager, is_cached_content_error
+from utils.llm_response_cache import LLMResponseCache, LLMCacheMissError
+
+load_dotenv()
+
+# 1回の呼び出しのタイムアウト（秒）。P1のMarkdown変換は思考を含めて数分かかるため長めにする
+DEFAULT_LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 600))
+# 一時的なエラー（5xx・タイムアウト・通信エラー・構造化出力のパース失敗）の試行回数
+# (429/503 の再試行は AdaptiveConcurrencyController が行う)
+DEFAULT_LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+LLM_BASE_BACKOFF = 2.0
+LLM_MAX_BACKOFF = 30.0
+
+# 応答テキストを囲むコードブロック（```json ... ```）
+_CODE_FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+
+
+class StructuredOutputError(ValueError):
+    """構造化出力（JSON）の応答をスキーマどおりに解析できなかったことを示す例外。"""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    一時的なエラー（再試行すれば成功する可能性があるもの）かを判定する。
+    429/503 はコントローラーが再試行済みのため、ここでは再試行しない。
+    """
+    if is_throttling_error(error):
+        return False
+    if isinstance(error, StructuredOutputError):
+        return True
+    if isinstance(error, genai_errors.ServerError):
+        return True
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def strip_code_fence(text: str) -> str:
+    """応答テキストを囲むコードブロック（```json ... ```）を取り除く。"""
+    text = text.strip()
+    match = _CODE_FENCE_PATTERN.match(text)
+    return match.group(1).strip() if match else text
+
+
+def join_cache_prefix(cache_prefix: Optional[str], contents) -> Any:
+    """cache_prefix（キャッシュ対象の先頭部分）と contents を、1回の呼び出しで送る contents にまとめる。"""
+    if cache_prefix is None:
+        return contents
+    return [cache_prefix] + (list(contents) if isinstance(contents, list) else [contents])
+
+
+def parse_structured_response(response, schema: Type[BaseModel]) -> BaseModel:
+    """
+    構造化出力の応答を schema のインスタンスにする。
+    SDKが解析済み（response.parsed）であればそれを使い、なければ応答テキストのコードブロックを取り除いて解析する。
+    解析できない場合は、終了理由・応答テキストを含む StructuredOutputError を送出する。
+    """
+    parsed = getattr(response, "parsed", None)
+    if isinstance(parsed, schema):
+        return parsed
+    if isinstance(parsed, dict):
+        return schema(**parsed)
+
+    text = getattr(response, "text", None)
+    candidates = getattr(response, "candidates", None)
+    finish_reason = candidates[0].finish_reason.name if candidates and candidates[0].finish_reason else "N/A"
+    if not text:
+        raise StructuredOutputError(json.dumps({
+            "message": "APIからパース可能な応答がありませんでした (応答テキストも空)。",
+            "finish_reason": finish_reason,
+            "prompt_feedback": str(getattr(response, "prompt_feedback", None)),
+        }, ensure_ascii=False))
+    try:
+        return schema(**json.loads(strip_code_fence(text)))
+    except Exception as parse_e:
+        raise StructuredOutputError(json.dumps({
+            "message": "APIからのパース可能な応答がありませんでした (手動パースも失敗)。",
+            "finish_reason": finish_reason,
+            "response_text": text,
+            "manual_parse_error": str(parse_e),
+        }, ensure_ascii=False)) from parse_e
+
+
+class LLMGateway:
+    """
+    全パイプラインの LLM（Gemini）呼び出しの窓口。
+    クライアント、タイムアウト、再試行（ジッター付きバックオフ）、同時実行数の制御、
+    構造化出力の解析、呼び出しの用途（purpose）ごとの集計をまとめて扱う。
+
+    - 同時実行数の制御と 429/503 の再試行は、共有の AdaptiveConcurrencyController が行う。
+    - 5xx・タイムアウト・通信エラー・構造化出力のパース失敗は、ここで最大 max_attempts 回まで試行する。
+    - backend は models.generate_content(model=, contents=, config=) を持つオブジェクト（genai.Client など）。
+      偽のバックエンドに差し替えると、APIを使わずにパイプライン全体を計測できる。
+    - 同期の generate と、イベントループから使う agenerate（スレッドで実行）を提供する。
+    - response_cache を渡すと、同じリクエストにはキャッシュした応答を返す（リプレイモードではキャッシュのみを使う）。
+    - context_cache を渡すと、cache_prefix（論文の本文・固定のプロンプトなど、繰り返し送る先頭部分）を
+      Gemini のコンテキストキャッシュに登録して参照する。使えない場合は cache_prefix をそのまま送る。
+    """
+
+    def __init__(
+        self,
+        backend,
+        controller: AdaptiveConcurrencyController,
+        timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        sleep=time.sleep,
+        response_cache: Optional[LLMResponseCache] = None,
+        context_cache: Optional[ContextCacheManager] = None,
+    ):
+        self.backend = backend
+        self.controller = controller
+        self.timeout = timeout if timeout is not None else DEFAULT_LLM_TIMEOUT_SECONDS
+        self.max_attempts = max(1, max_attempts if max_attempts is not None else DEFAULT_LLM_MAX_ATTEMPTS)
+        self._sleep = sleep
+        self.response_cache = response_cache
+        self.context_cache = context_cache
+        self.call_stats = RouteStats()
+        self._retries: dict = {}
+        self._throttle_retries: dict = {}  # 用途 -> コントローラーが 429/503 のために再試行した回数
+        self._lock = threading.Lock()
+
+    def _build_config(self, config) -> Any:
+        """設定（辞書または GenerateContentConfig）にタイムアウトを設定して返す。"""
+        if config is None:
+            config = types.GenerateContentConfig()
+        elif isinstance(config, dict):
+            config = types.GenerateContentConfig(**config)
+        if self.timeout and config.http_options is None:
+            config = config.model_copy(update={"http_options": types.HttpOptions(timeout=int(self.timeout * 1000))})
+        return config
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        return min(LLM_MAX_BACKOFF, LLM_BASE_BACKOFF * (2 ** (attempt - 1))) * random.uniform(0.5, 1.0)
+
+    def generate(
+        self,
+        model: str,
+        contents,
+        config=None,
+        schema: Optional[Type[BaseModel]] = None,
+        purpose: str = "default",
+        cache_prefix: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+    ) -> dict:
+        """
+        generate_content を呼び出し、{"text", "parsed", "response", "usage_metadata", "latency", "attempts", "cached"} を返す。
+        schema を渡した場合は構造化出力（JSON）を要求し、parsed に schema のインスタンスを入れる。
+        config で response_schema を指定済みの場合は、schema にも同じクラスを渡すと解析まで行う。
+        キャッシュから応答した場合は attempts=0, cached=True になる。
+        cache_prefix を渡した場合、送る内容は cache_prefix + contents で、cache_prefix はコンテキストキャッシュから参照する。
+        """
+        config = self._build_config(config)
+        if schema is not None and config.response_schema is None:
+            config = config.model_copy(update={"response_mime_type": "application/json", "response_schema": schema})
+
+        full_contents = join_cache_prefix(cache_prefix, contents)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key(model, full_contents, config, schema)
+            cached = self._generate_from_cache(cache_key, schema)
+            if cached is not None:
+                return cached
+            if self.response_cache.replay:
+                raise LLMCacheMissError(f"リプレイモードのため、キャッシュにない '{purpose}' の呼び出しは行いません (model={model})。")
+
+        cached_content = None
+        if cache_prefix is not None and self.context_cache is not None:
+            cached_content = self.context_cache.acquire(model, cache_prefix, cache_ttl)
+
+        for attempt in range(1, self.max_attempts + 1):
+            if cached_content:
+                request_contents = contents
+                request_config = config.model_copy(update={"cached_content": cached_content})
+            else:
+                request_contents, request_config = full_contents, config
+            started_at = time.monotonic()
+            try:
+                try:
+                    response = self.controller.call(
+                        self.backend.models.generate_content, model=model, contents=request_contents, config=request_config
+                    )
+                finally:
+                    self._record_throttle_retries(purpose)
+                parsed = parse_structured_response(response, schema) if schema is not None else None
+            except Exception as e:
+                elapsed = time.monotonic() - started_at
+                self.call_stats.record(purpose, elapsed, success=False)
+                if cached_content and is_cached_content_error(e) and attempt < self.max_attempts:
+                    # キャッシュがサーバー側で失効・削除されていた場合は、内容をそのまま送って再実行する
+                    print(f"[LLMGateway] '{purpose}': コンテキストキャッシュ {cached_content} を利用できないため、内容をそのまま送信します。")
+                    self.context_cache.invalidate(model, cache_prefix)
+                    cached_content = None
+                    continue
+                if not is_retryable_error(e) or attempt >= self.max_attempts:
+                    raise
+                wait_time = self._backoff_seconds(attempt)
+                print(
+                    f"[LLMGateway] '{purpose}': 一時的なエラー ({e.__class__.__name__})。"
+                    f"{wait_time:.1f}秒後に再試行します... ({attempt}/{self.max_attempts})"
+                )
+                with self._lock:
+                    self._retries[purpose] = self._retries.get(purpose, 0) + 1
+                self._sleep(wait_time)
+                continue
+
+            elapsed = time.monotonic() - started_at
+            usage = getattr(response, "usage_metadata", None)
+            self.call_stats.record(purpose, elapsed, usage_metadata=usage)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response, model=model, purpose=purpose)
+            return {
+                "text": getattr(response, "text", None),
+                "parsed": parsed,
+                "response": response,
+                "usage_metadata": usage,
+                "latency": elapsed,
+                "attempts": attempt,
+                "cached": False,
+            }
+
+    def _record_throttle_retries(self, purpose: str):
+        """直前の controller.call で行われた 429/503 の再試行を、用途ごとに記録する。"""
+        retries = self.controller.last_call_retries()
+        if retries:
+            with self._lock:
+                self._throttle_retries[purpose] = self._throttle_retries.get(purpose, 0) + retries
+
+    def _generate_from_cache(self, cache_key: str, schema: Optional[Type[BaseModel]]) -> Optional[dict]:
+        """キャッシュした応答があれば generate と同じ形式で返す（解析できない古いエントリはミスとして扱う）。"""
+        response = self.response_cache.get(cache_key)
+        if response is None:
+            return None
+        try:
+            parsed = parse_structured_response(response, schema) if schema is not None else None
+        except StructuredOutputError as e:
+            print(f"[LLMGateway] キャッシュした応答を解析できないため、使用しません: {e}")
+            return None
+        return {
+            "text": response.text,
+            "parsed": parsed,
+            "response": response,
+            "usage_metadata": response.usage_metadata,
+            "latency": 0.0,
+            "attempts": 0,
+            "cached": True,
+        }
+
+    async def agenerate(
+        self,
+        model: str,
+        contents,
+        config=None,
+        schema: Optional[Type[BaseModel]] = None,
+        purpose: str = "default",
+        cache_prefix: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+    ) -> dict:
+        """generate の非同期版。同時実行数の制御はスレッド間で共有するため、呼び出しはスレッドで実行する。"""
+        return await asyncio.to_thread(self.generate, model, contents, config, schema, purpose, cache_prefix, cache_ttl)
+
+    def get_stats(self) -> dict:
+        """
+        用途ごとの呼び出し回数・失敗・再試行・レイテンシ・トークン数を返す。
+        retries は再試行の合計（一時的なエラーでの再試行 + コントローラーでの 429/503 の再試行）、
+        throttle_retries はそのうち 429/503 による再試行の回数。
+        """
+        stats = self.call_stats.get_stats()
+        with self._lock:
+            for purpose, purpose_stats in stats.items():
+                throttle_retries = self._throttle_retries.get(purpose, 0)
+                purpose_stats["throttle_retries"] = throttle_retries
+                purpose_stats["retries"] = self._retries.get(purpose, 0) + throttle_retries
+        return stats
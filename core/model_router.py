@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import threading
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+from google.genai import types
+
+from core.route_stats import RouteStats
+from core.llm_gateway import StructuredOutputError
+
+load_dotenv()
+
+# 0 を指定すると、入力の特徴による振り分けと昇格を行わず、呼び出し箇所ごとの従来の設定を使う
+DEFAULT_MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER", "1") != "0"
+# 昇格の上限とするプロファイル（コストの上限。"flash" にすると Pro を使わない）
+DEFAULT_MODEL_ROUTER_MAX_PROFILE = os.getenv("MODEL_ROUTER_MAX_PROFILE", "pro")
+DEFAULT_MODEL_ROUTER_STATS_PATH = os.path.join("output", "cache", "model_router_journals.json")
+DEFAULT_MODEL_ROUTING_LOG_PATH = os.path.join("output", "model_routing_log.jsonl")
+# 雑誌ごとの実績をまとめて保存する件数・間隔（秒）
+DEFAULT_JOURNAL_FLUSH_EVERY = 50
+DEFAULT_JOURNAL_FLUSH_INTERVAL = 30.0
+
+# モデルと思考予算の組み合わせ（プロファイル）。PROFILE_ORDER の順に性能とコストが上がる
+MODEL_PROFILES = {
+    "lite": {"model": "gemini-2.5-flash-lite", "thinking_budget": None},
+    "flash_light": {"model": "gemini-2.5-flash", "thinking_budget": 4096},
+    # P1の従来の設定（MARKDOWN_MODEL_NAME / MARKDOWN_THINKING_BUDGET）
+    "flash": {"model": "gemini-2.5-flash", "thinking_budget": 24576},
+    "pro": {"model": "gemini-2.5-pro", "thinking_budget": 32768},
+}
+PROFILE_ORDER = ["lite", "flash_light", "flash", "pro"]
+
+# 推定コストの計算に使う料金（USD / 100万トークン）。思考トークンは出力として、キャッシュからの入力は割引料金で計算する
+MODEL_PRICING = {
+    "gemini-2.5-flash-lite": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "cached_input": 0.31, "output": 10.00},
+}
+
+# P1: 抽出したテキストを送る経路で、この文字数（日本語はおよそ1文字1トークン）以下の論文は軽いプロファイルで変換する
+LITE_MAX_CHARS = int(os.getenv("MODEL_ROUTER_LITE_MAX_CHARS", 20000))
+FLASH_LIGHT_MAX_CHARS = int(os.getenv("MODEL_ROUTER_FLASH_LIGHT_MAX_CHARS", 60000))
+# P1: 抽出したテキストの文字化けの割合がこれを超える論文は、軽いプロファイルを使わない
+LITE_MAX_GARBLED_RATIO = 0.002
+# P1: PDFをそのまま送る経路（スキャン・文字化けしたPDF）で、このページ数以上の論文は最初から Pro で変換する
+HARD_PDF_PAGES = int(os.getenv("MODEL_ROUTER_HARD_PDF_PAGES", 12))
+# 雑誌ごとの実績: この件数以上の実績があり、昇格・失敗の割合がこれ以上の雑誌は1段上のプロファイルから始める
+JOURNAL_MIN_SAMPLES = 3
+JOURNAL_FAILURE_RATE = 0.3
+
+# P1の出力の検証: 入力の文字数に対する出力の文字数がこの割合未満の場合は、要約・途中で打ち切られた出力とみなす
+MARKDOWN_MIN_OUTPUT_RATIO = 0.1
+# 出力の長さの割合を確認する入力の最小の文字数（短い論文は割合がばらつくため確認しない）
+MARKDOWN_RATIO_MIN_INPUT_CHARS = 4000
+
+
+class OutputValidationError(ValueError):
+    """LLM の出力が検証に通らなかった（上位のプロファイルで再実行すべき）ことを示す例外。"""
+
+
+def apply_route_config(decision: dict, config=None) -> types.GenerateContentConfig:
+    """生成設定（辞書または GenerateContentConfig）に、振り分け結果の思考予算を設定して返す。"""
+    if config is None:
+        config = types.GenerateContentConfig()
+    elif isinstance(config, dict):
+        config = types.GenerateContentConfig(**config)
+    thinking_budget = decision["thinking_budget"]
+    thinking_config = types.ThinkingConfig(thinking_budget=thinking_budget) if thinking_budget is not None else None
+    return config.model_copy(update={"thinking_config": thinking_config})
+
+
+def validate_markdown_output(result: dict, input_chars: int = 0, require_heading: bool = True):
+    """
+    P1のMarkdown変換の出力を検証する（LLMGateway.generate の結果を受け取る）。
+    空の応答・出力トークン上限での打ち切り・見出しのない出力（require_heading=True の場合）・
+    入力に比べて極端に短い出力は OutputValidationError にする。
+    """
+    text = result.get("text") or ""
+    if not text.strip():
+        raise OutputValidationError("空の応答です。")
+    candidates = getattr(result.get("response"), "candidates", None) or []
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    if finish_reason is not None and "MAX_TOKENS" in str(finish_reason):
+        raise OutputValidationError("出力トークンの上限で応答が打ち切られました。")
+    if require_heading and not any(line.startswith("## ") or line.startswith("### ") for line in text.splitlines()):
+        raise OutputValidationError("Markdownの見出し（## / ###）がありません。")
+    if input_chars >= MARKDOWN_RATIO_MIN_INPUT_CHARS and len(text) < input_chars * MARKDOWN_MIN_OUTPUT_RATIO:
+        raise OutputValidationError(
+            f"入力 {input_chars} 文字に対して出力が {len(text)} 文字と短すぎます（要約・打ち切りの可能性）。"
+        )
+
+
+def validate_text_output(result: dict, min_chars: int = 1):
+    """テキスト生成の出力が min_chars 文字以上あるかを検証する。"""
+    text = (result.get("text") or "").strip()
+    if len(text) < min_chars:
+        raise OutputValidationError(f"出力が短すぎます（{len(text)} 文字 < {min_chars} 文字）。")
+
+
+def estimate_cost(model: str, usage_metadata) -> float:
+    """usage_metadata から、1回の呼び出しの推定コスト（USD）を計算する（料金が不明なモデルは 0）。"""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None or usage_metadata is None:
+        return 0.0
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+    output_tokens = (getattr(usage_metadata, "candidates_token_count", None) or 0) + (
+        getattr(usage_metadata, "thoughts_token_count", None) or 0
+    )
+    return (
+        (prompt_tokens - cached_tokens) * pricing["input"]
+        + cached_tokens * pricing["cached_input"]
+        + output_tokens * pricing["output"]
+    ) / 1_000_000
+
+
+class ModelRouter:
+    """
+    LLM 呼び出しごとに、入力の特徴からモデルと思考予算（プロファイル）を選び、
+    出力の検証に失敗した場合だけ上位のプロファイルで再実行する（昇格）クラス。
+
+    - P1のMarkdown変換: 経路（HTML / 抽出テキスト / PDF）、文字数、ページ数、テキスト層の品質、
+      雑誌ごとの過去の失敗の実績から選ぶ。短く品質のよいテキストは軽いプロファイル、長いスキャンPDFは Pro を使う。
+    - ペルソナ・P2・P3: 従来どおり lite から始め、構造化出力の解析・出力の検証に失敗した場合に昇格する。
+    - 振り分けの結果は routing_log に1行ずつ記録し、(用途/プロファイル) ごとのレイテンシ・トークン数・推定コストを集計する。
+    - 雑誌ごとの実績は JSONファイルに保存し、実行をまたいで引き継ぐ。
+    - routing_log の行・雑誌ごとの実績はメモリに溜め、flush_every 件ごと、または flush_interval 秒ごとに
+      ロックの外でまとめて書き込む。実行の終わりにも flush で書き込む。
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_MODEL_ROUTER_STATS_PATH,
+        routing_log_path: Optional[str] = DEFAULT_MODEL_ROUTING_LOG_PATH,
+        enabled: Optional[bool] = None,
+        max_profile: Optional[str] = None,
+        flush_every: int = DEFAULT_JOURNAL_FLUSH_EVERY,
+        flush_interval: float = DEFAULT_JOURNAL_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.routing_log_path = routing_log_path
+        self.enabled = enabled if enabled is not None else DEFAULT_MODEL_ROUTER_ENABLED
+        max_profile = max_profile or DEFAULT_MODEL_ROUTER_MAX_PROFILE
+        if max_profile not in MODEL_PROFILES:
+            print(f"[ModelRouter] 不明なプロファイル '{max_profile}' のため、上限を 'pro' にします。")
+            max_profile = "pro"
+        self.max_profile = max_profile
+        self.call_stats = RouteStats()
+        self._lock = threading.Lock()
+        self._journals = self._load()
+        self._pending_journal_writes = 0
+        self._pending_log_lines: list = []
+        self._last_flush_at = time.monotonic()
+        # ファイルの書き込みはルーターのロックの外で、書き込み同士だけを排他する
+        self._save_lock = threading.Lock()
+        self._costs: dict = {}
+        self.decisions: dict = {}
+        self.escalations: dict = {}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[ModelRouter] 実績ファイルの読み込みに失敗しました（空の状態で開始します）: {self.path} ({e})")
+            return {}
+
+    def _save(self, journals: dict):
+        """雑誌ごとの実績を保存する（_save_lock 内で呼び出すこと）。"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(journals, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[ModelRouter] 実績ファイルの書き込みに失敗しました: {self.path} ({e})")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _write_log(self, lines: list):
+        """溜めた routing_log の行をまとめて追記する（_save_lock 内で呼び出すこと）。"""
+        try:
+            os.makedirs(os.path.dirname(self.routing_log_path) or ".", exist_ok=True)
+            with open(self.routing_log_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError as e:
+            print(f"[ModelRouter] 振り分けの記録に失敗しました: {self.routing_log_path} ({e})")
+
+    def _flush_due(self) -> bool:
+        """未保存の書き込みが件数・間隔の条件を満たしたか（ロック内で呼び出すこと）。"""
+        pending = self._pending_journal_writes + len(self._pending_log_lines)
+        return bool(pending) and (
+            pending >= self.flush_every or time.monotonic() - self._last_flush_at >= self.flush_interval
+        )
+
+    def _log(self, entry: dict) -> bool:
+        """
+        振り分け・昇格の結果を routing_log の1行としてメモリに溜める（ロック内で呼び出すこと）。
+        書き込むべき時期になった場合は True を返す（呼び出し側がロックの外で flush する）。
+        """
+        if not self.routing_log_path:
+            return False
+        self._pending_log_lines.append(json.dumps({"time": time.time(), **entry}, ensure_ascii=False) + "\n")
+        return self._flush_due()
+
+    def _decision(self, purpose: str, profile: str, reason: str, journal: Optional[str] = None) -> dict:
+        # 上限を超えるプロファイルは上限に抑える
+        if PROFILE_ORDER.index(profile) > PROFILE_ORDER.index(self.max_profile):
+            profile = self.max_profile
+        decision = {"purpose": purpose, "profile": profile, **MODEL_PROFILES[profile], "reason": reason, "journal": journal}
+        key = f"{purpose}/{profile}"
+        with self._lock:
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+            due = self._log({"event": "route", **decision})
+        if due:
+            self.flush()
+        return decision
+
+    def journal_is_failure_prone(self, journal: Optional[str]) -> bool:
+        """雑誌の過去の変換で、昇格・失敗の割合が JOURNAL_FAILURE_RATE 以上かどうか。"""
+        with self._lock:
+            row = self._journals.get(journal) if journal else None
+        if not row or row["calls"] < JOURNAL_MIN_SAMPLES:
+            return False
+        return (row["escalated"] + row["failed"]) / row["calls"] >= JOURNAL_FAILURE_RATE
+
+    def route_markdown(
+        self,
+        route: str,
+        pages: int = 0,
+        text_chars: int = 0,
+        quality: Optional[dict] = None,
+        journal: Optional[str] = None,
+    ) -> dict:
+        """
+        P1のMarkdown変換のプロファイルを選ぶ。
+        route は変換の経路（"html" / "pdf_text" / "pdf"）、text_chars は送るテキストの文字数、
+        quality は抽出したテキストの品質（assess_text_quality の結果）。
+        """
+        if not self.enabled:
+            return self._decision("p1_markdown", "flash", "ルーターは無効です", journal)
+
+        if route == "pdf":
+            if pages >= HARD_PDF_PAGES:
+                profile, reason = "pro", f"PDFをそのまま送る長い論文 ({pages}ページ)"
+            else:
+                profile, reason = "flash", f"PDFをそのまま送る論文 ({pages}ページ)"
+        else:
+            garbled_ratio = (quality or {}).get("garbled_ratio", 0.0)
+            if text_chars <= LITE_MAX_CHARS and garbled_ratio <= LITE_MAX_GARBLED_RATIO:
+                profile, reason = "lite", f"短いテキスト ({text_chars}文字)"
+            elif text_chars <= FLASH_LIGHT_MAX_CHARS:
+                profile, reason = "flash_light", f"中程度のテキスト ({text_chars}文字, 文字化け {garbled_ratio:.1%})"
+            else:
+                profile, reason = "flash", f"長いテキスト ({text_chars}文字)"
+
+        if self.journal_is_failure_prone(journal):
+            index = min(PROFILE_ORDER.index(profile) + 1, len(PROFILE_ORDER) - 1)
+            profile, reason = PROFILE_ORDER[index], f"{reason}, 雑誌 '{journal}' の失敗実績により1段上げる"
+        return self._decision("p1_markdown", profile, reason, journal)
+
+    def route_generation(self, purpose: str) -> dict:
+        """ペルソナ・P2・P3の生成のプロファイルを選ぶ（lite から始め、検証に失敗した場合に昇格する）。"""
+        reason = "ルーターは無効です" if not self.enabled else "生成タスクの既定"
+        return self._decision(purpose, "lite", reason)
+
+    def escalate(self, decision: dict, reason: str) -> Optional[dict]:
+        """1段上のプロファイルの振り分けを返す（ルーターが無効・上限に達している場合は None）。"""
+        index = PROFILE_ORDER.index(decision["profile"])
+        if not self.enabled or index >= PROFILE_ORDER.index(self.max_profile):
+            return None
+        profile = PROFILE_ORDER[index + 1]
+        key = f"{decision['purpose']}: {decision['profile']} -> {profile}"
+        with self._lock:
+            self.escalations[key] = self.escalations.get(key, 0) + 1
+            due = self._log({"event": "escalate", "purpose": decision["purpose"], "from": decision["profile"], "to": profile, "reason": reason})
+        if due:
+            self.flush()
+        return {**decision, "profile": profile, **MODEL_PROFILES[profile], "reason": f"昇格: {reason}"}
+
+    def call(self, decision: dict, generate: Callable[[dict], dict], validate: Optional[Callable[[dict], None]] = None):
+        """
+        generate(decision) で LLM を呼び出し（LLMGateway.generate の結果を返すこと）、validate で出力を検証する。
+        検証に失敗した（OutputValidationError / StructuredOutputError）場合は上位のプロファイルで再実行する。
+        (結果, 最終的な振り分け) を返す。
+        """
+        escalated = False
+        while True:
+            key = f"{decision['purpose']}/{decision['profile']}"
+            started_at = time.monotonic()
+            result = None
+            try:
+                result = generate(decision)
+                if validate is not None:
+                    validate(result)
+            except (OutputValidationError, StructuredOutputError) as e:
+                # 検証に失敗した出力も課金されるため、トークン数・推定コストに含める
+                self._record_call(key, decision, time.monotonic() - started_at, result, success=False)
+                next_decision = self.escalate(decision, str(e))
+                if next_decision is None:
+                    self._record_journal(decision.get("journal"), escalated, failed=True)
+                    raise
+                print(
+                    f"[ModelRouter] '{decision['purpose']}': 出力の検証に失敗しました ({e})。"
+                    f"{decision['profile']} → {next_decision['profile']} で再実行します..."
+                )
+                decision, escalated = next_decision, True
+                continue
+            except Exception:
+                self.call_stats.record(key, time.monotonic() - started_at, success=False)
+                self._record_journal(decision.get("journal"), escalated, failed=True)
+                raise
+
+            self._record_call(key, decision, time.monotonic() - started_at, result)
+            self._record_journal(decision.get("journal"), escalated, failed=False)
+            return result, decision
+
+    def _record_call(self, key: str, decision: dict, elapsed: float, result: Optional[dict], success: bool = True):
+        usage = result.get("usage_metadata") if result else None
+        self.call_stats.record(key, elapsed, success=success, usage_metadata=usage)
+        if result and not result.get("cached"):
+            with self._lock:
+                self._costs[key] = self._costs.get(key, 0.0) + estimate_cost(decision["model"], usage)
+
+    def _record_journal(self, journal: Optional[str], escalated: bool, failed: bool):
+        if not journal:
+            return
+        with self._lock:
+            row = self._journals.setdefault(journal, {"calls": 0, "escalated": 0, "failed": 0})
+            row["calls"] += 1
+            if escalated:
+                row["escalated"] += 1
+            if failed:
+                row["failed"] += 1
+            self._pending_journal_writes += 1
+            due = self._flush_due()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """溜めた routing_log の行と、未保存の雑誌ごとの実績をファイルに書き込む（実行の終わりにも呼び出す）。"""
+        with self._save_lock:
+            with self._lock:
+                journals = None
+                if self._pending_journal_writes:
+                    journals = {journal: dict(row) for journal, row in self._journals.items()}
+                log_lines, self._pending_log_lines = self._pending_log_lines, []
+                self._pending_journal_writes = 0
+                self._last_flush_at = time.monotonic()
+            if log_lines:
+                self._write_log(log_lines)
+            if journals is not None:
+                self._save(journals)
+
+    def get_stats(self) -> dict:
+        """(用途/プロファイル) ごとの呼び出し・レイテンシ・トークン数（RouteStats の集計）に、推定コスト（cost_usd）を加えて返す。"""
+        stats = self.call_stats.get_stats()
+        with self._lock:
+            for key, route_stats in stats.items():
+                route_stats["cost_usd"] = self._costs.get(key, 0.0)
+                route_stats["decisions"] = self.decisions.get(key, 0)
+        return stats
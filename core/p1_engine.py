@@ -0,0 +1,182 @@
+import time
+import queue
+import threading
+from collections import deque
+from typing import Callable, Any, Optional, List, Iterable
+
+# ステージの入力が終わったことを示す目印
+_STOP = object()
+
+# レイテンシの分位点を計算するために保持する直近の件数
+LATENCY_WINDOW = 10000
+
+
+class StageStats:
+    """ステージごとの処理件数・失敗件数・処理時間を集計する。"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, success: bool):
+        with self._lock:
+            if success:
+                self.processed += 1
+            else:
+                self.failed += 1
+            self.busy_seconds += elapsed
+            self.latencies.append(elapsed)
+
+    @staticmethod
+    def _percentile(sorted_values: list, ratio: float) -> float:
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def snapshot(self, elapsed_total: float) -> dict:
+        """集計値を辞書で返す。throughput_per_min はエンジン開始からの1分あたり処理件数。"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            done = self.processed + self.failed
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "failed": self.failed,
+                "busy_seconds": self.busy_seconds,
+                "avg_latency": (self.busy_seconds / done) if done else 0.0,
+                "p50_latency": self._percentile(latencies, 0.5),
+                "p95_latency": self._percentile(latencies, 0.95),
+                "throughput_per_min": (self.processed / elapsed_total * 60) if elapsed_total > 0 else 0.0,
+            }
+
+
+class Stage:
+    """
+    エンジンの1段階。func(item) の戻り値が次の段階の入力になる（None の場合は次へ送らない）。
+    func が例外を送出した場合は失敗として数え、on_error(item, exception) を呼ぶ。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+        on_error: Optional[Callable[[Any, BaseException], None]] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size if queue_size is not None else self.workers * 2
+        self.on_error = on_error
+
+
+class StagedEngine:
+    """
+    段階ごとにワーカースレッドと有界の入力キューを持つパイプライン実行エンジン。
+    (例: ダウンロード → Gemini変換 → 保存)
+
+    - 各段階のワーカー数は独立して設定でき、遅い段階（Gemini変換）と
+      レート制限のある段階（ダウンロード）・ディスク書き込みが並行して進む。
+    - キューは有界のため、下流が詰まると上流（submit の呼び出し元を含む）が待機する（バックプレッシャー）。
+    - drain() は入力を締め切り、投入済みのアイテムをすべて処理し終えてから戻る。
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("ステージが1つもありません。")
+        self.stages = stages
+        self.stats = [StageStats(stage.name, stage.workers) for stage in stages]
+        self._queues = [queue.Queue(maxsize=max(1, stage.queue_size)) for stage in stages]
+        self._remaining_workers = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._closed = False
+
+    def start(self):
+        """全ステージのワーカースレッドを起動する。"""
+        self._started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            for worker_number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index,), name=f"{stage.name}-{worker_number + 1}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item: Any):
+        """最初のステージにアイテムを投入する。キューが満杯の間は待機する。"""
+        if self._closed:
+            raise RuntimeError("drain() 後のエンジンにはアイテムを投入できません。")
+        self._queues[0].put(item)
+
+    def run(self, items: Iterable[Any]):
+        """items をすべて投入し、処理が終わるまで待つ。"""
+        try:
+            for item in items:
+                self.submit(item)
+        finally:
+            self.drain()
+
+    def drain(self):
+        """入力を締め切り、投入済みのアイテムがすべての段階を通過するまで待つ。"""
+        if not self._closed:
+            self._closed = True
+            for _ in range(self.stages[0].workers):
+                self._queues[0].put(_STOP)
+        for thread in self._threads:
+            # Ctrl+C を受け付けられるように、タイムアウト付きで待つ
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        if self._finished_at is None:
+            self._finished_at = time.perf_counter()
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats[index]
+        in_queue = self._queues[index]
+        out_queue = self._queues[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            started = time.perf_counter()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                stats.record(time.perf_counter() - started, success=False)
+                if stage.on_error:
+                    try:
+                        stage.on_error(item, e)
+                    except Exception as handler_error:
+                        print(f"[StagedEngine] '{stage.name}' のエラー処理中に例外が発生しました: {handler_error}")
+                continue
+            stats.record(time.perf_counter() - started, success=True)
+            if out_queue is not None and result is not None:
+                out_queue.put(result)
+
+        # この段階の最後のワーカーが終了したら、次の段階に終了を伝える
+        with self._lock:
+            self._remaining_workers[index] -= 1
+            is_last = self._remaining_workers[index] == 0
+        if is_last and out_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                out_queue.put(_STOP)
+
+    def get_stats(self) -> List[dict]:
+        """ステージごとの集計値を返す。"""
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        return [stats.snapshot(elapsed) for stats in self.stats]
@@ -0,0 +1,405 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import deque
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_STATE_DB_PATH = os.path.join("output", "pipeline_1_state.sqlite3")
+# 失敗した論文を再試行する回数の上限（これを超えた論文は以降の実行でスキップする）
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("P1_MAX_ATTEMPTS", 3))
+# まとめてコミットする件数・間隔（秒）
+DEFAULT_COMMIT_EVERY = 20
+DEFAULT_COMMIT_INTERVAL = 1.0
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    doi TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    content_hash TEXT,
+    source_keyword TEXT,
+    started_at REAL,
+    finished_at REAL,
+    elapsed_seconds REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_status ON articles (status);
+CREATE TABLE IF NOT EXISTS keyword_cursors (
+    keyword TEXT PRIMARY KEY,
+    next_start INTEGER NOT NULL,
+    last_doi TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keyword_pages (
+    keyword TEXT NOT NULL,
+    start_index INTEGER NOT NULL,
+    total_hits INTEGER NOT NULL DEFAULT 0,
+    articles INTEGER NOT NULL DEFAULT 0,
+    new_dois INTEGER NOT NULL DEFAULT 0,
+    duplicate_dois INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (keyword, start_index)
+);
+"""
+
+
+class P1StateStore:
+    """
+    パイプライン1の進捗（論文ごとの状態・キーワードごとの検索位置）を保存する SQLite (WALモード) のストア。
+    従来の processed_jstage_dois.log / pipeline_1_processed_keywords.log を置き換える。
+
+    - 論文ごとに status（in_progress / done / failed）, attempts, last_error, content_hash,
+      source_keyword, 処理時間を記録する。再開時の判定は DOI（主キー）で1件ずつ引く。
+    - 失敗した論文は attempts が max_attempts に達するまで再試行し、それ以降はスキップする。
+    - キーワードごとに、次に検索する開始位置（next_start）と最後の論文の DOI を保存し、ページ単位で再開する。
+    - キーワードの検索ページごとに、総ヒット数・新規/既知の DOI 数・変換の失敗数（収穫の実績）を記録する。
+    - 書き込みは commit_every 件ごと、または commit_interval 秒ごとにまとめてコミットする。
+    - 初回作成時に、従来のログファイルがあれば取り込む。
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_STATE_DB_PATH,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        commit_every: int = DEFAULT_COMMIT_EVERY,
+        commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 複数のワーカースレッドから書き込むため、接続は1つにしてロックで直列化する
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._pending_writes = 0
+        self._last_commit_at = time.monotonic()
+
+    # --- 従来のログからの移行 ---
+
+    def import_legacy_logs(self, doi_log_path: str, keyword_log_path: Optional[str] = None) -> int:
+        """
+        従来のテキストログ（処理済みDOI・処理済みキーワード）を取り込む。
+        ストアに論文が1件もない場合のみ行い、取り込んだDOIの件数を返す。
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM articles LIMIT 1").fetchone():
+                return 0
+            now = time.time()
+            dois = _read_lines(doi_log_path)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO articles (doi, status, attempts, updated_at) VALUES (?, ?, 1, ?)",
+                [(doi, STATUS_DONE, now) for doi in dois],
+            )
+            if keyword_log_path:
+                # 従来のログのキーワードは、検索が完了したものとして扱う
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO keyword_cursors (keyword, next_start, completed, updated_at) VALUES (?, 1, 1, ?)",
+                    [(keyword, now) for keyword in _read_lines(keyword_log_path)],
+                )
+            self._conn.commit()
+            return len(dois)
+
+    # --- 論文の状態 ---
+
+    def get_status(self, doi: str) -> Optional[dict]:
+        """論文の状態を辞書で返す（未登録の場合は None）。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, attempts, last_error FROM articles WHERE doi = ?", (doi,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "attempts": row[1], "last_error": row[2]}
+
+    def skip_reason(self, doi: str) -> Optional[str]:
+        """
+        論文をスキップすべき理由を返す（処理すべき場合は None）。
+        "done": 処理済み, "failed": 失敗が max_attempts 回に達した
+        """
+        state = self.get_status(doi)
+        if state is None:
+            return None
+        if state["status"] == STATUS_DONE:
+            return "done"
+        if state["status"] == STATUS_FAILED and state["attempts"] >= self.max_attempts:
+            return "failed"
+        return None
+
+    def __contains__(self, doi: str) -> bool:
+        """処理済み（done）の論文かどうかを返す。"""
+        return self.skip_reason(doi) == "done"
+
+    def get_done_dois(self) -> set:
+        """処理済みの DOI をまとめて返す（レポート作成など、多数の DOI を判定する場合に使用）。"""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT doi FROM articles WHERE status = ?", (STATUS_DONE,))}
+
+    def mark_started(self, doi: str, source_keyword: Optional[str] = None):
+        """論文の処理を開始したことを記録し、試行回数を1増やす。"""
+        now = time.time()
+        self._write(
+            """
+            INSERT INTO articles (doi, status, attempts, source_keyword, started_at, updated_at)
+            VALUES (?, ?, 1, ?, ?, ?)
+            ON CONFLICT(doi) DO UPDATE SET
+                status = excluded.status, attempts = attempts + 1,
+                source_keyword = COALESCE(excluded.source_keyword, source_keyword),
+                started_at = excluded.started_at, finished_at = NULL, updated_at = excluded.updated_at
+            """,
+            (doi, STATUS_IN_PROGRESS, source_keyword, now, now),
+        )
+
+    def mark_done(self, doi: str, content_hash: Optional[str] = None):
+        """論文の処理が完了したことを記録する。"""
+        self._mark_finished(doi, STATUS_DONE, None, content_hash)
+
+    def mark_failed(self, doi: str, error: str):
+        """論文の処理が失敗したことを記録する。"""
+        self._mark_finished(doi, STATUS_FAILED, error, None)
+
+    def _mark_finished(self, doi: str, status: str, error: Optional[str], content_hash: Optional[str]):
+        now = time.time()
+        self._write(
+            """
+            INSERT INTO articles (doi, status, attempts, last_error, content_hash, finished_at, updated_at)
+            VALUES (?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT(doi) DO UPDATE SET
+                status = excluded.status,
+                last_error = excluded.last_error,
+                content_hash = COALESCE(excluded.content_hash, content_hash),
+                finished_at = excluded.finished_at,
+                elapsed_seconds = excluded.finished_at - started_at,
+                updated_at = excluded.updated_at
+            """,
+            (doi, status, error, content_hash, now, now),
+        )
+
+    # --- キーワードの検索位置 ---
+
+    def save_cursor(self, keyword: str, next_start: int, last_doi: Optional[str] = None, completed: bool = False):
+        """
+        キーワードの検索位置を保存する（ページ内の論文の処理が終わった時点で呼ぶ）。
+        それまでの論文の状態と合わせて即座にコミットする。
+        """
+        self._write(
+            """
+            INSERT INTO keyword_cursors (keyword, next_start, last_doi, completed, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(keyword) DO UPDATE SET
+                next_start = excluded.next_start,
+                last_doi = COALESCE(excluded.last_doi, last_doi),
+                completed = excluded.completed,
+                updated_at = excluded.updated_at
+            """,
+            (keyword, next_start, last_doi, int(completed), time.time()),
+            force_commit=True,
+        )
+
+    def get_cursors(self) -> dict:
+        """キーワードごとの検索位置を {keyword: {"next_start", "last_doi", "completed"}} で返す。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT keyword, next_start, last_doi, completed FROM keyword_cursors").fetchall()
+        return {row[0]: {"next_start": row[1], "last_doi": row[2], "completed": bool(row[3])} for row in rows}
+
+    def get_completed_keywords(self) -> set:
+        """検索が完了したキーワードの一覧を返す。"""
+        return {keyword for keyword, cursor in self.get_cursors().items() if cursor["completed"]}
+
+    def get_resume_start_indexes(self) -> dict:
+        """途中まで検索したキーワードの、再開する開始位置を {keyword: next_start} で返す。"""
+        return {
+            keyword: cursor["next_start"]
+            for keyword, cursor in self.get_cursors().items()
+            if not cursor["completed"] and cursor["next_start"] > 1
+        }
+
+    def reset_cursors(self):
+        """キーワードの検索位置をすべて削除する（--resume なしで実行した場合）。"""
+        self._write("DELETE FROM keyword_cursors", (), force_commit=True)
+
+    # --- キーワードの収穫の実績 ---
+
+    def record_page_yield(
+        self, keyword: str, start_index: int, total_hits: int, articles: int, new_dois: int, duplicate_dois: int
+    ):
+        """
+        検索ページの実績（総ヒット数・論文数・新規/既知の DOI 数）を記録する。
+        同じページを再び検索した場合は最新の値で上書きする（変換の失敗数は残す）。
+        """
+        self._write(
+            """
+            INSERT INTO keyword_pages (keyword, start_index, total_hits, articles, new_dois, duplicate_dois, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(keyword, start_index) DO UPDATE SET
+                total_hits = excluded.total_hits, articles = excluded.articles,
+                new_dois = excluded.new_dois, duplicate_dois = excluded.duplicate_dois,
+                updated_at = excluded.updated_at
+            """,
+            (keyword, start_index, total_hits, articles, new_dois, duplicate_dois, time.time()),
+        )
+
+    def add_page_failure(self, keyword: str, start_index: int):
+        """検索ページで見つかった論文の変換失敗を1件記録する。"""
+        self._write(
+            """
+            INSERT INTO keyword_pages (keyword, start_index, failures, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(keyword, start_index) DO UPDATE SET failures = failures + 1, updated_at = excluded.updated_at
+            """,
+            (keyword, start_index, time.time()),
+        )
+
+    def get_keyword_yields(self) -> dict:
+        """
+        キーワードごとの実績を集計して返す。
+        {keyword: {"pages", "total_hits", "articles", "new_dois", "duplicate_dois", "failures", "novelty_ratio"}}
+        novelty_ratio は検索した論文のうち新規だった割合（論文がない場合は 0）。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT keyword, COUNT(*), MAX(total_hits), SUM(articles), SUM(new_dois), SUM(duplicate_dois), SUM(failures)
+                FROM keyword_pages GROUP BY keyword
+                """
+            ).fetchall()
+        yields = {}
+        for keyword, pages, total_hits, articles, new_dois, duplicate_dois, failures in rows:
+            yields[keyword] = {
+                "pages": pages,
+                "total_hits": total_hits,
+                "articles": articles,
+                "new_dois": new_dois,
+                "duplicate_dois": duplicate_dois,
+                "failures": failures,
+                "novelty_ratio": new_dois / articles if articles else 0.0,
+            }
+        return yields
+
+    # --- 書き込み・集計 ---
+
+    def _write(self, sql: str, params: tuple, force_commit: bool = False):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._pending_writes += 1
+            if (
+                force_commit
+                or self._pending_writes >= self.commit_every
+                or time.monotonic() - self._last_commit_at >= self.commit_interval
+            ):
+                self._commit_locked()
+
+    def _commit_locked(self):
+        self._conn.commit()
+        self._pending_writes = 0
+        self._last_commit_at = time.monotonic()
+
+    def flush(self):
+        """未コミットの書き込みをコミットする。"""
+        with self._lock:
+            self._commit_locked()
+
+    def close(self):
+        with self._lock:
+            self._commit_locked()
+            self._conn.close()
+
+    def get_stats(self, top_errors: int = 5) -> dict:
+        """
+        状態ごとの論文数・処理時間・失敗の多いエラーを集計する。
+        - counts: status ごとの件数
+        - done_avg_seconds / done_total_seconds: 完了した論文の平均・合計処理時間
+        - retried: 2回以上試行した論文数
+        - top_errors: 失敗中の論文の last_error 上位（[エラー, 件数] のリスト）
+        """
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM articles GROUP BY status").fetchall())
+            avg_seconds, total_seconds = self._conn.execute(
+                "SELECT AVG(elapsed_seconds), SUM(elapsed_seconds) FROM articles WHERE status = ? AND elapsed_seconds IS NOT NULL",
+                (STATUS_DONE,),
+            ).fetchone()
+            retried = self._conn.execute("SELECT COUNT(*) FROM articles WHERE attempts > 1").fetchone()[0]
+            errors = self._conn.execute(
+                "SELECT last_error, COUNT(*) AS n FROM articles WHERE status = ? GROUP BY last_error ORDER BY n DESC LIMIT ?",
+                (STATUS_FAILED, top_errors),
+            ).fetchall()
+        return {
+            "counts": counts,
+            "done_avg_seconds": avg_seconds or 0.0,
+            "done_total_seconds": total_seconds or 0.0,
+            "retried": retried,
+            "top_errors": [list(row) for row in errors],
+        }
+
+
+def _read_lines(path: str) -> list:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class SearchCursorTracker:
+    """
+    検索ページごとに、ページ内の論文の処理（保存・失敗・スキップ）がすべて終わった時点で
+    キーワードの検索位置を状態ストアに保存する。
+    並行処理で論文の完了順が前後しても、検索位置はキーワードごとにページの順序どおりにしか進めない。
+    """
+
+    def __init__(self, state_store: P1StateStore):
+        self.state_store = state_store
+        # ページIDは実行ごとに一意にする（前回の実行のバッチジョブから戻ってきた論文を区別するため）
+        self._run_id = uuid.uuid4().hex[:8]
+        self._next_number = 0
+        self._pages: dict = {}
+        self._keyword_pages: dict = {}
+        self._lock = threading.Lock()
+
+    def add_page(self, page: dict) -> str:
+        """検索ページを登録し、ページIDを返す。論文のないページは即座に検索位置を進める。"""
+        with self._lock:
+            page_id = f"{self._run_id}-{self._next_number}"
+            self._next_number += 1
+            articles = page["articles"]
+            self._pages[page_id] = {
+                "keyword": page["query"],
+                "next_start": page["next_start_index"],
+                "last_doi": articles[-1].get("doi") if articles else None,
+                "completed": page["is_last_page"],
+                "pending": len(articles),
+            }
+            self._keyword_pages.setdefault(page["query"], deque()).append(page_id)
+            self._advance(page["query"])
+        return page_id
+
+    def article_finished(self, page_id: Optional[str]):
+        """ページ内の論文1件の処理が終わったことを記録する（他の実行のページIDは無視する）。"""
+        with self._lock:
+            page = self._pages.get(page_id)
+            if page is None:
+                return
+            page["pending"] -= 1
+            self._advance(page["keyword"])
+
+    def _advance(self, keyword: str):
+        """処理が終わったページまで、キーワードの検索位置を順に進める（ロック内で呼び出すこと）。"""
+        page_ids = self._keyword_pages[keyword]
+        while page_ids and self._pages[page_ids[0]]["pending"] <= 0:
+            page = self._pages.pop(page_ids.popleft())
+            self.state_store.save_cursor(keyword, page["next_start"], page["last_doi"], page["completed"])
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+from typing import List, Optional, Sequence
+
+from utils.jstage_client import JStageClient
+
+# 組み合わせに使うキーワードの最大数
+DEFAULT_MAX_TERMS = 2
+
+
+class CombinationQueryPlanner:
+    """
+    combination モードの検索クエリを計画するクラス。
+    キーワードリストの総当たりを事前に作らず、ヒット件数の少ない確認（count=1 の検索）を行いながら、
+    「新しく得られる論文数の見込み」が大きい順にクエリを選ぶ（最良優先探索）。
+
+    - 単一キーワードも、見込みの上限値（上限件数）でヒープに入れ、取り出した時点で初めてヒット件数を確認する。
+      確認済みの見込みは上限値と同点でも先に取り出すため、max_queries 件が決まった時点で確認を打ち切れる。
+    - keyword_yields（P1StateStore.get_keyword_yields）に実績があるクエリは、記録済みのヒット件数を使って確認を省き、
+      既に取得した論文数（状態ストアに記録済みの DOI）を見込みから差し引く。新しい論文の見込みがないクエリは除外する。
+    - ヒット件数が max_papers_per_keyword を超える（上限までしか取得できない）キーワードだけを、
+      後ろのリストのキーワードと組み合わせて絞り込む。上限以内のキーワードを含む組み合わせは、
+      そのキーワード単独の検索で全件取得できるため作らない。
+    - ヒット0件の組み合わせ、ヒット件数が構成キーワードのいずれかと同じ（結果が変わらない）組み合わせは除外する。
+    - 未確認の組み合わせは見込みの上限値でヒープに入れ、取り出した時点で初めてヒット件数を確認する。
+
+    見込み（expected_new）は min(ヒット件数, 上限) から既に取得した論文数を引いた値に、上限を超える構成キーワードごとの
+    「そのキーワード単独では取得できない割合」(1 - 上限 / ヒット件数) を掛けたもの。
+    """
+
+    def __init__(
+        self,
+        jstage_client: JStageClient,
+        keyword_lists: Sequence[Sequence[str]],
+        max_papers_per_keyword: int,
+        max_terms: int = DEFAULT_MAX_TERMS,
+        max_probes: Optional[int] = None,
+        keyword_yields: Optional[dict] = None,
+    ):
+        self.jstage_client = jstage_client
+        # 同じキーワードが複数のリストにある場合は、最初のリストだけに残す
+        seen = set()
+        self.keyword_lists: List[List[str]] = []
+        for keyword_list in keyword_lists:
+            unique = [keyword for keyword in dict.fromkeys(keyword_list) if keyword not in seen]
+            seen.update(unique)
+            self.keyword_lists.append(unique)
+        self.cap = max(1, max_papers_per_keyword)
+        self.max_terms = max(1, max_terms)
+        self.max_probes = max_probes
+        self.hits: dict = {}  # terms (tuple) -> ヒット件数
+        # クエリ -> 過去の検索で記録したヒット件数・既に取得した論文数
+        # （"Oxford Knee Score" のように空白を含むキーワードがあるため、キーワードの組には分解せずクエリのまま持つ）
+        self.recorded_hits: dict = {}
+        self.fetched: dict = {}
+        for query, keyword_yield in (keyword_yields or {}).items():
+            if keyword_yield.get("pages") and keyword_yield.get("total_hits") is not None:
+                self.fetched[query] = keyword_yield.get("articles") or 0
+                self.recorded_hits[query] = keyword_yield["total_hits"]
+        self.stats = {
+            "probes": 0, "probe_errors": 0, "pruned_zero": 0, "pruned_subsumed": 0, "pruned_unprobed": 0, "pruned_known": 0,
+        }
+        self._counter = itertools.count()
+
+    @staticmethod
+    def to_query(terms: tuple) -> str:
+        """キーワードの組をJ-STAGEの検索クエリ（スペース区切りのAND検索）にする。"""
+        return " ".join(terms)
+
+    def _known_hits(self, terms: tuple) -> Optional[int]:
+        """確認済み、または過去の検索で記録したヒット件数を返す（どちらもない場合は None）。"""
+        if terms not in self.hits and self.to_query(terms) in self.recorded_hits:
+            self.hits[terms] = self.recorded_hits[self.to_query(terms)]
+        return self.hits.get(terms)
+
+    def _probe(self, terms: tuple) -> Optional[int]:
+        """
+        count=1 の検索でヒット件数だけを確認する（確認の上限に達した場合・検索に失敗した場合は None）。
+        失敗した確認はヒット0件として記録せず、未確認として扱う。
+        """
+        known = self._known_hits(terms)
+        if known is not None:
+            return known
+        if self.max_probes is not None and self.stats["probes"] >= self.max_probes:
+            return None
+        self.stats["probes"] += 1
+        try:
+            _, total_hits = self.jstage_client.search_articles(self.to_query(terms), count=1, start=1, raise_on_error=True)
+        except Exception as e:
+            print(f"[QueryPlanner] ヒット件数の確認に失敗しました ('{self.to_query(terms)}'): {e}")
+            self.stats["probe_errors"] += 1
+            return None
+        self.hits[terms] = total_hits
+        return total_hits
+
+    def _uncovered_ratio(self, hits: int) -> float:
+        """ヒット件数 hits のクエリを単独で検索したときに、上限のために取得できない割合。"""
+        return max(0.0, 1.0 - self.cap / hits) if hits > 0 else 0.0
+
+    def _expected_new(self, terms: tuple, hits: int) -> float:
+        """組み合わせの検索で新しく得られる論文数の見込み。"""
+        expected = float(max(0, min(hits, self.cap) - self.fetched.get(self.to_query(terms), 0)))
+        if len(terms) > 1:
+            for size in range(1, len(terms)):
+                for subset in itertools.combinations(terms, size):
+                    if subset in self.hits:
+                        expected *= self._uncovered_ratio(self.hits[subset])
+        return expected
+
+    def _is_subsumed(self, terms: tuple, hits: Optional[int] = None) -> bool:
+        """
+        組み合わせが、確認済みの構成キーワード（部分集合）の検索で代替できるかを返す。
+        - 部分集合のヒット件数が上限以内: 部分集合の検索で全件取得できる
+        - 部分集合とヒット件数が同じ: 検索結果が変わらない
+        """
+        for size in range(1, len(terms)):
+            for subset in itertools.combinations(terms, size):
+                subset_hits = self.hits.get(subset)
+                if subset_hits is None:
+                    continue
+                if subset_hits <= self.cap or (hits is not None and hits == subset_hits):
+                    return True
+        return False
+
+    def _push(self, heap: list, terms: tuple, list_index: int, score: float, probed: bool):
+        # heapq は最小値を取り出すため、見込みを負にして入れる（同点は確認済みを先に、その中では生成順）
+        heapq.heappush(heap, (-score, not probed, next(self._counter), terms, list_index, probed))
+
+    def _push_children(self, heap: list, terms: tuple, list_index: int, hits: int):
+        """組み合わせに、後ろのリストのキーワードを1つ加えた組み合わせを（未確認のまま）ヒープに入れる。"""
+        if len(terms) >= self.max_terms or hits <= self.cap:
+            return
+        for child_index in range(list_index + 1, len(self.keyword_lists)):
+            for keyword in self.keyword_lists[child_index]:
+                child = terms + (keyword,)
+                if self._is_subsumed(child):
+                    self.stats["pruned_subsumed"] += 1
+                    continue
+                # 子のヒット件数は親・追加キーワードのヒット件数以下になる（AND検索）
+                upper_hits = min(hits, self.hits.get((keyword,), hits))
+                self._push(heap, child, child_index, self._expected_new(child, upper_hits), probed=False)
+
+    def plan(self, max_queries: int, exclude: Optional[set] = None) -> List[dict]:
+        """
+        実行するクエリを見込みの大きい順に最大 max_queries 件返す。
+        各要素は {"query", "terms", "hits", "expected_new"} の辞書。exclude のクエリは返さない（展開には使う）。
+        """
+        exclude = exclude or set()
+        heap: list = []
+
+        # 1. 単一キーワードを見込みの上限値（ヒット件数が確認済みであれば正確な見込み）で入れる
+        for list_index, keyword_list in enumerate(self.keyword_lists):
+            for keyword in keyword_list:
+                terms = (keyword,)
+                known = self._known_hits(terms)
+                if known is not None:
+                    self._push(heap, terms, list_index, self._expected_new(terms, known), probed=True)
+                else:
+                    self._push(heap, terms, list_index, float(self.cap), probed=False)
+
+        # 2. 見込みの大きい順に取り出し、未確認のものはヒット件数を確認して入れ直し、必要に応じて組み合わせを展開する
+        planned = []
+        while heap and len(planned) < max_queries:
+            _, _, _, terms, list_index, probed = heapq.heappop(heap)
+            if not probed:
+                if self._is_subsumed(terms):
+                    # 展開した後に確認した構成キーワードの検索で、全件取得できることが分かった
+                    self.stats["pruned_subsumed"] += 1
+                    continue
+                hits = self._probe(terms)
+                if hits is None:
+                    self.stats["pruned_unprobed"] += 1
+                    continue
+                if hits == 0:
+                    self.stats["pruned_zero"] += 1
+                    continue
+                if self._is_subsumed(terms, hits):
+                    self.stats["pruned_subsumed"] += 1
+                    continue
+                # ヒット件数が分かったので、正確な見込みで入れ直す
+                self._push(heap, terms, list_index, self._expected_new(terms, hits), probed=True)
+                continue
+
+            hits = self.hits[terms]
+            if hits == 0:
+                self.stats["pruned_zero"] += 1
+                continue
+            query = self.to_query(terms)
+            expected_new = self._expected_new(terms, hits)
+            if expected_new <= 0:
+                # 既に全件（上限まで）取得済みのクエリは実行しない（組み合わせの展開には使う）
+                self.stats["pruned_known"] += 1
+            elif query not in exclude:
+                planned.append({"query": query, "terms": list(terms), "hits": hits, "expected_new": expected_new})
+            self._push_children(heap, terms, list_index, hits)
+
+        return planned
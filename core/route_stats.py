@@ -0,0 +1,89 @@
+import threading
+from collections import deque
+from typing import Optional
+
+from core.p1_engine import StageStats, LATENCY_WINDOW
+
+
+class RouteStats:
+    """
+    変換の経路（PDFをそのまま送る / 抽出したテキストを送る など）ごとに、
+    呼び出し回数・失敗回数・処理時間・入力サイズ・トークン数を集計する。
+    経路ごとの1ページあたりのトークン数・処理時間を比べることで、経路の選択による節約量を確認できる。
+    """
+
+    def __init__(self):
+        self._routes: dict = {}
+        self._lock = threading.Lock()
+
+    def _route(self, route: str) -> dict:
+        """経路の集計値を返す（ロック内で呼び出すこと）。"""
+        stats = self._routes.get(route)
+        if stats is None:
+            stats = {
+                "calls": 0,
+                "failed": 0,
+                "pages": 0,
+                "input_bytes": 0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "cached_tokens": 0,
+                "total_seconds": 0.0,
+                "latencies": deque(maxlen=LATENCY_WINDOW),
+            }
+            self._routes[route] = stats
+        return stats
+
+    def record(
+        self,
+        route: str,
+        elapsed: float,
+        success: bool = True,
+        pages: int = 0,
+        input_bytes: int = 0,
+        usage_metadata=None,
+    ):
+        """
+        1回の変換を記録する。
+        usage_metadata には Gemini の応答の usage_metadata（prompt_token_count / candidates_token_count /
+        cached_content_token_count）を渡す。
+        """
+        with self._lock:
+            stats = self._route(route)
+            stats["calls"] += 1
+            if not success:
+                stats["failed"] += 1
+            stats["pages"] += pages
+            stats["input_bytes"] += input_bytes
+            stats["total_seconds"] += elapsed
+            stats["latencies"].append(elapsed)
+            if usage_metadata is not None:
+                stats["prompt_tokens"] += getattr(usage_metadata, "prompt_token_count", None) or 0
+                stats["output_tokens"] += getattr(usage_metadata, "candidates_token_count", None) or 0
+                stats["cached_tokens"] += getattr(usage_metadata, "cached_content_token_count", None) or 0
+
+    def get_stats(self) -> dict:
+        """
+        経路ごとの集計値を {route: {...}} で返す。
+        calls / failed / pages / input_bytes / prompt_tokens / output_tokens / cached_tokens に加え、
+        avg_latency / p50_latency / p95_latency と、1ページあたりの prompt_tokens_per_page / seconds_per_page を含む。
+        """
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                latencies = sorted(stats["latencies"])
+                calls = stats["calls"]
+                pages = stats["pages"]
+                result[route] = {
+                    **{key: value for key, value in stats.items() if key != "latencies"},
+                    "avg_latency": stats["total_seconds"] / calls if calls else 0.0,
+                    "p50_latency": StageStats._percentile(latencies, 0.5),
+                    "p95_latency": StageStats._percentile(latencies, 0.95),
+                    "prompt_tokens_per_page": stats["prompt_tokens"] / pages if pages else 0.0,
+                    "seconds_per_page": stats["total_seconds"] / pages if pages else 0.0,
+                }
+            return result
+
+    def get_route(self, route: str) -> Optional[dict]:
+        """指定した経路の集計値を返す（記録がない場合は None）。"""
+        return self.get_stats().get(route)
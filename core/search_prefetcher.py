@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterator, Optional, List, Dict, Any
+
+from utils.jstage_client import JStageClient
+
+# 先読みスレッドが終了したことを示す目印
+_END_OF_PAGES = object()
+
+
+def iter_search_pages(
+    jstage_client: JStageClient,
+    queries: List[str],
+    search_count: int,
+    max_papers_per_keyword: int,
+    search_sleep: float = 0.0,
+    start_indexes: Optional[Dict[str, int]] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    クエリリストを順に検索し、1ページ分の結果を辞書として返すジェネレーター。
+
+    各ページは以下のキーを持つ:
+        query, query_number, start_index, articles, total_hits, is_first_page,
+        next_start_index (このページの次に検索する開始位置), is_last_page (このクエリの検索が完了したか),
+        messages ((ログレベル, メッセージ) のリスト。ログ出力は処理側で行う)
+    ヒット0件・検索エラー・上限到達でクエリを終了する場合も、理由を messages に入れたページ（articles は空）を返す。
+    検索エラーで終了したページは is_last_page が False で、next_start_index はそのページの開始位置になる。
+    start_indexes にクエリごとの開始位置を渡すと、そのページから検索を再開する（途中まで処理したキーワードの再開用）。
+    on_page を渡すと、検索に成功したページごとに（yield する前に）呼び出す。
+    検索の失敗はヒット0件と区別し（JStageSearchError）、on_page を呼ばずに検索エラーのページとして返す。
+    論文のあるページで False を返した場合は、そのページを最後にこのクエリの検索を終了する。
+    """
+    start_indexes = start_indexes or {}
+    for query_number, query in enumerate(queries, start=1):
+        start_index = start_indexes.get(query, 1)
+        is_first_fetch = True
+        total_hits_for_this_query = 0  # このクエリの総ヒット数（初回APIで設定）
+
+        while True:
+            page = {
+                "query": query,
+                "query_number": query_number,
+                "start_index": start_index,
+                "articles": [],
+                "total_hits": total_hits_for_this_query,
+                "is_first_page": is_first_fetch,
+                "next_start_index": start_index,
+                "is_last_page": True,
+                "messages": [],
+            }
+            if is_first_fetch and start_index > 1:
+                page["messages"].append(("info", f"  -> 前回の続き (開始位置: {start_index}) から検索を再開します。"))
+
+            # 1. ユーザー指定の総取得上限を超えていたら、このキーワードは終了
+            if start_index > max_papers_per_keyword:
+                page["messages"].append(("info", f"  -> ユーザー指定の上限 ({max_papers_per_keyword}件) に達したため、このクエリを終了します。"))
+                yield page
+                break
+
+            # 2. (初回ループ以外で) APIの総ヒット数を超えていたら、このキーワードは終了
+            if total_hits_for_this_query > 0 and start_index > total_hits_for_this_query:
+                page["messages"].append(("info", f"  -> APIの総ヒット数 ({total_hits_for_this_query}件) に達したため、このクエリを終了します。"))
+                yield page
+                break
+
+            page["messages"].append(("info", f"  -> ページ取得中 (開始位置: {start_index} / 1ページの件数: {search_count})"))
+            try:
+                articles, total_hits = jstage_client.search_articles(
+                    query, count=search_count, start=start_index, raise_on_error=True
+                )
+                if is_first_fetch:  # 最初のループでのみ総ヒット数を記録
+                    is_first_fetch = False
+                    total_hits_for_this_query = total_hits
+                    page["total_hits"] = total_hits
+                    if total_hits == 0:
+                        page["messages"].append(("info", "  -> 論文が見つかりませんでした。"))
+                        if on_page is not None:
+                            on_page(page)
+                        yield page
+                        break
+                if search_sleep > 0:
+                    time.sleep(search_sleep)
+            except Exception as search_e:
+                page["messages"].append(("error", f"  -> !! 検索エラー: クエリ '{query}' (開始位置 {start_index}) で失敗しました。詳細: {search_e}"))
+                page["is_last_page"] = False
+                yield page
+                break
+
+            if not articles:
+                page["messages"].append(("info", "  -> このページの論文が見つかりませんでした。クエリを終了します。"))
+                yield page
+                break
+
+            page["articles"] = articles
+            page["next_start_index"] = start_index + search_count
+            page["is_last_page"] = False
+            if on_page is not None and not on_page(page):
+                page["messages"].append(("info", "  -> このページの新規論文の割合が基準を下回ったため、このクエリを終了します。"))
+                page["is_last_page"] = True
+                yield page
+                break
+            yield page
+
+            # ループ継続判定: 次の開始位置を計算
+            start_index += search_count
+
+
+class SearchPrefetcher:
+    """
+    検索ページをバックグラウンドスレッドで先読みするページネーター。
+    処理側がページNの論文をダウンロード・変換している間に、ページN+1（や次のキーワードの1ページ目）を取得する。
+
+    先読みしたページは有界キュー（最大 lookahead_pages ページ）に入るため、
+    処理中でない論文がメモリに溜まり続けることはなく、検索APIの利用もリミッターのレーン内に収まる。
+    """
+
+    def __init__(
+        self,
+        jstage_client: JStageClient,
+        queries: List[str],
+        search_count: int,
+        max_papers_per_keyword: int,
+        lookahead_pages: int = 2,
+        search_sleep: float = 0.0,
+        start_indexes: Optional[Dict[str, int]] = None,
+        on_page: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        self._pages = iter_search_pages(
+            jstage_client, queries, search_count, max_papers_per_keyword, search_sleep, start_indexes, on_page
+        )
+        self.lookahead_pages = lookahead_pages
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, lookahead_pages))
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def _put(self, item) -> bool:
+        """停止要求を確認しながらキューに入れる。停止された場合は False。"""
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for page in self._pages:
+                if not self._put(page):
+                    return
+        except BaseException as e:  # 予期せぬエラーは処理側で再送出する
+            self._error = e
+        finally:
+            self._put(_END_OF_PAGES)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self.lookahead_pages <= 0:
+            # 先読みなし: 呼び出し元のスレッドで順に検索する
+            yield from self._pages
+            return
+
+        self._thread = threading.Thread(target=self._run, name="SearchPrefetcher", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END_OF_PAGES:
+                    break
+                yield item
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.stop()
+
+    def stop(self):
+        """先読みスレッドを停止する。"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
@@ -7,6 +7,14 @@ from dotenv import load_dotenv
 DEFAULT_SEARCH_COUNT_PER_KEYWORD = 800 # 実験用に20のまま
 DEFAULT_MAX_QUERIES = 5000
 DEFAULT_MAX_PAPERS_PER_KEYWORD = 1000 # 実験用に20のまま
+DEFAULT_PREFETCH_PAGES = 2
+DEFAULT_DOWNLOAD_WORKERS = 2
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_TERMS = 2
+DEFAULT_MIN_PAGE_NOVELTY = 0.1
+DEFAULT_BENCH_ARTICLES = 40
+DEFAULT_BENCH_KEYWORDS = 3
+DEFAULT_BENCH_WORKERS = 4
 
 # search_keywords.py のリスト名と、引数で使う短い名前を対応させる
 KEYWORD_LIST_MAP = {
@@ -71,9 +79,22 @@ def main():
         help=(
             "検索クエリの生成モードを選択 (default: single)。"
             "'single': --keyword-lists で指定されたリストの単一キーワードのみ（安全・推奨）。"
-            "'combination': 全リストのキーワードを総当たりで組み合わせる（非推奨・IPブロックのリスク有）。"
+            "'combination': --keyword-lists のリストのキーワードを組み合わせ、ヒット件数を確認しながら"
+            "新しい論文が多く得られる見込みの順にクエリを選ぶ（ヒット件数の確認にも検索APIを使用します）。"
         ),
     )
+    parser_p1.add_argument(
+        "--max-terms",
+        type=int,
+        default=DEFAULT_MAX_TERMS,
+        help=f"combinationモードで組み合わせるキーワードの最大数 (デフォルト: {DEFAULT_MAX_TERMS})",
+    )
+    parser_p1.add_argument(
+        "--max-probes",
+        type=int,
+        default=0,
+        help="combinationモードで、ヒット件数を確認する検索の最大回数 (0で無制限, デフォルト: 0)",
+    )
     parser_p1.add_argument(
         "--keyword-lists",
         nargs="+",  # 1つ以上の引数をリストとして受け取る
@@ -88,19 +109,196 @@ def main():
     parser_p1.add_argument(
         "--resume",
         action="store_true",  # この引数が指定されると True になる
-        help="中断した箇所から処理を再開します。'output/pipeline_1_processed_keywords.log' を参照します。"
+        help="中断した箇所から処理を再開します。状態ストア 'output/pipeline_1_state.sqlite3' のキーワードの進捗を参照します。"
+    )
+
+    parser_p1.add_argument(
+        "--prefetch-pages",
+        type=int,
+        default=DEFAULT_PREFETCH_PAGES,
+        help=f"論文の処理中に裏で先読みしておく検索ページ数 (0で先読みしない, デフォルト: {DEFAULT_PREFETCH_PAGES})",
+    )
+
+    parser_p1.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help=(
+            "Gemini変換を並行して行うワーカー数。1以上を指定すると、ダウンロード・変換・保存を"
+            "段階ごとのワーカーで並行処理するエンジンを使用します (0で従来の逐次処理, デフォルト: 0)"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--download-workers",
+        type=int,
+        default=DEFAULT_DOWNLOAD_WORKERS,
+        help=f"--workers 指定時の、論文ダウンロードのワーカー数 (デフォルト: {DEFAULT_DOWNLOAD_WORKERS})",
+    )
+
+    parser_p1.add_argument(
+        "--reconvert-from-store",
+        action="store_true",
+        help=(
+            "検索・ダウンロードを行わず、生データストア (output/raw_article_store) に保存済みの論文から"
+            "Markdownを再生成します。プロンプトやモデルを変更した場合に使用します。"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--frontier",
+        action="store_true",
+        help=(
+            "先に全キーワードの検索を行い、DOIで重複排除した論文一覧 (フロンティア) を作成してから変換します。"
+            "変換前にユニークな論文数のレポートを出力します。"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--harvest-only",
+        action="store_true",
+        help="検索とフロンティアの作成・レポート出力のみを行い、LLMによる変換は行いません。",
+    )
+
+    parser_p1.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Markdown変換を Gemini Batch API のジョブにまとめて行います（結果は完了後に保存）。"
+            "送信済みのジョブは 'output/batch_jobs' に記録され、再実行時に結果を受け取ります。"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"--batch 指定時の、1ジョブあたりの論文数 (デフォルト: {DEFAULT_BATCH_SIZE})",
+    )
+
+    parser_p1.add_argument(
+        "--batch-backend",
+        type=str,
+        default="gemini",
+        choices=["gemini", "local"],
+        help=(
+            "--batch 指定時のバックエンド (default: gemini)。"
+            "'local': Batch API を使わず、各リクエストを通常のAPI呼び出しで処理します（動作確認用）。"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--yield-scheduling",
+        action="store_true",
+        help=(
+            "キーワードごとの収穫の実績（新規/既知の論文数）を使って検索を絞り込みます。"
+            "新規論文がほとんどない飽和したキーワードは検索せず、新規論文の割合が "
+            "--min-page-novelty を下回ったページでそのキーワードのページ送りを終了します。"
+        ),
+    )
+
+    parser_p1.add_argument(
+        "--min-page-novelty",
+        type=float,
+        default=DEFAULT_MIN_PAGE_NOVELTY,
+        help=f"--yield-scheduling 指定時の、ページ送りを続ける新規論文の割合の下限 (デフォルト: {DEFAULT_MIN_PAGE_NOVELTY})",
+    )
+
+    parser_p1.add_argument(
+        "--yield-report",
+        action="store_true",
+        help="検索・変換を行わず、状態ストアに記録したキーワードごとの収穫レポートを出力します。",
+    )
+
+    parser_p1.add_argument(
+        "--record-llm",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Gemini の応答（テキスト・応答時間・トークン数）を JSONL ファイルに記録します。記録は bench コマンドで再生できます。",
     )
 
     # 4. "p234" コマンドのパーサーを作成
-    subparsers.add_parser("p234", help="既存のMarkdownから各種データセット(P2, P3, P4)を生成する")
+    parser_p234 = subparsers.add_parser("p234", help="既存のMarkdownから各種データセット(P2, P3, P4)を生成する")
+    parser_p234.add_argument(
+        "--replay",
+        action="store_true",
+        help=(
+            "LLMの応答キャッシュ 'output/cache/llm_responses' からのみ応答し、APIを呼び出しません。"
+            "キャッシュにない呼び出しはエラーになります（同じ結果での再実行・後段の処理のデバッグ用）。"
+        ),
+    )
+    parser_p234.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="LLMの応答キャッシュを使わず、すべての呼び出しでAPIを呼び出します。",
+    )
+
+    # 5. "bench" コマンドのパーサーを作成
+    parser_bench = subparsers.add_parser(
+        "bench", help="偽の Gemini / J-STAGE に対してP1を実行し、スループットを計測する（APIは使用しない）"
+    )
+    parser_bench.add_argument(
+        "--workers", type=int, default=DEFAULT_BENCH_WORKERS,
+        help=f"Gemini変換のワーカー数 (デフォルト: {DEFAULT_BENCH_WORKERS})",
+    )
+    parser_bench.add_argument(
+        "--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+        help=f"論文ダウンロードのワーカー数 (デフォルト: {DEFAULT_DOWNLOAD_WORKERS})",
+    )
+    parser_bench.add_argument(
+        "--articles", type=int, default=DEFAULT_BENCH_ARTICLES,
+        help=f"偽の J-STAGE に用意する論文数 (デフォルト: {DEFAULT_BENCH_ARTICLES})",
+    )
+    parser_bench.add_argument(
+        "--keywords", type=int, default=DEFAULT_BENCH_KEYWORDS,
+        help=f"検索するキーワード数 (デフォルト: {DEFAULT_BENCH_KEYWORDS})",
+    )
+    parser_bench.add_argument(
+        "--from-store", action="store_true",
+        help="合成の論文の代わりに、生データストア (output/raw_article_store) に保存済みの論文を再生します。",
+    )
+    parser_bench.add_argument(
+        "--pdf", type=str, default=None,
+        help="合成の論文に使うPDF (デフォルト: file.pdf。なければテキストレイヤー付きのPDFを合成)",
+    )
+    parser_bench.add_argument(
+        "--pdf-ratio", type=float, default=0.8,
+        help="PDFを提供する雑誌の割合。残りはHTMLのみを返します (デフォルト: 0.8)",
+    )
+    parser_bench.add_argument(
+        "--gemini-recording", type=str, default=None, metavar="PATH",
+        help="p1 --record-llm で記録した応答を再生します（未指定時は合成のMarkdownを返します）。",
+    )
+    parser_bench.add_argument(
+        "--gemini-latency", type=str, default="2,8",
+        help="偽の Gemini の応答時間 '中央値,p95'（秒, デフォルト: 2,8）。空文字列で記録の応答時間を使用します。",
+    )
+    parser_bench.add_argument("--gemini-error-rate", type=float, default=0.0, help="偽の Gemini が 500 を返す確率 (デフォルト: 0)")
+    parser_bench.add_argument("--gemini-throttle-rate", type=float, default=0.0, help="偽の Gemini が 429 を返す確率 (デフォルト: 0)")
+    parser_bench.add_argument(
+        "--jstage-latency", type=str, default="0.2,1",
+        help="偽の J-STAGE の応答時間 '中央値,p95'（秒, デフォルト: 0.2,1）",
+    )
+    parser_bench.add_argument("--jstage-error-rate", type=float, default=0.0, help="偽の J-STAGE が 503 を返す確率 (デフォルト: 0)")
+    parser_bench.add_argument(
+        "--jstage-interval", type=float, default=0.0,
+        help="偽の J-STAGE へのアクセス間隔（秒, デフォルト: 0）。実際のリミッター設定での計測に使います。",
+    )
+    parser_bench.add_argument("--seed", type=int, default=None, help="応答時間・エラーの乱数のシード")
+    parser_bench.add_argument(
+        "--work-dir", type=str, default=None,
+        help="出力・状態ストアを作る作業フォルダ (デフォルト: 一時フォルダ)",
+    )
 
-    # 5. 引数を解析
+    # 6. 引数を解析
     args = parser.parse_args()
 
-    # APIキーのチェックを一度だけ実行
-    check_api_key()
+    # APIキーのチェックを一度だけ実行（リプレイモード・ベンチマークはAPIを呼び出さないため不要）
+    if args.command != "bench" and not getattr(args, "replay", False):
+        check_api_key()
 
-    # 6. コマンドに基づいて処理を分岐
+    # 7. コマンドに基づいて処理を分岐
     if args.command == "p1":
         print("[メイン] パイプライン1 (RAGソース生成) を開始します...")
         try:
@@ -120,13 +318,19 @@ def main():
         try:
             import run_dataset_generation
 
-            run_dataset_generation.main()
+            run_dataset_generation.main(args)
         except ImportError:
             print("エラー: run_dataset_generation.py が見つかりません。")
             print(f"  [詳細] これが本当の原因である可能性が高いです: {e}")
         except Exception as e:
             print(f"データセット生成中に予期せぬエラーが発生しました: {e}")
 
+    elif args.command == "bench":
+        print("[メイン] 偽の Gemini / J-STAGE でパイプライン1のベンチマークを開始します...")
+        import run_benchmark
+
+        run_benchmark.run(args)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,23 @@
 import os
+import mmap
+import time
+import threading
+import contextlib
+import types as pytypes
+from concurrent.futures import ThreadPoolExecutor, wait, CancelledError, FIRST_EXCEPTION
 from google import genai
 from google.genai import types  # Part.from_bytes を使用するために必須
+from google.genai import errors as genai_errors
 from utils.jstage_client import JStageClient
-from utils.text_extractor import extract_text_from_html
+from utils.text_extractor import extract_text_from_html, extract_text_from_pdf, assess_text_quality, open_pdf
+from utils.article_store import RawArticleStore
+from utils.markdown_chunks import (
+    plan_page_ranges, split_text_into_pages, extract_pdf_pages, count_pdf_pages, stitch_markdown_chunks
+)
+from core.client_registry import ClientRegistry, get_default_registry
+from core.model_router import apply_route_config, validate_markdown_output
+from core.llm_gateway import is_retryable_error
+from utils.article_resolver import journal_key_from_url
 
 # 定数定義
 
@@ -152,15 +167,82 @@ MARKDOWN_GENERATION_PROMPT = """
 
 
 MARKDOWN_GENERATION_PROMPT_FOR_TEXT = MARKDOWN_GENERATION_PROMPT + "\n【論文テキスト】\n{article_text}"
+# 同期呼び出しでは、全論文で共通の MARKDOWN_GENERATION_PROMPT をコンテキストキャッシュに登録して参照する。
+# 論文をまたいで使い回すため、論文ごとのキャッシュより長い有効期間にする
+MARKDOWN_PROMPT_CACHE_TTL_SECONDS = 3600
+
+# Markdown変換に使用するモデル（バッチ変換で使用する。同期呼び出しでは ModelRouter が論文ごとに選ぶ）
+# MARKDOWN_MODEL_NAME = "gemini-2.5-flash-lite"
+MARKDOWN_MODEL_NAME = "gemini-2.5-flash"
+MARKDOWN_THINKING_BUDGET = 24576
+
+# テキスト層の品質が十分なPDFは、PDFをそのまま送らず、ローカルで抽出したテキストを送る（P1_PDF_TEXT_ROUTE=0 で無効）
+PDF_TEXT_ROUTE_ENABLED = os.getenv("P1_PDF_TEXT_ROUTE", "1") != "0"
+# テキストを送る条件: 1ページあたりの平均文字数・テキスト層があるページの割合・文字化けの割合・想定外の文字の割合
+PDF_TEXT_MIN_CHARS_PER_PAGE = int(os.getenv("P1_PDF_TEXT_MIN_CHARS_PER_PAGE", 300))
+PDF_TEXT_MIN_PAGE_RATIO = 0.8
+PDF_TEXT_MAX_GARBLED_RATIO = float(os.getenv("P1_PDF_TEXT_MAX_GARBLED_RATIO", 0.01))
+PDF_TEXT_MAX_UNEXPECTED_RATIO = 0.05
+
+# 変換の経路（RouteStats に記録する名前。分割変換した場合は末尾に "_chunked" を付ける）
+ROUTE_PDF = "pdf"
+ROUTE_PDF_TEXT = "pdf_text"
+ROUTE_HTML = "html"
+
+# 長い論文を重なりのあるページ範囲に分け、並行して変換する（P1_CHUNKED_CONVERSION=1 で有効）
+CHUNKED_CONVERSION_ENABLED = os.getenv("P1_CHUNKED_CONVERSION", "0") == "1"
+# 分割するしきい値（ページ数、またはテキストの文字数）
+CHUNK_MIN_PAGES = int(os.getenv("P1_CHUNK_MIN_PAGES", 16))
+CHUNK_MIN_CHARS = int(os.getenv("P1_CHUNK_MIN_CHARS", 60000))
+# 1チャンクのページ数・前のチャンクと重ねるページ数
+CHUNK_PAGES = int(os.getenv("P1_CHUNK_PAGES", 8))
+CHUNK_OVERLAP_PAGES = int(os.getenv("P1_CHUNK_OVERLAP_PAGES", 1))
+# ページ情報のないテキスト（HTML）を分割する際の、1疑似ページあたりの文字数
+CHUNK_PSEUDO_PAGE_CHARS = 3000
+# 1つの論文のチャンクを並行して変換する数（全体の同時実行数は Gemini のコントローラーが制御する）
+CHUNK_WORKERS = int(os.getenv("P1_CHUNK_WORKERS", 4))
+# チャンクごとの試行回数（一時的なエラーで失敗したチャンクだけを再試行する）
+CHUNK_MAX_ATTEMPTS = 3
+
+CHUNK_PROMPT_NOTE = """
+---
+【分割変換についての注意】
+この入力は長い論文の一部（{position}）です。
+- 入力に含まれる範囲だけを変換し、前後の部分を推測して補完しないでください。
+- 論文の途中から始まる場合も、元の論文の章・節の構造に従って `##` / `###` 見出しを使ってください（章の途中から始まる場合は、その章の見出しを繰り返してかまいません）。
+"""
 
 
-def process_pipeline_1(job_data: dict, gemini_api_key: str) -> dict:
+def process_pipeline_1(
+    job_data: dict,
+    gemini_api_key: str,
+    article_store: RawArticleStore | None = None,
+    clients: ClientRegistry | None = None,
+    chunked: bool | None = None,
+) -> dict:
     """
     パイプライン1のメイン処理。論文URLから構造化Markdownを生成する。
     (インラインデータ方式に修正)
+    article_store が指定された場合、ダウンロードした生データを保存し、後から再変換できるようにする。
+    クライアントは記事ごとに生成せず、clients（未指定時はプロセス既定のレジストリ）から受け取る。
+    chunked=True の場合、長い論文はページ範囲に分けて並行して変換する（None の場合は P1_CHUNKED_CONVERSION に従う）。
     """
-    client = genai.Client(api_key=gemini_api_key)
-    jstage_client = JStageClient()
+    download = download_article(job_data, article_store=article_store, clients=clients)
+    return convert_downloaded_article(download, gemini_api_key, clients=clients, chunked=chunked)
+
+
+def download_article(
+    job_data: dict,
+    article_store: RawArticleStore | None = None,
+    clients: ClientRegistry | None = None,
+) -> dict:
+    """
+    パイプライン1のダウンロード段階。論文本体をスプールファイルに取得し、生データストアに保存する。
+    job_data / body（SpooledArticle）/ content_type を辞書で返す。
+    body は convert_downloaded_article で変換後に削除される（変換しない場合は body.close() を呼ぶこと）。
+    """
+    clients = clients or get_default_registry()
+    jstage_client: JStageClient = clients.get_jstage_client()
 
     # url = job_data.get("url")
     pdf_url_to_try = job_data.get("url")
@@ -171,17 +253,36 @@ def process_pipeline_1(job_data: dict, gemini_api_key: str) -> dict:
     metadata = job_data.get("metadata", {})
     html_url_fallback = metadata.get("debug_original_url")
 
+    # 雑誌ごとの実績と軽量プローブで、最初に本体をダウンロードするURLを決める
+    # (HTMLしか返さない雑誌では、失敗するPDFのダウンロードを省略する)
+    resolver = clients.get_article_resolver()
+    first_url = resolver.choose_url(pdf_url_to_try, html_url_fallback)
+
     # content, content_type = jstage_client.download_article_content(url)
-    content, content_type = jstage_client.download_article_content(pdf_url_to_try)
+    # 本体はスプールファイルにストリーミングし、メモリには載せない（PDF URLは先頭が %PDF でなければ即中断）
+    download = jstage_client.stream_article(first_url, expect_pdf=(first_url == pdf_url_to_try))
+    body, content_type = (download["body"], download["content_type"]) if download else (None, None)
 
     # --- DEBUGGING START ---
     # ユーザーのデバッグリクエストに対応
-    content_length_for_debug = len(content) if content else 0
+    content_length_for_debug = body.size if body else 0
     print(f"    [DEBUG] ダウンロード試行。タイプ: {content_type}, サイズ: {content_length_for_debug} bytes")
 
-    is_pdf_success = content and content_type and "pdf" in content_type
+    is_pdf_success = body and content_type and "pdf" in content_type
+
+    if download and first_url == pdf_url_to_try and html_url_fallback and html_url_fallback != pdf_url_to_try:
+        # 書き換えたPDF URLの成否を雑誌ごとに記録する（通信エラーは記録しない）
+        resolver.record_result(pdf_url_to_try, bool(is_pdf_success))
+
+    if first_url != pdf_url_to_try:
+        # PDFの取得を省略してHTML URLを直接ダウンロードした場合
+        if not body or not content_type:
+            raise ConnectionError(f"HTMLのダウンロードに失敗しました。HTML: {html_url_fallback}")
+        job_data["url"] = html_url_fallback
 
-    if not is_pdf_success:
+    elif not is_pdf_success:
+        if body:
+            body.close()
         print(f"    [DEBUG] 1回目のPDFダウンロード失敗（またはPDFでない）。HTML URLにフォールバックします。")
         print(f"    [DEBUG]   -> フォールバックURL: {html_url_fallback}")
         
@@ -190,12 +291,15 @@ def process_pipeline_1(job_data: dict, gemini_api_key: str) -> dict:
             raise ConnectionError(f"PDFダウンロードに失敗。フォールバック先のHTML URLもありません。URL: {pdf_url_to_try}")
 
         # HTML URLで再試行
-        content, content_type = jstage_client.download_article_content(html_url_fallback)
-        content_length_for_debug = len(content) if content else 0
+        download = jstage_client.stream_article(html_url_fallback)
+        body, content_type = (download["body"], download["content_type"]) if download else (None, None)
+        content_length_for_debug = body.size if body else 0
         print(f"    [DEBUG] ダウンロード試行 (2回目: HTML URL)。タイプ: {content_type}, サイズ: {content_length_for_debug} bytes")
 
-        if not content or not content_type or "html" not in content_type:
+        if not body or not content_type or "html" not in content_type:
             # 2回目も失敗
+            if body:
+                body.close()
             raise ConnectionError(f"PDFとHTMLの両方のダウンロードに失敗しました。PDF: {pdf_url_to_try}, HTML: {html_url_fallback}")
 
         # ★重要★ HTMLフォールバックが成功した場合、source_urlもHTMLのものに差し替える
@@ -213,35 +317,445 @@ def process_pipeline_1(job_data: dict, gemini_api_key: str) -> dict:
     # if not content or not content_type:
     #     raise ConnectionError(f"URLからのコンテンツダウンロードに失敗しました: {url}")
 
-    # model_name = "gemini-2.5-flash-lite"
-    model_name = "gemini-2.5-flash"
+    if article_store and metadata.get("doi"):
+        # 生データを保存しておき、プロンプト変更時などに再ダウンロードせず再変換できるようにする
+        try:
+            article_store.put_file(
+                doi=metadata["doi"],
+                path=body.path,
+                content_type=content_type,
+                final_url=download["final_url"],
+                metadata={**metadata, "source_url": job_data["url"]},
+            )
+        except BaseException:
+            body.close()
+            raise
+
+    return {"job_data": job_data, "body": body, "content_type": content_type}
+
+
+def convert_downloaded_article(
+    download: dict, gemini_api_key: str, clients: ClientRegistry | None = None, chunked: bool | None = None
+) -> dict:
+    """
+    パイプライン1の変換段階。download_article の結果をMarkdownに変換し、スプールファイルを削除する。
+    """
+    with download["body"] as body:
+        # 変換にはメモリマップを渡す
+        return convert_article_to_markdown(
+            download["job_data"], body.open_mmap(), download["content_type"], gemini_api_key,
+            clients=clients, chunked=chunked,
+        )
+
+
+def reconvert_from_store(
+    doi: str,
+    article_store: RawArticleStore,
+    gemini_api_key: str,
+    clients: ClientRegistry | None = None,
+    chunked: bool | None = None,
+) -> dict:
+    """
+    生データストアに保存済みの論文から、HTTPアクセスなしでMarkdownを再生成する。
+    """
+    record = article_store.get(doi)
+    if record is None:
+        raise KeyError(f"生データストアに論文が見つかりません: {doi}")
+
+    metadata = dict(record.get("metadata", {}))
+    source_url = metadata.pop("source_url", record["final_url"])
+    job_data = {"pipeline": "rag_source", "url": source_url, "metadata": metadata}
+    return convert_article_to_markdown(
+        job_data, record["content"], record["content_type"], gemini_api_key, clients=clients, chunked=chunked
+    )
+
+
+def convert_article_to_markdown(
+    job_data: dict,
+    content: bytes | mmap.mmap,
+    content_type: str,
+    gemini_api_key: str,
+    clients: ClientRegistry | None = None,
+    chunked: bool | None = None,
+) -> dict:
+    """
+    ダウンロード済みの論文コンテンツ（PDF/HTML）をGeminiで構造化Markdownに変換する。
+    content は bytes のほか、スプールファイルのメモリマップも受け付ける。
+    chunked=True（None の場合は P1_CHUNKED_CONVERSION）で、しきい値を超える長い論文は
+    重なりのあるページ範囲に分けて並行して変換し、結果をつなぎ合わせる。
+    """
+    clients = clients or get_default_registry()
+    client = clients.get_genai_client(gemini_api_key)
+    # 同時実行数はレート制限の応答に応じて自動調整する（429/503 は再試行される）
+    gemini_controller = clients.get_gemini_controller()
+    # Markdown変換の呼び出しは LLM ゲートウェイ経由で行う（タイムアウト・一時的なエラーの再試行・集計）
+    gateway = clients.get_llm_gateway(gemini_api_key)
+
+    route_stats = clients.get_conversion_route_stats()
+
+    # テキスト層の品質が十分なPDFは、抽出したテキストを送る（スキャン・文字化けしたPDFのみPDFをそのまま送る）
+    pdf_route = choose_pdf_route(content) if "pdf" in content_type else None
+    route = pdf_route["route"] if pdf_route else ROUTE_HTML
+    pages = pdf_route["page_count"] if pdf_route else 0
+    # モデル・思考予算は、経路・長さ・テキスト層の品質・雑誌の失敗実績から選ぶ
+    router = clients.get_model_router()
+    journal = journal_key_from_url(job_data.get("url"))
+    quality = pdf_route["quality"] if pdf_route else None
+
+    if chunked if chunked is not None else CHUNKED_CONVERSION_ENABLED:
+        chunks = plan_conversion_chunks(content, content_type, pdf_route)
+        if len(chunks) > 1:
+            text_chars = sum(len(chunk.get("text") or "") for chunk in chunks)
+            decision = router.route_markdown(route, pages=pages, text_chars=text_chars, quality=quality, journal=journal)
+            return convert_article_in_chunks(
+                job_data, chunks, route, pages, clients, gemini_api_key, decision, content=content
+            )
+
+    # 大きなPDFは Files API に一度だけアップロードし、再試行・再変換ではそのハンドルを参照する
+    file_cache = clients.get_gemini_file_cache()
+    uploaded_file = None
+    if route == ROUTE_PDF and file_cache.should_upload(len(content)):
+        uploaded_file = file_cache.get_or_upload(client, content, "application/pdf", controller=gemini_controller)
+
+    request = build_conversion_request(
+        job_data, content, content_type, uploaded_file=uploaded_file, pdf_route=pdf_route, cache_prefix=True
+    )
+    if isinstance(request["contents"], str):
+        text_chars = len(request["contents"])
+    else:
+        text_chars = len(pdf_route["text"]) if pdf_route else 0
+    decision = router.route_markdown(route, pages=pages, text_chars=text_chars, quality=quality, journal=journal)
+    print(f"  [Pipeline 1] モデル: {decision['model']} (思考予算 {decision['thinking_budget']}, {decision['reason']})")
+
+    def generate(decision: dict) -> dict:
+        nonlocal request, uploaded_file
+        try:
+            return gateway.generate(**apply_route_to_request(request, decision), purpose="p1_markdown")
+        except genai_errors.ClientError as e:
+            # キャッシュしたファイルがサーバー側で削除・失効していた場合は、アップロードし直して1回だけ再実行する
+            if uploaded_file is None or e.code not in (403, 404):
+                raise
+            print(f"  [Pipeline 1] アップロード済みファイル {uploaded_file['name']} を利用できません ({e.code})。再アップロードします...")
+            file_cache.invalidate(uploaded_file["sha256"])
+            uploaded_file = file_cache.get_or_upload(client, content, "application/pdf", controller=gemini_controller)
+            request = build_conversion_request(
+                job_data, content, content_type, uploaded_file=uploaded_file, pdf_route=pdf_route, cache_prefix=True
+            )
+            return gateway.generate(**apply_route_to_request(request, decision), purpose="p1_markdown")
+
+    started_at = time.monotonic()
+    try:
+        # 出力の検証に失敗した場合は、ルーターが上位のモデル・思考予算で再実行する
+        result, decision = router.call(
+            decision, generate, validate=lambda result: validate_markdown_output(result, text_chars)
+        )
+        response = result["response"]
+    except Exception:
+        route_stats.record(route, time.monotonic() - started_at, success=False, pages=pages, input_bytes=len(content))
+        raise
+
+    elapsed = time.monotonic() - started_at
+    usage = getattr(response, "usage_metadata", None)
+    route_stats.record(route, elapsed, pages=pages, input_bytes=len(content), usage_metadata=usage)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    cached_tokens = getattr(usage, "cached_content_token_count", None)
+    print(
+        f"  [Pipeline 1] 変換完了 (経路: {route}, モデル: {decision['profile']}, {elapsed:.1f}秒"
+        + (f", 入力 {prompt_tokens} トークン" if prompt_tokens else "")
+        + (f" (うちキャッシュ {cached_tokens})" if cached_tokens else "")
+        + ")"
+    )
+    return finalize_markdown(job_data, response.text)
+
+
+def plan_conversion_chunks(content: bytes | mmap.mmap, content_type: str, pdf_route: dict | None) -> list:
+    """
+    しきい値を超える長い論文を、重なりのあるページ範囲のチャンクに分ける。
+    各チャンクは index / position（プロンプトに示す範囲）/ text または page_range（PDFのページ範囲）を持つ辞書。
+    ページ範囲ごとのPDFは、メモリを論文のサイズに比例して使わないよう、変換時に1つずつ作成する（convert_article_in_chunks）。
+    分割しない場合は空のリストを返す。
+    """
+    if "pdf" in content_type and pdf_route is not None and pdf_route["route"] == ROUTE_PDF:
+        # PDFをそのまま送る経路: ページ範囲ごとのPDFに分ける
+        page_count = pdf_route["page_count"] or count_pdf_pages(content)
+        if page_count < CHUNK_MIN_PAGES:
+            return []
+        return [
+            {
+                "index": index,
+                "position": f"全{page_count}ページ中の {start + 1}〜{end} ページ",
+                "page_range": (start, end),
+            }
+            for index, (start, end) in enumerate(plan_page_ranges(page_count, CHUNK_PAGES, CHUNK_OVERLAP_PAGES))
+        ]
+
+    if "pdf" in content_type and pdf_route is not None:
+        # 抽出したテキストを送る経路: ページごとのテキストを範囲ごとにまとめる
+        page_texts = pdf_route["pages"]
+        if len(page_texts) < CHUNK_MIN_PAGES and len(pdf_route["text"]) < CHUNK_MIN_CHARS:
+            return []
+        unit = "ページ"
+    elif "html" in content_type:
+        text = extract_text_from_html(bytes(content))
+        if len(text) < CHUNK_MIN_CHARS:
+            return []
+        page_texts = split_text_into_pages(text, CHUNK_PSEUDO_PAGE_CHARS)
+        unit = "区間"
+    else:
+        return []
+
+    return [
+        {
+            "index": index,
+            "position": f"全{len(page_texts)}{unit}中の {start + 1}〜{end} {unit}",
+            "text": "\n\n".join(page_texts[start:end]),
+        }
+        for index, (start, end) in enumerate(plan_page_ranges(len(page_texts), CHUNK_PAGES, CHUNK_OVERLAP_PAGES))
+    ]
 
 
-    if "pdf" in content_type:
+def build_chunk_request(chunk: dict, uploaded_file: dict | None = None, cache_prefix: bool = False) -> dict:
+    """
+    チャンク1つ分の generate_content の引数を作成する。
+    cache_prefix=True の場合は、MARKDOWN_GENERATION_PROMPT を contents に含めず、LLMGateway.generate の
+    cache_prefix / cache_ttl として返す（プロンプトを先頭に置き、コンテキストキャッシュから参照する）。
+    """
+    config = types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=MARKDOWN_THINKING_BUDGET))
+    note = CHUNK_PROMPT_NOTE.format(position=chunk["position"])
+    prompt = note if cache_prefix else MARKDOWN_GENERATION_PROMPT + note
+    if uploaded_file is not None:
+        contents = [types.Part.from_uri(file_uri=uploaded_file["uri"], mime_type=uploaded_file["mime_type"]), prompt]
+    elif chunk.get("pdf") is not None:
+        contents = [types.Part.from_bytes(data=chunk["pdf"], mime_type="application/pdf"), prompt]
+    else:
+        contents = prompt + "\n【論文テキスト】\n" + chunk["text"]
+    request = {"model": MARKDOWN_MODEL_NAME, "contents": contents, "config": config}
+    if cache_prefix:
+        request.update(cache_prefix=MARKDOWN_GENERATION_PROMPT, cache_ttl=MARKDOWN_PROMPT_CACHE_TTL_SECONDS)
+    return request
+
+
+def apply_route_to_request(request: dict, decision: dict) -> dict:
+    """generate_content の引数のモデル・思考予算を、ModelRouter の振り分け結果に置き換える。"""
+    return {**request, "model": decision["model"], "config": apply_route_config(decision, request["config"])}
+
+
+def convert_article_in_chunks(
+    job_data: dict,
+    chunks: list,
+    route: str,
+    pages: int,
+    clients: ClientRegistry,
+    gemini_api_key: str,
+    decision: dict | None = None,
+    content: bytes | mmap.mmap | None = None,
+) -> dict:
+    """
+    チャンクを並行して変換し、Markdownをつなぎ合わせる。
+    page_range を持つチャンクは、content（PDF）をコピーせずに一度だけ開き、変換するスレッドでそのページ範囲のPDFを作成する。
+    一時的なエラー（is_retryable_error）で失敗したチャンクは、そのチャンクだけを最大 CHUNK_MAX_ATTEMPTS 回まで再試行する。
+    decision（ModelRouter の振り分け結果）を渡した場合は、そのモデル・思考予算で変換し、
+    出力の検証に失敗したチャンクだけを上位のモデル・思考予算で再実行する（再試行は最後に使ったモデル・思考予算から始める）。
+    いずれかのチャンクが再試行できないエラーで失敗した場合は、まだ開始していないチャンクを取り消す。
+    """
+    router = clients.get_model_router()
+    decision = decision or router.route_markdown(route, pages=pages, journal=journal_key_from_url(job_data.get("url")))
+    client = clients.get_genai_client(gemini_api_key)
+    gemini_controller = clients.get_gemini_controller()
+    gateway = clients.get_llm_gateway(gemini_api_key)
+    file_cache = clients.get_gemini_file_cache()
+    usage_totals = {"prompt_token_count": 0, "candidates_token_count": 0, "cached_content_token_count": 0}
+    usage_lock = threading.Lock()
+    # MuPDF はスレッドセーフではないため、ページ範囲のPDFの作成は排他する
+    pdf_lock = threading.Lock()
+    source_pdf = None
+    # いずれかのチャンクが最終的に失敗したら、残りのチャンクは変換しない
+    failed = threading.Event()
+
+    def convert_chunk(chunk: dict) -> str:
+        if failed.is_set():
+            raise CancelledError(f"チャンク {chunk['index'] + 1}/{len(chunks)}: 他のチャンクの変換に失敗したため中止しました。")
+        if chunk.get("page_range") is not None:
+            with pdf_lock:
+                chunk = {**chunk, "pdf": extract_pdf_pages(source_pdf, *chunk["page_range"])}
+        # 出力の検証で上位のモデルに切り替えた場合は、再試行もそのモデルから始める
+        current_decision = decision
+
+        def generate(chunk_decision: dict, request: dict) -> dict:
+            nonlocal current_decision
+            current_decision = chunk_decision
+            return gateway.generate(**apply_route_to_request(request, chunk_decision), purpose="p1_markdown_chunk")
+
+        for attempt in range(1, CHUNK_MAX_ATTEMPTS + 1):
+            try:
+                uploaded_file = None
+                if chunk.get("pdf") is not None and file_cache.should_upload(len(chunk["pdf"])):
+                    uploaded_file = file_cache.get_or_upload(
+                        client, chunk["pdf"], "application/pdf", controller=gemini_controller
+                    )
+                request = build_chunk_request(chunk, uploaded_file, cache_prefix=True)
+                # 途中のチャンクは見出しで始まらないことがあるため、見出しの有無は検証しない
+                response = router.call(
+                    current_decision,
+                    lambda chunk_decision: generate(chunk_decision, request),
+                    validate=lambda result: validate_markdown_output(
+                        result, len(chunk.get("text") or ""), require_heading=False
+                    ),
+                )[0]["response"]
+                usage = getattr(response, "usage_metadata", None)
+                with usage_lock:
+                    for key in usage_totals:
+                        usage_totals[key] += getattr(usage, key, None) or 0
+                return response.text
+            except Exception as e:
+                if attempt >= CHUNK_MAX_ATTEMPTS or not is_retryable_error(e) or failed.is_set():
+                    failed.set()
+                    raise RuntimeError(f"チャンク {chunk['index'] + 1}/{len(chunks)} ({chunk['position']}) の変換に失敗しました: {e}") from e
+                print(f"  [Pipeline 1] チャンク {chunk['index'] + 1}/{len(chunks)} の変換に失敗しました ({attempt}/{CHUNK_MAX_ATTEMPTS}回目)。このチャンクだけを再試行します: {e}")
+                time.sleep(2 ** attempt)
+
+    print(
+        f"  [Pipeline 1] 長い論文のため、{len(chunks)} 個のチャンクに分けて変換します ({chunks[0]['position']} ...) "
+        f"モデル: {decision['model']} (思考予算 {decision['thinking_budget']}, {decision['reason']})"
+    )
+    route_stats = clients.get_conversion_route_stats()
+    started_at = time.monotonic()
+    needs_pdf = any(chunk.get("page_range") is not None for chunk in chunks)
+    try:
+        with open_pdf(content) if needs_pdf else contextlib.nullcontext() as source_pdf, ThreadPoolExecutor(
+            max_workers=max(1, min(CHUNK_WORKERS, len(chunks))), thread_name_prefix="P1Chunk"
+        ) as executor:
+            futures = [executor.submit(convert_chunk, chunk) for chunk in chunks]
+            wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [
+                future.exception() for future in futures
+                if future.done() and not future.cancelled() and future.exception() is not None
+                and not isinstance(future.exception(), CancelledError)
+            ]
+            if errors:
+                # まだ開始していないチャンクを取り消し、最初に失敗したチャンクのエラーを送出する
+                for future in futures:
+                    future.cancel()
+                raise errors[0]
+            markdown_chunks = [future.result() for future in futures]
+    except Exception:
+        route_stats.record(f"{route}_chunked", time.monotonic() - started_at, success=False, pages=pages)
+        raise
+
+    elapsed = time.monotonic() - started_at
+    route_stats.record(
+        f"{route}_chunked", elapsed, pages=pages, usage_metadata=pytypes.SimpleNamespace(**usage_totals)
+    )
+    print(f"  [Pipeline 1] 分割変換完了 (経路: {route}, {len(chunks)} チャンク, {elapsed:.1f}秒)")
+    return finalize_markdown(job_data, stitch_markdown_chunks(markdown_chunks))
+
+
+def choose_pdf_route(content: bytes | mmap.mmap) -> dict:
+    """
+    PDFのテキスト層を抽出して品質を評価し、変換の経路を決める。
+    route（ROUTE_PDF_TEXT: 抽出したテキストを送る / ROUTE_PDF: PDFをそのまま送る）, text, pages（ページごとのテキスト）,
+    page_count, quality, reason を持つ辞書を返す。
+    """
+    if not PDF_TEXT_ROUTE_ENABLED:
+        return {"route": ROUTE_PDF, "text": "", "pages": [], "page_count": 0, "quality": None, "reason": "テキスト経路は無効です"}
+
+    extraction = extract_text_from_pdf(content)
+    quality = assess_text_quality(extraction)
+    reasons = []
+    if quality["chars_per_page"] < PDF_TEXT_MIN_CHARS_PER_PAGE:
+        reasons.append(f"1ページあたりの文字数が少ない ({quality['chars_per_page']:.0f})")
+    if quality["text_page_ratio"] < PDF_TEXT_MIN_PAGE_RATIO:
+        reasons.append(f"テキスト層のないページがある ({quality['text_page_ratio']:.0%})")
+    if quality["garbled_ratio"] > PDF_TEXT_MAX_GARBLED_RATIO:
+        reasons.append(f"文字化け ({quality['garbled_ratio']:.1%})")
+    if quality["unexpected_ratio"] > PDF_TEXT_MAX_UNEXPECTED_RATIO:
+        reasons.append(f"想定外の文字 ({quality['unexpected_ratio']:.1%})")
+
+    return {
+        "route": ROUTE_PDF if reasons else ROUTE_PDF_TEXT,
+        "text": extraction["text"],
+        "pages": extraction["pages"],
+        "page_count": extraction["page_count"],
+        "quality": quality,
+        "reason": ", ".join(reasons) if reasons else "テキスト層の品質が十分です",
+    }
+
+
+def build_conversion_request(
+    job_data: dict,
+    content: bytes | mmap.mmap,
+    content_type: str,
+    uploaded_file: dict | None = None,
+    pdf_route: dict | None = None,
+    cache_prefix: bool = False,
+) -> dict:
+    """
+    論文コンテンツ（PDF/HTML）から、Markdown変換用の generate_content の引数（model / contents / config）を作成する。
+    (同期呼び出しとバッチ処理で共通)
+    PDFは choose_pdf_route の結果（pdf_route。未指定の場合はここで判定する）に従い、
+    テキスト層の品質が十分であれば抽出したテキストを、そうでなければPDFを送る。
+    uploaded_file（GeminiFileCache のエントリ）を渡した場合、PDFはインラインで送らずアップロード済みのファイルを参照する。
+    cache_prefix=True の場合（同期呼び出しのみ）は、MARKDOWN_GENERATION_PROMPT を contents に含めず、
+    LLMGateway.generate の cache_prefix / cache_ttl として返す（全論文で共通のプロンプトをコンテキストキャッシュから参照する）。
+    """
+    config = types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=MARKDOWN_THINKING_BUDGET))
+    prompt = None if cache_prefix else MARKDOWN_GENERATION_PROMPT
+    text_template = "\n【論文テキスト】\n{article_text}" if cache_prefix else MARKDOWN_GENERATION_PROMPT_FOR_TEXT
+
+    if "pdf" in content_type and uploaded_file is None:
+        pdf_route = pdf_route or choose_pdf_route(content)
+
+    if "pdf" in content_type and pdf_route is not None and pdf_route["route"] == ROUTE_PDF_TEXT:
+        # PDF処理フロー (ローカルで抽出したテキスト)
+        quality = pdf_route["quality"]
+        print(
+            f"  [Pipeline 1] PDFを検出。テキスト層から抽出したテキストを送信します "
+            f"({pdf_route['page_count']}ページ, 約{len(pdf_route['text'])}文字, "
+            f"PDF {len(content) / 1024:.0f}KB → テキスト {len(pdf_route['text'].encode('utf-8')) / 1024:.0f}KB, "
+            f"1ページあたり {quality['chars_per_page']:.0f}文字, 文字化け {quality['garbled_ratio']:.1%})"
+        )
+        contents = text_template.format(article_text=pdf_route["text"])
+
+    elif "pdf" in content_type and uploaded_file is not None:
+        # PDF処理フロー (アップロード済みファイルの参照)
+        print(f"  [Pipeline 1] PDFを検出。アップロード済みのファイル ({uploaded_file['name']}) を参照します...")
+        contents = [types.Part.from_uri(file_uri=uploaded_file["uri"], mime_type=uploaded_file["mime_type"])]
+        if prompt:
+            contents.append(prompt)
+
+    elif "pdf" in content_type:
         # PDF処理フロー (インラインデータ)
-        print("  [Pipeline 1] PDFを検出。インラインデータとして送信します...")
+        print(f"  [Pipeline 1] PDFを検出。インラインデータとして送信します ({pdf_route['reason']})...")
 
         # ファイルのバイトデータとプロンプトをリストにまとめる
-        contents = [types.Part.from_bytes(data=content, mime_type="application/pdf"), MARKDOWN_GENERATION_PROMPT]
-
-        response = client.models.generate_content(model=model_name, contents=contents,config=types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=24576)),)
-        markdown_body = response.text
+        # (インライン送信はリクエスト本体に bytes が必要なため、送信時のみメモリにコピーする)
+        contents = [types.Part.from_bytes(data=bytes(content), mime_type="application/pdf")]
+        if prompt:
+            contents.append(prompt)
 
     elif "html" in content_type:
         # HTML処理フロー
         print("  [Pipeline 1] HTMLを検出。テキストを抽出して送信します...")
-        extracted_text = extract_text_from_html(content)
+        extracted_text = extract_text_from_html(bytes(content))
         if not extracted_text:
             raise ValueError("HTMLからのテキスト抽出に失敗しました。")
         print(f"  -> テキスト抽出完了 (約{len(extracted_text)}文字)")
 
-        prompt = MARKDOWN_GENERATION_PROMPT_FOR_TEXT.format(article_text=extracted_text)
-        response = client.models.generate_content(model=model_name, contents=prompt,config=types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=24576)),)
-        markdown_body = response.text
+        contents = text_template.format(article_text=extracted_text)
 
     else:
         raise TypeError(f"サポートされていないコンテントタイプです: {content_type} (URL: {job_data.get('url')})")
 
+    request = {"model": MARKDOWN_MODEL_NAME, "contents": contents, "config": config}
+    if cache_prefix:
+        request.update(cache_prefix=MARKDOWN_GENERATION_PROMPT, cache_ttl=MARKDOWN_PROMPT_CACHE_TTL_SECONDS)
+    return request
+
+
+def finalize_markdown(job_data: dict, markdown_body: str | None) -> dict:
+    """
+    Geminiが生成した本文に YAML Frontmatter を付け、保存用の結果を返す。
+    """
     if not markdown_body:
         raise RuntimeError("Gemini APIから空の応答がありました。Markdownを生成できませんでした。")
 
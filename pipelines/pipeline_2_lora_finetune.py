@@ -1,10 +1,11 @@
 import os
 import json
-from google import genai
 from datetime import date
 from schemas import RehabPlanSchema # P2の「出力」スキーマ (英語キー)
 # utils/persona_generator.py から PatientPersona (入力の型ヒント用) をインポート
-from utils.persona_generator import PatientPersona 
+from core.client_registry import ClientRegistry, get_default_registry
+from core.model_router import apply_route_config
+from utils.persona_generator import PatientPersona, build_paper_context, PAPER_CONTEXT_CHARS
 
 # --- 日本語キー変換ロジック (gemini_client.py から移植・適合) ---
 
@@ -212,7 +213,7 @@ def convert_persona_to_japanese_dict(persona_data: dict) -> dict:
 # プロンプトテンプレート
 LORA_GENERATION_PROMPT_TEMPLATE = """
 あなたは、LoRAファインチューニング用の高品質な教師データを作成する専門家です。
-以下の【入力データ】（患者ペルソナと関連論文）を基に、**リハビリテーション総合実施計画書の全項目**を生成してください。
+先頭の【関連論文の内容】と、以下の【入力データ】（患者ペルソナ）を基に、**リハビリテーション総合実施計画書の全項目**を生成してください。
 出力は、指定されたJSONスキーマに厳密に従ってください。
 
 【入力データ】
@@ -223,13 +224,15 @@ LORA_GENERATION_PROMPT_TEMPLATE = """
 ペルソナの背景や希望、論文の知見を最大限に反映すること。
 """
 
-def process_full_plan_generation(job_data: dict, gemini_api_key: str) -> dict:
+def process_full_plan_generation(job_data: dict, gemini_api_key: str, clients: ClientRegistry = None) -> dict:
     """
     【新版】リハビリ総合実施計画書（全項目）を一括生成する関数
     ペルソナの入力キーを日本語に変換する処理を含む
     """
     print(f"  [Pipeline 2] LoRAデータ生成ジョブ(一括)を開始: {job_data.get('job_id')}")
-    client = genai.Client(api_key=gemini_api_key)
+    clients = clients or get_default_registry()
+    # LLM 呼び出しはゲートウェイ経由で行う（同時実行数の調整・再試行・構造化出力の解析を含む）
+    gateway = clients.get_llm_gateway(gemini_api_key)
 
     # 1. 必要なファイルを読み込む
     source_markdown_path = os.path.join("output", "pipeline_1_rag_source", job_data['source_markdown'])
@@ -256,9 +259,10 @@ def process_full_plan_generation(job_data: dict, gemini_api_key: str) -> dict:
     # (実際のアプリケーションのプロンプト形式に合わせる)
     input_data_for_dataset = {
         "患者情報": patient_persona_jp,
-        "関連論文": article_text[:10000], # RAGコンテキストとして論文を渡す（トークン数考慮）
+        "関連論文": article_text[:PAPER_CONTEXT_CHARS], # RAGコンテキストとして論文を渡す（トークン数考慮）
     }
-    input_data_json_string = json.dumps(input_data_for_dataset, ensure_ascii=False, indent=2)
+    # 論文はペルソナ・P3と共通の先頭部分（cache_prefix）として渡し、プロンプトの入力データには患者情報だけを含める
+    input_data_json_string = json.dumps({"患者情報": patient_persona_jp}, ensure_ascii=False, indent=2)
 
     # 4. プロンプトの構築
     prompt = LORA_GENERATION_PROMPT_TEMPLATE.format(
@@ -267,47 +271,22 @@ def process_full_plan_generation(job_data: dict, gemini_api_key: str) -> dict:
     
     print(f"    -> スキーマ 'RehabPlanSchema' に基づき全項目を一括生成します。")
 
-    parsed_response = None 
-
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite", # 全項目生成は高機能モデル推奨
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": RehabPlanSchema # ★計画書全体のスキーマ(英語キー)を指定
-                }
+        # 応答のパース（コードブロックの除去を含む）はゲートウェイが行い、失敗時は詳細付きの例外を送出する
+        # モデルはルーターが選ぶ（flash-lite から始め、構造化出力の解析に失敗した場合は上位のモデルで再実行する）
+        router = clients.get_model_router()
+        result, _ = router.call(
+            router.route_generation("p2_plan"),
+            lambda decision: gateway.generate(
+                model=decision["model"],
+                contents=prompt,
+                config=apply_route_config(decision),
+                schema=RehabPlanSchema, # ★計画書全体のスキーマ(英語キー)を指定
+                purpose="p2_plan",
+                cache_prefix=build_paper_context(article_text),
+            ),
         )
-
-        if hasattr(response, 'parsed') and response.parsed:
-            parsed_response = response.parsed
-        
-        elif hasattr(response, 'text') and response.text:
-            print("    -> API応答の自動パースに失敗。手動でのJSONクリーンアップを試みます...")
-            try:
-                clean_text = response.text.strip().lstrip("```json").rstrip("```").strip()
-                json_data = json.loads(clean_text)
-                parsed_response = RehabPlanSchema(**json_data)
-                print("    -> 手動クリーンアップ成功。")
-            
-            except Exception as parse_e:
-                print(f"    -> 手動クリーンアップ失敗: {parse_e}")
-                debug_info = {
-                    "message": "APIからのパース可能な応答がありませんでした (手動パースも失敗)。",
-                    "finish_reason": response.candidates[0].finish_reason.name if response.candidates else "N/A",
-                    "response_text": response.text,
-                    "manual_parse_error": str(parse_e)
-                }
-                raise ValueError(json.dumps(debug_info, ensure_ascii=False))
-        
-        if parsed_response is None:
-            debug_info = {
-                "message": "APIからパース可能な応答がありませんでした (応答テキストも空またはパース不能)。",
-                "finish_reason": response.candidates[0].finish_reason.name if response.candidates else "N/A",
-                "prompt_feedback": str(response.prompt_feedback),
-                "response_text": response.text if hasattr(response, 'text') else "N/A"
-            }
-            raise ValueError(json.dumps(debug_info, ensure_ascii=False))
+        parsed_response = result["parsed"]
 
     except Exception as e:
         print(f"    -> Gemini API呼び出し中にエラーが発生しました。詳細: {e}")
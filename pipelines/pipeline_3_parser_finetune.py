@@ -1,10 +1,15 @@
 import os
 import json
 from datetime import date
-from google import genai
 
 # from schemas import PATIENT_INFO_EXTRACTION_GROUPS # 古いP3スキーマ
-from utils.persona_generator import PatientPersona  # P3の「出力」としてペルソナのスキーマをインポート
+from core.client_registry import ClientRegistry, get_default_registry
+from core.model_router import apply_route_config, validate_text_output
+from utils.persona_generator import PatientPersona, build_paper_context  # P3の「出力」としてペルソナのスキーマをインポート
+
+
+# 生成した資料がこの文字数に満たない場合は、上位のモデルで再生成する
+MIN_MATERIALS_CHARS = 300
 
 
 def json_serial(obj):
@@ -27,9 +32,7 @@ REHAB_MATERIALS_CREATION_PROMPT_TEMPLATE = """
 【患者ペルソナ】
 {persona_json}
 
-【関連論文のコンテキスト】
-（参考情報として、このペルソナの元となった論文の抜粋を添付します）
-{article_text}
+（参考情報として、このペルソナの元となった論文の抜粋を先頭の【関連論文の内容】に添付しています）
 
 【要件】
 1.  **多様な文体**: セラピストによって書き方が違う状況を再現してください（例：箇条書き中心、単語の殴り書き、"である調"の詳細な記述、"ですます調"のポエム、SOAP形式など）。
@@ -40,13 +43,15 @@ REHAB_MATERIALS_CREATION_PROMPT_TEMPLATE = """
 """
 
 
-def process_parser_finetune_data_generation(job_data: dict, gemini_api_key: str) -> dict:
+def process_parser_finetune_data_generation(job_data: dict, gemini_api_key: str, clients: ClientRegistry = None) -> dict:
     """
     パイプライン3の本体。
     【新版】「架空のリハビリ資料（入力）」と「ペルソナJSON（出力）」のペアを生成する。
     """
     print(f"  [Pipeline 3] 情報抽出データ生成ジョブ（資料→ペルソナ）を開始: {job_data.get('job_id')}")
-    client = genai.Client(api_key=gemini_api_key)
+    clients = clients or get_default_registry()
+    # LLM 呼び出しはゲートウェイ経由で行う（同時実行数の調整・再試行を含む）
+    gateway = clients.get_llm_gateway(gemini_api_key)
 
     # --- 1. 必要なファイルを読み込む ---
     source_markdown_path = os.path.join("output", "pipeline_1_rag_source", job_data["source_markdown"])
@@ -68,15 +73,24 @@ def process_parser_finetune_data_generation(job_data: dict, gemini_api_key: str)
     print("    -> ステージ1: 架空のリハビリ資料（カルテメモ等）を生成中...")
     summary_prompt = REHAB_MATERIALS_CREATION_PROMPT_TEMPLATE.format(
         persona_json=json.dumps(persona_data, ensure_ascii=False, indent=2),
-        article_text=article_text[:4000],  # 論文の一部をコンテキストとして使用
     )
 
-    # この生成タスクは創造性が高いため、Proモデルと高めのtemperatureを推奨
-    response_summary = client.models.generate_content(
-        model="gemini-2.5-flash-lite", contents=summary_prompt, config={"temperature": 0.8}
+    # この生成タスクは創造性が高いため、高めのtemperatureを使う。
+    # モデルはルーターが選ぶ（flash-lite から始め、資料が短すぎる場合は上位のモデルで再生成する）
+    router = clients.get_model_router()
+    result, _ = router.call(
+        router.route_generation("p3_materials"),
+        lambda decision: gateway.generate(
+            model=decision["model"],
+            contents=summary_prompt,
+            config=apply_route_config(decision, {"temperature": 0.8}),
+            purpose="p3_materials",
+            # 論文の抜粋はペルソナ・P2と共通の先頭部分として渡し、コンテキストキャッシュを共有する
+            cache_prefix=build_paper_context(article_text),
+        ),
+        validate=lambda result: validate_text_output(result, MIN_MATERIALS_CHARS),
     )
-
-    fictitious_rehab_materials_text = response_summary.text
+    fictitious_rehab_materials_text = result["text"]
     print("    -> ステージ1: 完了")
 
     # --- 3.【ステージ2】は不要（JSON抽出は行わない） ---
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import tempfile
+
+from utils.rate_limiter import LimiterLanes
+from utils.article_store import RawArticleStore
+from utils.fake_backends import (
+    LatencyModel, FakeGeminiBackend, FakeJStageServer, build_synthetic_corpus, build_corpus_from_store, synthesize_pdf,
+)
+from core.result_handler import ResultHandler
+from core.client_registry import ClientRegistry, set_default_registry
+from core.p1_state_store import DEFAULT_STATE_DB_PATH
+from run_pipeline_1_rag_source import run_staged_conversion, open_state_store, setup_logging
+
+# ベンチマークの結果（作業フォルダからの相対パス）
+BENCHMARK_REPORT_PATH = os.path.join("output", "pipeline_1_benchmark_report.json")
+# 合成の論文に使うPDF（なければテキストレイヤー付きのPDFを合成する）
+DEFAULT_BENCHMARK_PDF = "file.pdf"
+
+
+def load_corpus(args) -> list:
+    """ベンチマークで偽の J-STAGE に提供する論文一覧を用意する（作業フォルダに移動する前に呼び出すこと）。"""
+    if getattr(args, "from_store", False):
+        corpus = build_corpus_from_store(RawArticleStore(), limit=args.articles)
+        print(f"[Bench] 生データストアの論文 {len(corpus)} 件を再生します。")
+        return corpus
+
+    pdf_path = getattr(args, "pdf", None) or DEFAULT_BENCHMARK_PDF
+    if os.path.exists(pdf_path):
+        with open(pdf_path, "rb") as f:
+            pdf_content = f.read()
+    else:
+        pdf_content = synthesize_pdf()
+    print(f"[Bench] 合成の論文 {args.articles} 件 (PDFを提供する雑誌の割合: {args.pdf_ratio:.0%}) を使用します。")
+    return build_synthetic_corpus(args.articles, pdf_content=pdf_content, pdf_ratio=args.pdf_ratio)
+
+
+def search_articles(jstage_client, keywords: int, count: int) -> tuple[list, float]:
+    """偽の J-STAGE で keywords 件のキーワードを検索し、DOIで重複排除した論文一覧と検索時間を返す。"""
+    started = time.perf_counter()
+    articles, seen = [], set()
+    for index in range(keywords):
+        keyword = f"benchmark-{index + 1}"
+        for article in jstage_client.search_articles(keyword, count=count)[0]:
+            if article["doi"] not in seen:
+                seen.add(article["doi"])
+                articles.append({**article, "source_keyword": keyword})
+    return articles, time.perf_counter() - started
+
+
+def run(args):
+    """
+    偽の Gemini（記録の再生または合成の応答）と偽の J-STAGE（ローカルHTTPサーバー）に対して
+    P1 のダウンロード → 変換 → 保存 を --workers のワーカー数で実行し、スループットとステージごとのレイテンシを計測します。
+    APIの利用枠は消費しません。出力・状態ストアは作業フォルダ（--work-dir、未指定時は一時フォルダ）に作られます。
+    """
+    corpus = load_corpus(args)
+    if not corpus:
+        print("[Bench] エラー: 再生する論文がありません。")
+        return None
+    recording_path = os.path.abspath(args.gemini_recording) if getattr(args, "gemini_recording", None) else None
+    fake_gemini = FakeGeminiBackend(
+        recording_path=recording_path,
+        latency=LatencyModel.from_spec(args.gemini_latency) if args.gemini_latency else None,
+        error_rate=args.gemini_error_rate,
+        throttle_rate=args.gemini_throttle_rate,
+        seed=args.seed,
+    )
+
+    work_dir = os.path.abspath(getattr(args, "work_dir", None) or tempfile.mkdtemp(prefix="p1_benchmark_"))
+    os.makedirs(work_dir, exist_ok=True)
+    original_cwd = os.getcwd()
+    os.chdir(work_dir)
+    # P1 のログ（pipeline_1.log）は作業フォルダに書き出す
+    setup_logging()
+    print(f"[Bench] 作業フォルダ: {work_dir}")
+
+    server = FakeJStageServer(
+        corpus,
+        latency=LatencyModel.from_spec(args.jstage_latency, seed=args.seed),
+        error_rate=args.jstage_error_rate,
+    ).start()
+    state_store = open_state_store(DEFAULT_STATE_DB_PATH)
+    clients = None
+    try:
+        # 実際の J-STAGE ではないため、アクセス間隔は --jstage-interval（デフォルト: 0秒）にする
+        lane = {"interval": args.jstage_interval, "burst": 1}
+        clients = ClientRegistry(
+            gemini_api_key="benchmark",
+            lanes=LimiterLanes({"search": lane, "article": lane}),
+            jstage_base_url=server.search_url,
+            llm_backend=fake_gemini,
+        )
+        set_default_registry(clients)
+
+        articles, search_seconds = search_articles(clients.get_jstage_client(), args.keywords, len(corpus))
+        print(f"[Bench] 検索: {len(articles)} 件の論文 ({search_seconds:.1f} 秒)")
+
+        engine_stats = []
+        started = time.perf_counter()
+        created = run_staged_conversion(
+            articles, ResultHandler(base_output_dir="output"), "benchmark", state_store,
+            clients=clients,
+            workers=max(1, args.workers),
+            download_workers=args.download_workers,
+            engine_stats=engine_stats,
+        )
+        elapsed = time.perf_counter() - started
+
+        report = {
+            "workers": max(1, args.workers),
+            "download_workers": args.download_workers,
+            "articles": len(articles),
+            "created": created,
+            "elapsed_seconds": elapsed,
+            "articles_per_min": created / elapsed * 60 if elapsed > 0 else 0.0,
+            "search_seconds": search_seconds,
+            "stages": engine_stats,
+            "llm": clients.get_llm_stats(),
+            "routing": clients.get_model_router().get_stats(),
+            "escalations": dict(clients.get_model_router().escalations),
+            "fake_gemini": dict(fake_gemini.stats),
+            "fake_jstage": dict(server.stats),
+        }
+    finally:
+        state_store.close()
+        # モデルの振り分けの記録・実績の未保存分を作業フォルダに書き込む
+        if clients is not None:
+            clients.close()
+        server.stop()
+        os.chdir(original_cwd)
+
+    report_path = os.path.join(work_dir, BENCHMARK_REPORT_PATH)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n" + "=" * 50)
+    print(
+        f"[Bench] ワーカー {report['workers']} (ダウンロード {report['download_workers']}): "
+        f"{report['created']}/{report['articles']} 件 / {elapsed:.1f} 秒 / {report['articles_per_min']:.1f} 件/分"
+    )
+    for stats in engine_stats:
+        print(
+            f"[Bench] ステージ '{stats['name']}': 成功 {stats['processed']} / 失敗 {stats['failed']} / "
+            f"p50 {stats['p50_latency']:.2f} 秒 / p95 {stats['p95_latency']:.2f} 秒"
+        )
+    print(
+        f"[Bench] 偽のGemini: 呼び出し {fake_gemini.stats['calls']} 回 (記録の再生 {fake_gemini.stats['replayed']} / "
+        f"合成 {fake_gemini.stats['synthesized']} / エラー {fake_gemini.stats['errors']} / レート制限 {fake_gemini.stats['throttled']})"
+    )
+    print(
+        f"[Bench] 偽のJ-STAGE: 検索 {server.stats['search']} / PDF {server.stats['pdf']} / "
+        f"記事ページ {server.stats['article']} / エラー {server.stats['errors']}"
+    )
+    print(f"[Bench] レポート: {report_path}")
+    print("=" * 50)
+    return report
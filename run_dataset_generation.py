@@ -6,6 +6,8 @@ from dotenv import load_dotenv
 
 # 既存のロジックをインポート
 from utils.persona_generator import generate_persona
+from core.client_registry import ClientRegistry
+from utils.llm_response_cache import LLMResponseCache
 
 # from pipelines.pipeline_2_lora_finetune import process_lora_data_generation # 古い関数
 from pipelines.pipeline_2_lora_finetune import process_full_plan_generation  # 新しい一括生成関数
@@ -37,13 +39,54 @@ def setup_directories():
     os.makedirs(EMBEDDING_DIR, exist_ok=True)
 
 
-def run_p2_and_p3():
+def create_response_cache(args=None):
+    """
+    LLMの応答キャッシュを生成します（--no-llm-cache 指定時は None）。
+    プロンプトが変わっていないペルソナ・計画書・資料の生成は、再実行時にキャッシュから応答します。
+    """
+    if args is not None and getattr(args, "no_llm_cache", False):
+        if getattr(args, "replay", False):
+            print("[P234] 警告: --replay はキャッシュを使うため、--no-llm-cache は無視します。")
+        else:
+            return None
+    replay = args is not None and getattr(args, "replay", False)
+    if replay:
+        print("[P234] リプレイモード: LLMの応答はキャッシュからのみ返し、APIは呼び出しません。")
+    return LLMResponseCache(replay=replay)
+
+
+def summarize_prompt_tokens(clients) -> dict:
+    """全用途の入力トークン数と、そのうちコンテキストキャッシュから読まれたトークン数の合計を返す。"""
+    totals = {"prompt_tokens": 0, "cached_tokens": 0}
+    for stats in clients.get_llm_stats().values():
+        for key in totals:
+            totals[key] += stats[key]
+    return totals
+
+
+def report_paper_token_savings(clients, tokens_before: dict):
+    """1論文分の入力トークン数と、コンテキストキャッシュから読まれた（割引で課金される）トークン数を表示します。"""
+    tokens_after = summarize_prompt_tokens(clients)
+    prompt_tokens = tokens_after["prompt_tokens"] - tokens_before["prompt_tokens"]
+    cached_tokens = tokens_after["cached_tokens"] - tokens_before["cached_tokens"]
+    if prompt_tokens:
+        print(
+            f"  -> 入力 {prompt_tokens} トークン (うちコンテキストキャッシュ {cached_tokens} トークン, "
+            f"{cached_tokens / prompt_tokens:.0%})"
+        )
+
+
+def run_p2_and_p3(args=None):
     """
     パイプライン2（LoRA）とパイプライン3（Parser）のデータセットを生成します。
     """
     print("\n[P234] ステップ2/3: P2 (LoRA) および P3 (Parser) のデータセットを生成します...")
     load_dotenv()
+    response_cache = create_response_cache(args)
     gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key and response_cache is not None and response_cache.replay:
+        # リプレイモードはAPIを呼び出さないため、APIキーがなくても実行できる
+        gemini_api_key = "replay"
     if not gemini_api_key:
         print("[P234] エラー: GEMINI_API_KEYが設定されていません。")
         return
@@ -53,6 +96,9 @@ def run_p2_and_p3():
         print("先に `python main.py p1` を実行して、RAGソースファイルを作成してください。")
         return
 
+    # genai.Client はプロセスで1つだけ生成し、全ジョブ・全ステージで使い回す
+    clients = ClientRegistry(gemini_api_key=gemini_api_key, response_cache=response_cache)
+
     md_files = [f for f in os.listdir(RAG_SOURCE_DIR) if f.endswith(".md")]
     if not md_files:
         print(f"[P234] 警告: {RAG_SOURCE_DIR} にMarkdownファイルがありません。")
@@ -68,111 +114,157 @@ def run_p2_and_p3():
         print(f"\n--- ジョブ {processed_count}/{total_jobs} ---")
         print(f"  論文: {md_file}")
 
-        # --- ファイル名とIDの定義 ---
-        # どのPCで実行しても同じID/ファイル名が生成されるようにする
-        base_name = f"{md_file.replace('.md', '')}"  # 年齢・性別を除外
-
-        # P2: ペルソナファイル (P2, P3の共通の前提条件)
-        persona_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-persona"))
-        persona_filename = f"{persona_job_id}.json"
-        persona_path = os.path.join(PERSONA_DIR, persona_filename)
-
-        # P2: LoRA「完了目印」ファイル
-        lora_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-lora"))
-        lora_done_marker_path = os.path.join(LORA_DIR, f"{lora_job_id}.done.marker")  # 完了目印ファイル
-
-        # P3: Parserデータファイル
-        parser_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-parser"))
-        parser_path = os.path.join(PARSER_DIR, f"{parser_job_id}.jsonl")
-
-        # --- ステップ 1: ペルソナ生成 (P2, P3の前提条件) ---
-        if not os.path.exists(persona_path):
-            print(f"[実行中] {base_name}")
-            try:
-                print("  -> (1/3) 論文に最適なペルソナを生成中...")
-                source_markdown_path = os.path.join(RAG_SOURCE_DIR, md_file)
+        tokens_before = summarize_prompt_tokens(clients)
+        try:
+            # --- ファイル名とIDの定義 ---
+            # どのPCで実行しても同じID/ファイル名が生成されるようにする
+            base_name = f"{md_file.replace('.md', '')}"  # 年齢・性別を除外
+
+            # P2: ペルソナファイル (P2, P3の共通の前提条件)
+            persona_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-persona"))
+            persona_filename = f"{persona_job_id}.json"
+            persona_path = os.path.join(PERSONA_DIR, persona_filename)
+
+            # P2: LoRA「完了目印」ファイル
+            lora_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-lora"))
+            lora_done_marker_path = os.path.join(LORA_DIR, f"{lora_job_id}.done.marker")  # 完了目印ファイル
+
+            # P3: Parserデータファイル
+            parser_job_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{base_name}-parser"))
+            parser_path = os.path.join(PARSER_DIR, f"{parser_job_id}.jsonl")
+
+            # --- ステップ 1: ペルソナ生成 (P2, P3の前提条件) ---
+            if not os.path.exists(persona_path):
+                print(f"[実行中] {base_name}")
                 try:
-                    with open(source_markdown_path, "r", encoding="utf-8") as f:
-                        # 論文内容全体を渡す（最大トークン数を考慮し、ある程度で切る）
-                        paper_content_for_persona = f.read(20000)  # ペルソナ生成の品質のため、多めに渡す
-                except FileNotFoundError:
-                    print(f"  -> !! エラー: Markdownファイルが見つかりません: {source_markdown_path}")
-                    continue
-                except Exception as read_e:
-                    print(f"  -> !! エラー: Markdownファイルの読み込み中にエラー: {read_e}")
+                    print("  -> (1/3) 論文に最適なペルソナを生成中...")
+                    source_markdown_path = os.path.join(RAG_SOURCE_DIR, md_file)
+                    try:
+                        with open(source_markdown_path, "r", encoding="utf-8") as f:
+                            # 論文内容全体を渡す（最大トークン数を考慮し、ある程度で切る）
+                            paper_content_for_persona = f.read(20000)  # ペルソナ生成の品質のため、多めに渡す
+                    except FileNotFoundError:
+                        print(f"  -> !! エラー: Markdownファイルが見つかりません: {source_markdown_path}")
+                        continue
+                    except Exception as read_e:
+                        print(f"  -> !! エラー: Markdownファイルの読み込み中にエラー: {read_e}")
+                        continue
+
+                    persona_obj = generate_persona(
+                        paper_theme=md_file.replace(".md", ""),
+                        paper_content=paper_content_for_persona,
+                        gemini_api_key=gemini_api_key,
+                        clients=clients,
+                    )
+
+                    with open(persona_path, "w", encoding="utf-8") as f:
+                        json.dump(persona_obj, f, indent=2, ensure_ascii=False, default=str)
+                    print(f"  -> (1/3) ペルソナを保存しました: {persona_filename}")
+                except Exception as e:
+                    print(f"  -> !! エラー: {base_name} のペルソナ生成中に失敗。")
+                    print(f"     詳細: {e}")
+                    print("     このジョブ（論文）をスキップして次に進みます。")
                     continue
+            else:
+                print(f"[チェック] {base_name} のペルソナは既に存在します。")
 
-                persona_obj = generate_persona(
-                    paper_theme=md_file.replace(".md", ""),
-                    paper_content=paper_content_for_persona,
-                    gemini_api_key=gemini_api_key,
-                )
-
-                with open(persona_path, "w", encoding="utf-8") as f:
-                    json.dump(persona_obj, f, indent=2, ensure_ascii=False, default=str)
-                print(f"  -> (1/3) ペルソナを保存しました: {persona_filename}")
-            except Exception as e:
-                print(f"  -> !! エラー: {base_name} のペルソナ生成中に失敗。")
-                print(f"     詳細: {e}")
-                print("     このジョブ（論文）をスキップして次に進みます。")
-                continue
-        else:
-            print(f"[チェック] {base_name} のペルソナは既に存在します。")
-
-        # --- ステップ 2: LoRAデータ生成 (P2) ---
-        if not os.path.exists(lora_done_marker_path):
-            print(f"  -> (2/3) LoRAデータ（フル計画書）を生成中 (ID: {lora_job_id})...")
-            try:
-                step_job_data = {
-                    "job_id": lora_job_id,
-                    "source_markdown": md_file,
-                    "source_persona": persona_filename,
-                }
-                # P2の新しい一括生成ロジックを呼び出し
-                step_result = process_full_plan_generation(step_job_data, gemini_api_key)
-
-                # 完了したJSONL行（1行）を、集約ファイルに「追記」する
-                jsonl_record_str = step_result["content"]
-                with open(LORA_DATASET_FILE, "a", encoding="utf-8") as f:
-                    f.write(jsonl_record_str + "\n")
-
-                # 処理が正常に完了したことを示す「目印ファイル」を作成する
-                with open(lora_done_marker_path, "w", encoding="utf-8") as f:
-                    f.write(f"Processed on {time.ctime()}\n")
-
-                print(f"  -> (2/3) LoRAデータを '{LORA_DATASET_FILE}' に追記完了。")
-
-            except Exception as e:
-                print(f"  -> !! エラー: {base_name} のP2 (LoRA) 処理中に失敗。")
-                print(f"     詳細: {e}")
-                # P3の処理は継続するため、ここでは continue しない
-        else:
-            print(f"  -> (2/3) LoRAデータ (目印ファイル: {lora_job_id}.done.marker) は既に存在します。")
-
-        # --- ステップ 3: Parserデータ生成 (P3) ---
-        if not os.path.exists(parser_path):
-            print("  -> (3/3) Parserデータ（資料→ペルソナ）を生成中...")
-            try:
-                p3_job_data = {
-                    "job_id": parser_job_id,
-                    "source_markdown": md_file,  # 論文コンテキストも渡す
-                    "source_persona": persona_filename,
-                }
-                # P3のロジックを呼び出し (pipeline_3_parser_finetune.py側が変更されている前提)
-                parser_result = process_parser_finetune_data_generation(p3_job_data, gemini_api_key)
-
-                # P3はジョブごとに1ファイル（1行）を保存
-                with open(parser_path, "w", encoding="utf-8") as f:
-                    f.write(parser_result["content"])
-                print(f"  -> (3/3) Parserデータを保存しました: {parser_job_id}.jsonl")
-
-            except Exception as e:
-                print(f"  -> !! エラー: {base_name} のP3 (Parser) 処理中に失敗。")
-                print(f"     詳細: {e}")
-                # 次のジョブに進む
-                continue
-        else:
-            print("  -> (3/3) Parserデータは既に存在します。")
+            # --- ステップ 2: LoRAデータ生成 (P2) ---
+            if not os.path.exists(lora_done_marker_path):
+                print(f"  -> (2/3) LoRAデータ（フル計画書）を生成中 (ID: {lora_job_id})...")
+                try:
+                    step_job_data = {
+                        "job_id": lora_job_id,
+                        "source_markdown": md_file,
+                        "source_persona": persona_filename,
+                    }
+                    # P2の新しい一括生成ロジックを呼び出し
+                    step_result = process_full_plan_generation(step_job_data, gemini_api_key, clients=clients)
+
+                    # 完了したJSONL行（1行）を、集約ファイルに「追記」する
+                    jsonl_record_str = step_result["content"]
+                    with open(LORA_DATASET_FILE, "a", encoding="utf-8") as f:
+                        f.write(jsonl_record_str + "\n")
+
+                    # 処理が正常に完了したことを示す「目印ファイル」を作成する
+                    with open(lora_done_marker_path, "w", encoding="utf-8") as f:
+                        f.write(f"Processed on {time.ctime()}\n")
+
+                    print(f"  -> (2/3) LoRAデータを '{LORA_DATASET_FILE}' に追記完了。")
+
+                except Exception as e:
+                    print(f"  -> !! エラー: {base_name} のP2 (LoRA) 処理中に失敗。")
+                    print(f"     詳細: {e}")
+                    # P3の処理は継続するため、ここでは continue しない
+            else:
+                print(f"  -> (2/3) LoRAデータ (目印ファイル: {lora_job_id}.done.marker) は既に存在します。")
+
+            # --- ステップ 3: Parserデータ生成 (P3) ---
+            if not os.path.exists(parser_path):
+                print("  -> (3/3) Parserデータ（資料→ペルソナ）を生成中...")
+                try:
+                    p3_job_data = {
+                        "job_id": parser_job_id,
+                        "source_markdown": md_file,  # 論文コンテキストも渡す
+                        "source_persona": persona_filename,
+                    }
+                    # P3のロジックを呼び出し (pipeline_3_parser_finetune.py側が変更されている前提)
+                    parser_result = process_parser_finetune_data_generation(p3_job_data, gemini_api_key, clients=clients)
+
+                    # P3はジョブごとに1ファイル（1行）を保存
+                    with open(parser_path, "w", encoding="utf-8") as f:
+                        f.write(parser_result["content"])
+                    print(f"  -> (3/3) Parserデータを保存しました: {parser_job_id}.jsonl")
+
+                except Exception as e:
+                    print(f"  -> !! エラー: {base_name} のP3 (Parser) 処理中に失敗。")
+                    print(f"     詳細: {e}")
+                    # 次のジョブに進む
+                    continue
+            else:
+                print("  -> (3/3) Parserデータは既に存在します。")
+        finally:
+            # ペルソナ・P2・P3で共有した論文のコンテキストキャッシュは、この論文の処理が終わったら削除する
+            clients.release_context_caches()
+            report_paper_token_savings(clients, tokens_before)
+
+    # モデルの振り分けの実績（雑誌ごと）の未保存分を書き込む
+    clients.flush()
+
+    # Gemini API の同時実行数の推移（レート制限の発生状況の確認用）
+    gemini_stats = clients.get_gemini_controller().get_stats()
+    print(
+        f"\n[P234] Gemini同時実行数: 最終上限 {gemini_stats['limit']:.1f} / 最大 {gemini_stats['peak_limit']:.1f} / "
+        f"呼び出し {gemini_stats['calls']} 回 / レート制限 {gemini_stats['throttled']} 回 / 再試行 {gemini_stats['retries']} 回"
+    )
+    # 用途（P2計画書・P3資料・ペルソナ）ごとの呼び出しの集計
+    for purpose, stats in clients.get_llm_stats().items():
+        print(
+            f"[P234] LLM呼び出し '{purpose}': {stats['calls']} 回 (失敗 {stats['failed']} / 再試行 {stats['retries']}, うち429/503 {stats['throttle_retries']}) / "
+            f"平均 {stats['avg_latency']:.1f} 秒 (p95 {stats['p95_latency']:.1f} 秒) / "
+            f"入力 {stats['prompt_tokens']} トークン (うちキャッシュ {stats['cached_tokens']}) / 出力 {stats['output_tokens']} トークン"
+        )
+    model_router = clients.get_model_router()
+    for route_key, stats in model_router.get_stats().items():
+        print(
+            f"[P234] モデル振り分け '{route_key}': {stats['calls']} 回 (失敗 {stats['failed']}) / "
+            f"平均 {stats['avg_latency']:.1f} 秒 / 推定コスト ${stats['cost_usd']:.4f}"
+        )
+    for escalation, count in model_router.escalations.items():
+        print(f"[P234] モデルの昇格 '{escalation}': {count} 回")
+    context_cache_stats = clients.get_context_cache_stats()
+    if context_cache_stats:
+        print(
+            f"[P234] コンテキストキャッシュ: 作成 {context_cache_stats['created']} / 再利用 {context_cache_stats['reused']} / "
+            f"対象外 {context_cache_stats['skipped']} / 失敗 {context_cache_stats['failed']} / 削除 {context_cache_stats['released']}"
+        )
+    if response_cache is not None:
+        cache_stats = response_cache.get_stats()
+        print(
+            f"[P234] LLM応答キャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']} "
+            f"(ヒット率 {cache_stats['hit_rate']:.0%}) / 節約 入力 {cache_stats['saved_prompt_tokens']} トークン・"
+            f"出力 {cache_stats['saved_output_tokens']} トークン / {cache_stats['entries']} 件 "
+            f"({cache_stats['total_bytes'] / 1024**2:.1f} MiB, 削除 {cache_stats['evictions']} 件)"
+        )
 
 
 def run_p4():
@@ -189,13 +281,14 @@ def run_p4():
         print(f"[P234] !! エラー: P4の実行に失敗しました: {e}")
 
 
-def main():
+def main(args=None):
     """
     データセット生成（P2, P3, P4）のメインロジック。
+    args (main.py の p234 の引数) の --replay / --no-llm-cache で、LLMの応答キャッシュの使い方を切り替えます。
     """
     start_time = time.time()
     setup_directories()
-    run_p2_and_p3()
+    run_p2_and_p3(args)
     run_p4()
     end_time = time.time()
 
@@ -1,76 +1,102 @@
 import os
+import json
 import time
-import itertools
+import hashlib
 import logging
 import random
 
 from utils.jstage_client import JStageClient
-from pipelines.pipeline_1_rag_source import process_pipeline_1
+from utils.search_cache import SearchCache
+from utils.article_store import RawArticleStore
+from utils.fake_backends import RecordingGeminiBackend
+from pipelines.pipeline_1_rag_source import (
+    process_pipeline_1, reconvert_from_store, download_article, convert_downloaded_article,
+    build_conversion_request, finalize_markdown, choose_pdf_route, convert_article_to_markdown, ROUTE_PDF,
+)
 from core.result_handler import ResultHandler
+from core.client_registry import ClientRegistry, set_default_registry
+from core.search_prefetcher import SearchPrefetcher
+from core.article_frontier import ArticleFrontier, DEFAULT_FRONTIER_PATH
+from core.p1_engine import StagedEngine, Stage
+from core.query_planner import CombinationQueryPlanner, DEFAULT_MAX_TERMS
+from core.p1_state_store import P1StateStore, SearchCursorTracker, DEFAULT_STATE_DB_PATH
+from core.keyword_yield import KeywordYieldTracker, DEFAULT_MIN_PAGE_NOVELTY
+from core.batch_conversion import (
+    BatchConversionManager, GeminiBatchBackend, LocalBatchBackend, DEFAULT_BATCH_SIZE, base64_size, estimate_request_bytes,
+)
 import search_keywords as kw
 
 # 定数
 # 出力先
 RAG_SOURCE_DIR = "output/pipeline_1_rag_source"
+# 進捗はSQLiteの状態ストアに保存する（以下の従来のログは、初回のみ状態ストアに取り込む）
 PROCESSED_JSTAGE_LOG = os.path.join("output", "processed_jstage_dois.log")
 PROCESSED_KEYWORDS_LOG = os.path.join("output", "pipeline_1_processed_keywords.log") # パスを output 内に修正
+FRONTIER_REPORT_PATH = os.path.join("output", "pipeline_1_frontier_report.json")
+YIELD_REPORT_PATH = os.path.join("output", "pipeline_1_yield_report.json")
 
 # APIリクエスト間のスリープ時間（秒）
 SEARCH_API_SLEEP = 1.0
 PROCESS_DOI_SLEEP = 1.0
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - [%(levelname)s] - %(message)s",
-    handlers=[
-        logging.FileHandler("pipeline_1.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
-)
+# 検索ページの先読み数（処理中のページとは別に、キューに保持しておくページ数）
+DEFAULT_PREFETCH_PAGES = 2
+
+# 段階的エンジン（--workers 指定時）のダウンロードワーカー数
+DEFAULT_DOWNLOAD_WORKERS = 2
+
+# 収集レポートでログに表示するキーワード数（全件はJSONレポートに保存する）
+FRONTIER_REPORT_TOP_KEYWORDS = 20
+
+# combination モードの計画結果としてログに表示するクエリ数
+PLANNED_QUERIES_LOG_COUNT = 10
+
+# 収穫レポートでログに表示するキーワード数（全件はJSONレポートに保存する）
+YIELD_REPORT_TOP_KEYWORDS = 20
+
+# ログファイル（実行時の作業フォルダからの相対パス）
+P1_LOG_PATH = "pipeline_1.log"
+
 logger = logging.getLogger(__name__)
 
 
-def load_processed_dois(log_path: str) -> set:
-    """処理済みのDOIをログファイルから読み込む"""
-    processed_dois = set()
-    try:
-        with open(log_path, "r", encoding="utf-8") as f:
-            processed_dois = set(line.strip() for line in f)
-        logger.info(f"[P1] {len(processed_dois)}件の処理済みDOIをログから読み込みました。")
-    except FileNotFoundError:
-        logger.warning("[P1] 処理済みDOIログファイルが見つかりません。新規に作成します。")
-    return processed_dois
-
-
-def log_processed_doi(log_path: str, doi: str):
-    """処理済みのDOIをログファイルに追記する"""
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(doi + "\n")
-
-
-def load_processed_keywords(log_path: str) -> set:
-    """処理済みのキーワードをログファイルから読み込む"""
-    processed_keywords = set()
-    if os.path.exists(log_path):
-        with open(log_path, "r", encoding="utf-8") as f:
-            processed_keywords = set(line.strip() for line in f)
-        logger.info(f"[P1] {len(processed_keywords)}件の処理済みキーワードをログから読み込みました。")
-    else:
-        logger.info("[P1] 処理済みキーワードログファイルが見つかりません。新規に作成します。")
-    return processed_keywords
+def setup_logging(log_path: str = P1_LOG_PATH):
+    """
+    ロギングを設定する（設定済みの場合は何もしない）。
+    インポートしただけでログファイルが作られないよう、実行の開始時（作業フォルダを決めた後）に呼び出す。
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - [%(levelname)s] - %(message)s",
+        handlers=[
+            logging.FileHandler(log_path, encoding="utf-8"),
+            logging.StreamHandler(),
+        ],
+    )
 
 
-def log_processed_keyword(log_path: str, keyword: str):
-    """処理済みのキーワードをログファイルに追記する"""
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(keyword + "\n")
+def open_state_store(path: str = DEFAULT_STATE_DB_PATH) -> P1StateStore:
+    """状態ストアを開き、従来のログファイルがあれば初回のみ取り込む。"""
+    state_store = P1StateStore(path)
+    imported = state_store.import_legacy_logs(PROCESSED_JSTAGE_LOG, PROCESSED_KEYWORDS_LOG)
+    if imported:
+        logger.info(f"[P1] 従来のログから {imported} 件の処理済みDOIを状態ストア '{path}' に取り込みました。")
+    counts = state_store.get_stats()["counts"]
+    logger.info(
+        f"[P1] 状態ストア: 処理済み {counts.get('done', 0)} 件 / 失敗 {counts.get('failed', 0)} 件 / "
+        f"処理中断 {counts.get('in_progress', 0)} 件"
+    )
+    return state_store
 
 
-def get_queries_to_run(args, keyword_list_map, processed_keywords: set) -> list:
+def get_queries_to_run(
+    args, keyword_list_map, processed_keywords: set, jstage_client: JStageClient = None, keyword_yields: dict | None = None
+) -> list:
     """
     コマンドライン引数に基づいて実行対象の検索クエリリストを生成する。
     処理済みのキーワードは除外する。
+    --query-mode combination の場合は、CombinationQueryPlanner でクエリを計画する
+    （keyword_yields: 状態ストアに記録したキーワードごとの検索の実績）。
     """
     logger.info("[P1] 実行対象の検索クエリを準備中...")
 
@@ -82,6 +108,11 @@ def get_queries_to_run(args, keyword_list_map, processed_keywords: set) -> list:
         target_list_names = args.keyword_lists
         logger.info(f"[P1] ... 対象リスト: {target_list_names}")
 
+    if getattr(args, "query_mode", "single") == "combination":
+        return plan_combination_queries(
+            args, keyword_list_map, target_list_names, processed_keywords, jstage_client, keyword_yields
+        )
+
     # 順序を保持するため、setではなくlistを使用する
     ordered_queries = []
     for short_name in target_list_names:
@@ -105,7 +136,7 @@ def get_queries_to_run(args, keyword_list_map, processed_keywords: set) -> list:
     if processed_keywords:
         queries_to_run = [q for q in unique_ordered_queries if q not in processed_keywords]
         skipped_count = total_unique_queries - len(queries_to_run)
-        logger.info(f"[P1] ログに基づき、処理済みのキーワード {skipped_count} 件をスキップします。")
+        logger.info(f"[P1] 状態ストアに基づき、検索済みのキーワード {skipped_count} 件をスキップします。")
     else:
         queries_to_run = unique_ordered_queries
 
@@ -113,132 +144,631 @@ def get_queries_to_run(args, keyword_list_map, processed_keywords: set) -> list:
     return queries_to_run
 
 
+def plan_combination_queries(
+    args,
+    keyword_list_map,
+    target_list_names: list,
+    processed_keywords: set,
+    jstage_client: JStageClient,
+    keyword_yields: dict | None = None,
+) -> list:
+    """
+    combination モード: キーワードリストの組み合わせから、ヒット件数を確認しながら
+    新しい論文が多く得られる見込みの順にクエリを選ぶ（最大 --max-queries 件）。
+    検索の実績（keyword_yields）があるクエリは、ヒット件数の確認を省き、既に取得した論文数を見込みから差し引く。
+    """
+    keyword_lists = []
+    for short_name in target_list_names:
+        list_variable_name = keyword_list_map.get(short_name)
+        if list_variable_name:
+            keyword_lists.append(list(getattr(kw, list_variable_name, [])))
+        else:
+            logger.warning(f"[P1] ... 不明なリスト名: {short_name}")
+
+    max_queries = args.max_queries if args.max_queries > 0 else float("inf")
+    max_probes = getattr(args, "max_probes", 0) or None
+    planner = CombinationQueryPlanner(
+        jstage_client,
+        keyword_lists,
+        max_papers_per_keyword=args.max_papers_per_keyword,
+        max_terms=getattr(args, "max_terms", DEFAULT_MAX_TERMS),
+        max_probes=max_probes,
+        keyword_yields=keyword_yields,
+    )
+    logger.info(
+        f"[P1] combination モード: {len(keyword_lists)} 個のリストから、最大 {planner.max_terms} 語の組み合わせを"
+        f"ヒット件数を確認しながら計画します..."
+    )
+    planned = planner.plan(max_queries, exclude=processed_keywords)
+
+    stats = planner.stats
+    logger.info(
+        f"[P1] クエリ計画: {len(planned)} 件 (ヒット件数の確認 {stats['probes']} 回 / "
+        f"0件で除外 {stats['pruned_zero']} / 単独検索で取得できるため除外 {stats['pruned_subsumed']} / "
+        f"確認の上限により除外 {stats['pruned_unprobed']} / 取得済みのため除外 {stats['pruned_known']})"
+    )
+    logger.info(f"[P1] 新規論文数の見込みの合計: 約 {sum(item['expected_new'] for item in planned):.0f} 件")
+    for item in planned[:PLANNED_QUERIES_LOG_COUNT]:
+        logger.info(f"  - '{item['query']}': ヒット {item['hits']} 件 / 見込み {item['expected_new']:.0f} 件")
+    return [item["query"] for item in planned]
+
+
+def prepare_article_job(article: dict, state_store: P1StateStore) -> dict | None:
+    """
+    検索で得た論文1件について、処理済みかどうかを確認し、パイプライン1のジョブを作成する。
+    スキップする場合（DOIなし・処理済み）は None を返す。
+    """
+    doi = article.get("doi")
+    if not doi:
+        logger.warning("  -> スキップ (DOIなし)")
+        return None
+
+    safe_filename = doi.replace("/", "_") + ".md"
+
+    # 判定は状態ストアの DOI（主キー）で行う（論文ごとのファイル存在確認は行わない）
+    skip_reason = state_store.skip_reason(doi)
+    if skip_reason == "done":
+        logger.info(f"  -> スキップ (既存): {doi}")
+        return None
+    if skip_reason == "failed":
+        logger.info(f"  -> スキップ (失敗が上限 {state_store.max_attempts} 回に達しています): {doi}")
+        return None
+
+    logger.info(f"  -> 新規処理: {article['title']} ({doi})")
+
+    # --- DEBUGGING START ---
+    # ユーザーのデバッグリクエストに対応
+    original_url_for_debug = article.get("debug_original_url", "N/A")
+    final_url_for_debug = article.get("url", "N/A")
+    logger.info("    [DEBUG] J-STAGE APIから取得したURL情報:")
+    logger.info(f"    [DEBUG]   - 元URL (API/HTML): {original_url_for_debug}")
+    logger.info(f"    [DEBUG]   - 処理後URL (DL対象): {final_url_for_debug}")
+    if original_url_for_debug != final_url_for_debug:
+         logger.info("    [DEBUG]   - (注) /_article/ から /_pdf/ へのURL変換が実行されました。")
+    # --- DEBUGGING END ---
+
+    job_data = {
+        "pipeline": "rag_source",
+        "url": article.get("url", ""), # Use .get for safety
+        "metadata": {
+            "title": article.get("title", "N/A"), # Use .get for safety
+            "doi": doi,
+            "journal": article.get("journal", "N/A"), # ★追加★
+            "published_date": article.get("published_date", "N/A"), # ★追加★
+            "debug_original_url": article.get("debug_original_url", "")
+        },
+    }
+    state_store.mark_started(doi, article.get("source_keyword"))
+    return {
+        "doi": doi, "safe_filename": safe_filename, "job_data": job_data,
+        "search_page_id": article.get("search_page_id"),
+        "yield_page": article.get("yield_page"),
+    }
+
+
+def save_article_result(job: dict, result_content: dict, result_handler: ResultHandler, state_store: P1StateStore):
+    """変換結果を保存し、DOIを処理済みとして記録する。"""
+    result_handler.save_result(
+        job_id=f"p1_{job['safe_filename']}", pipeline_name="rag_source",
+        result_data=result_content, custom_filename=job["safe_filename"],
+    )
+    content_hash = hashlib.sha256(result_content.get("content", "").encode("utf-8")).hexdigest()
+    state_store.mark_done(job["doi"], content_hash=content_hash)
+
+
+def record_article_failure(job: dict, error, state_store: P1StateStore):
+    """論文の処理失敗をログと状態ストアに記録する。"""
+    logger.error(f"  -> !! 処理エラー: {job['doi']} の処理中に失敗しました。詳細: {error}")
+    mark_article_failed(job, str(error), state_store)
+
+
+def mark_article_failed(job: dict, error: str, state_store: P1StateStore):
+    """論文の失敗を状態ストアに記録し、論文が見つかった検索ページの失敗数に加える。"""
+    state_store.mark_failed(job["doi"], error)
+    if job.get("yield_page"):
+        keyword, start_index = job["yield_page"]
+        state_store.add_page_failure(keyword, start_index)
+
+
+def process_article(
+    article: dict,
+    result_handler: ResultHandler,
+    gemini_api_key: str,
+    state_store: P1StateStore,
+    article_store: RawArticleStore = None,
+    clients: ClientRegistry = None,
+) -> str:
+    """
+    検索で得た論文1件をダウンロード・変換・保存する。
+    戻り値は "created"（新規作成）, "skipped"（処理済み・DOIなし）, "failed"（失敗）のいずれか。
+    """
+    job = prepare_article_job(article, state_store)
+    if job is None:
+        return "skipped"
+
+    try:
+        result_content = process_pipeline_1(
+            job["job_data"], gemini_api_key, article_store=article_store, clients=clients
+        )
+        save_article_result(job, result_content, result_handler, state_store)
+        time.sleep(PROCESS_DOI_SLEEP)
+        return "created"
+    except Exception as e:
+        record_article_failure(job, e, state_store)
+        return "failed"
+
+
+def run_staged_conversion(
+    articles,
+    result_handler: ResultHandler,
+    gemini_api_key: str,
+    state_store: P1StateStore,
+    article_store: RawArticleStore = None,
+    clients: ClientRegistry = None,
+    workers: int = 1,
+    download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    cursor_tracker: SearchCursorTracker | None = None,
+    engine_stats: list | None = None,
+) -> int:
+    """
+    論文をダウンロード → Gemini変換 → 保存 の3段階のエンジンで処理する。
+    各段階は独立したワーカー数と有界キューを持ち、遅いGemini変換の間もダウンロードと保存が進む。
+    固定のスリープは行わず、J-STAGEへのアクセス間隔はリミッターのレーンに任せる。
+    cursor_tracker を渡した場合は、論文の処理が終わるたびに検索位置を進める。
+    engine_stats にリストを渡した場合は、終了時にステージごとの集計値を追加する（ベンチマーク用）。
+    新規作成したファイル数を返す。
+    """
+    created = []
+    finish_article = cursor_tracker.article_finished if cursor_tracker else (lambda page_id: None)
+
+    def download_stage(job: dict) -> dict:
+        return {**job, "download": download_article(job["job_data"], article_store=article_store, clients=clients)}
+
+    def convert_stage(job: dict) -> dict:
+        return {**job, "result": convert_downloaded_article(job["download"], gemini_api_key, clients=clients)}
+
+    def save_stage(job: dict):
+        save_article_result(job, job["result"], result_handler, state_store)
+        created.append(job["doi"])
+        logger.info(f"  -> 保存完了: {job['doi']}")
+        finish_article(job["search_page_id"])
+
+    def on_error(job: dict, error: BaseException):
+        record_article_failure(job, error, state_store)
+        finish_article(job["search_page_id"])
+
+    engine = StagedEngine([
+        Stage("download", download_stage, workers=download_workers, on_error=on_error),
+        Stage("convert", convert_stage, workers=workers, on_error=on_error),
+        Stage("save", save_stage, workers=1, on_error=on_error),
+    ])
+    engine.start()
+
+    # 複数キーワードでヒットした同じ論文が、処理中に重複して投入されないようにする
+    scheduled_dois = set()
+    try:
+        for article in articles:
+            if article.get("doi") in scheduled_dois:
+                logger.info(f"  -> スキップ (処理中): {article.get('doi')}")
+                finish_article(article.get("search_page_id"))
+                continue
+            job = prepare_article_job(article, state_store)
+            if job is None:
+                finish_article(article.get("search_page_id"))
+                continue
+            scheduled_dois.add(job["doi"])
+            engine.submit(job)
+    except KeyboardInterrupt:
+        logger.warning("[P1] 中断要求を受け付けました。処理中の論文を完了させてから終了します...")
+    finally:
+        engine.drain()
+        log_engine_stats(engine)
+        if engine_stats is not None:
+            engine_stats.extend(engine.get_stats())
+
+    return len(created)
+
+
+def create_batch_backend(backend_name: str, clients: ClientRegistry):
+    """
+    --batch-backend の指定からバッチのバックエンドを作成する。
+    'local' は Batch API を使わず、各リクエストを通常の generate_content で処理する代替バックエンド。
+    """
+    client = clients.get_genai_client()
+    if backend_name == "local":
+        gemini_controller = clients.get_gemini_controller()
+        return LocalBatchBackend(
+            lambda request: gemini_controller.call(client.models.generate_content, **request).text
+        )
+    return GeminiBatchBackend(client)
+
+
+def run_batch_conversion(
+    articles,
+    result_handler: ResultHandler,
+    gemini_api_key: str,
+    state_store: P1StateStore,
+    article_store: RawArticleStore = None,
+    clients: ClientRegistry = None,
+    batch_backend: str = "gemini",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    cursor_tracker: SearchCursorTracker | None = None,
+) -> int:
+    """
+    論文をダウンロードし、Markdown変換のリクエストをバッチジョブにまとめて送信する（--batch）。
+    ジョブの完了を待って結果を保存する。送信済みのジョブはディスクに記録され、
+    中断後の再実行時には完了を確認して保存するだけで、同じ論文を再送信しない。
+    バッチの上限サイズを超える論文は、通常の（同期の）変換で処理する。
+    cursor_tracker を渡した場合は、論文の結果を保存するたびに検索位置を進める。
+    新規作成したファイル数を返す。
+    """
+    created = []
+    finish_article = cursor_tracker.article_finished if cursor_tracker else (lambda page_id: None)
+
+    def on_result(job: dict, markdown_body: str):
+        save_article_result(job, finalize_markdown(job["job_data"], markdown_body), result_handler, state_store)
+        created.append(job["doi"])
+        logger.info(f"  -> 保存完了 (バッチ): {job['doi']}")
+        finish_article(job.get("search_page_id"))
+
+    def on_error(job: dict, message: str):
+        logger.error(f"  -> !! バッチ変換エラー: {job['doi']} の処理に失敗しました。詳細: {message}")
+        mark_article_failed(job, message, state_store)
+        finish_article(job.get("search_page_id"))
+
+    manager = BatchConversionManager(
+        create_batch_backend(batch_backend, clients), on_result, on_error, batch_size=batch_size
+    )
+    # 前回の実行で送信済みのジョブを先に確認し、完了していれば保存する
+    manager.poll()
+
+    try:
+        for article in articles:
+            if article.get("doi") in manager.in_flight_keys():
+                logger.info(f"  -> スキップ (バッチ処理中): {article.get('doi')}")
+                finish_article(article.get("search_page_id"))
+                continue
+            job = prepare_article_job(article, state_store)
+            if job is None:
+                finish_article(article.get("search_page_id"))
+                continue
+            try:
+                download = download_article(job["job_data"], article_store=article_store, clients=clients)
+                content_type = download["content_type"]
+                with download["body"] as body:
+                    # バッチのサイズは送信するリクエストの大きさ（PDFは base64 エンコード後、テキスト経路は抽出したテキスト）で数える
+                    pdf_route = choose_pdf_route(body.open_mmap()) if "pdf" in content_type else None
+                    request = request_bytes = None
+                    if not (pdf_route and pdf_route["route"] == ROUTE_PDF and not manager.accepts(base64_size(body.size))):
+                        request = build_conversion_request(
+                            job["job_data"], body.open_mmap(), content_type, pdf_route=pdf_route
+                        )
+                        request_bytes = estimate_request_bytes(request)
+                    if request is not None and manager.accepts(request_bytes):
+                        manager.add(job["doi"], job, request, request_bytes)
+                        continue
+
+                    logger.info(f"  -> バッチの上限サイズを超えるため、通常の変換で処理します: {job['doi']}")
+                    request = None
+                    result_content = convert_article_to_markdown(
+                        job["job_data"], body.open_mmap(), content_type, gemini_api_key, clients=clients
+                    )
+                save_article_result(job, result_content, result_handler, state_store)
+                created.append(job["doi"])
+                finish_article(job["search_page_id"])
+            except Exception as e:
+                record_article_failure(job, e, state_store)
+                finish_article(job["search_page_id"])
+        manager.wait_all()
+    except KeyboardInterrupt:
+        logger.warning("[P1] 中断要求を受け付けました。送信待ちのリクエストを送信して終了します...")
+        manager.flush()
+        logger.warning(f"[P1] 送信済みのバッチジョブは '{manager.state_dir}' に記録されています。再実行時に結果を保存します。")
+    finally:
+        stats = manager.stats
+        logger.info(
+            f"[P1] バッチ: 送信ジョブ {stats['submitted_jobs']} 件 (リクエスト {stats['submitted_requests']} 件) / "
+            f"成功 {stats['succeeded']} 件 / 失敗 {stats['failed']} 件"
+        )
+
+    return len(created)
+
+
+def log_engine_stats(engine: StagedEngine):
+    """ステージごとの処理件数・スループット・レイテンシをログに出力する。"""
+    for stats in engine.get_stats():
+        logger.info(
+            f"[P1] ステージ '{stats['name']}' (ワーカー {stats['workers']}): 成功 {stats['processed']} / 失敗 {stats['failed']} / "
+            f"{stats['throughput_per_min']:.2f} 件/分 / 平均 {stats['avg_latency']:.1f} 秒 "
+            f"(p50 {stats['p50_latency']:.1f} 秒, p95 {stats['p95_latency']:.1f} 秒)"
+        )
+
+
+def iter_search_articles(prefetcher: SearchPrefetcher, total_queries: int, cursor_tracker: SearchCursorTracker):
+    """
+    先読みした検索ページを順に受け取り、論文を1件ずつ返す。
+    各ページは cursor_tracker に登録し、論文にはヒットした検索キーワード（source_keyword）と
+    ページID（search_page_id）、実績を記録するページ（yield_page）を付ける。
+    ページ内の論文の処理が終わると、キーワードの検索位置が保存される。
+    """
+    for page in prefetcher:
+        query = page["query"]
+        if page["is_first_page"]:
+            logger.info(f"\n[P1] ({page['query_number']}/{total_queries}) クエリ実行中: '{query}'")
+
+        for level, message in page["messages"]:
+            getattr(logger, level)(message)
+
+        page_id = cursor_tracker.add_page(page)
+        for article in page["articles"]:
+            yield {
+                **article, "source_keyword": query, "search_page_id": page_id,
+                "yield_page": [query, page["start_index"]],
+            }
+
+
 def run_search_loop(
     queries_to_run: list,
     jstage_client: JStageClient,
     result_handler: ResultHandler,
     gemini_api_key: str,
-    processed_dois: set,
+    state_store: P1StateStore,
     search_count: int, # 1ページあたりの取得件数 (args.count)
-    max_papers_per_keyword: int # 1キーワードあたりの総取得上限 (args.max_papers_per_keyword)
+    max_papers_per_keyword: int, # 1キーワードあたりの総取得上限 (args.max_papers_per_keyword)
+    article_store: RawArticleStore = None, # ダウンロードした生データの保存先
+    clients: ClientRegistry = None, # プロセスで共有するクライアント
+    prefetch_pages: int = DEFAULT_PREFETCH_PAGES, # 検索ページの先読み数 (0で先読みなし)
+    start_indexes: dict | None = None, # 途中まで検索したキーワードの再開位置 (--resume)
+    workers: int = 0, # Gemini変換のワーカー数 (0で従来の逐次処理)
+    download_workers: int = DEFAULT_DOWNLOAD_WORKERS, # ダウンロードのワーカー数 (workers > 0 の場合のみ)
+    batch_backend: str | None = None, # バッチ変換のバックエンド (None でバッチを使用しない)
+    batch_size: int = DEFAULT_BATCH_SIZE, # 1バッチあたりのリクエスト数
+    yield_tracker: KeywordYieldTracker | None = None, # 検索ページの実績の記録 (--yield-scheduling で絞り込み)
 ):
     """
     生成されたクエリリストに基づいて検索と処理のメインループを実行する
+    検索ページは SearchPrefetcher が裏で先読みするため、論文の処理中も次のページの取得が進む。
+    workers > 0 の場合は、ダウンロード・変換・保存を段階ごとのワーカーで並行して処理する。
+    batch_backend を指定した場合は、変換をバッチジョブにまとめて行う。
     """
     total_queries = len(queries_to_run)
+
+    prefetcher = SearchPrefetcher(
+        jstage_client,
+        queries_to_run,
+        search_count=search_count,
+        max_papers_per_keyword=max_papers_per_keyword,
+        lookahead_pages=prefetch_pages,
+        # エンジン使用時は固定スリープを行わず、検索APIのレーンで間隔を制御する
+        search_sleep=SEARCH_API_SLEEP if workers <= 0 and not batch_backend else 0.0,
+        start_indexes=start_indexes,
+        on_page=yield_tracker.on_page if yield_tracker else None,
+    )
+    # キーワードの検索位置は、ページ内の論文の処理がすべて終わった時点で保存する
+    cursor_tracker = SearchCursorTracker(state_store)
+    articles = iter_search_articles(prefetcher, total_queries, cursor_tracker)
+
+    if batch_backend:
+        return run_batch_conversion(
+            articles, result_handler, gemini_api_key, state_store,
+            article_store=article_store, clients=clients, batch_backend=batch_backend, batch_size=batch_size,
+            cursor_tracker=cursor_tracker,
+        )
+
+    if workers > 0:
+        return run_staged_conversion(
+            articles, result_handler, gemini_api_key, state_store,
+            article_store=article_store, clients=clients, workers=workers, download_workers=download_workers,
+            cursor_tracker=cursor_tracker,
+        )
+
     new_files_created = 0
+    # 取得した論文リストの処理 (既存ロジック)
+    for article in articles:
+        status = process_article(article, result_handler, gemini_api_key, state_store, article_store, clients)
+        if status == "created":
+            new_files_created += 1
+        cursor_tracker.article_finished(article["search_page_id"])
 
-    for i, query in enumerate(queries_to_run):
-        logger.info(f"\n[P1] ({i + 1}/{total_queries}) クエリ実行中: '{query}'")
-
-        # 実行しようとしているキーワードをログに記録
-        log_processed_keyword(PROCESSED_KEYWORDS_LOG, query)
-        
-        start_index = 1
-        total_hits_for_this_query = 0 # このクエリの総ヒット数（初回APIで設定）
-        
-        # ページネーションループ
-        while True:
-            # 1. ユーザー指定の総取得上限を超えていたら、このキーワードは終了
-            if start_index > max_papers_per_keyword:
-                logger.info(f"  -> ユーザー指定の上限 ({max_papers_per_keyword}件) に達したため、このクエリを終了します。")
-                break
-                
-            # 2. (初回ループ以外で) APIの総ヒット数を超えていたら、このキーワードは終了
-            if total_hits_for_this_query > 0 and start_index > total_hits_for_this_query:
-                logger.info(f"  -> APIの総ヒット数 ({total_hits_for_this_query}件) に達したため、このクエリを終了します。")
-                break
-
-            logger.info(f"  -> ページ取得中 (開始位置: {start_index} / 1ページの件数: {search_count})")
-            
-            try:
-                # jstage_client.search_articles が (articles, total_hits) を返す
-                articles, total_hits = jstage_client.search_articles(
-                    query, 
-                    count=search_count, # 1ページあたりの件数
-                    start=start_index   # 開始位置
-                )
-                
-                if start_index == 1: # 最初のループでのみ総ヒット数を記録
-                    total_hits_for_this_query = total_hits
-                    if total_hits == 0:
-                        logger.info("  -> 論文が見つかりませんでした。")
-                        break # このクエリの処理を終了
-
-                time.sleep(SEARCH_API_SLEEP)
-
-            except Exception as search_e:
-                logger.error(f"  -> !! 検索エラー: クエリ '{query}' (開始位置 {start_index}) で失敗しました。詳細: {search_e}")
-                break # このクエリの処理を終了
-
-            if not articles:
-                logger.info("  -> このページの論文が見つかりませんでした。クエリを終了します。")
-                break # ページネーションループを終了
-
-            # 取得した論文リストの処理 (既存ロジック)
-            for article in articles:
-                doi = article.get("doi")
-                if not doi:
-                    logger.warning("  -> スキップ (DOIなし)")
-                    continue
-
-                safe_filename = doi.replace("/", "_") + ".md"
-                markdown_path = os.path.join(RAG_SOURCE_DIR, safe_filename)
-
-                if doi in processed_dois or os.path.exists(markdown_path):
-                    logger.info(f"  -> スキップ (既存): {doi}")
-                    if doi not in processed_dois:
-                         log_processed_doi(PROCESSED_JSTAGE_LOG, doi) # 念のためログにも記録
-                    continue
-
-                logger.info(f"  -> 新規処理: {article['title']} ({doi})")
-
-                # --- DEBUGGING START ---
-                # ユーザーのデバッグリクエストに対応
-                original_url_for_debug = article.get("debug_original_url", "N/A")
-                final_url_for_debug = article.get("url", "N/A")
-                logger.info("    [DEBUG] J-STAGE APIから取得したURL情報:")
-                logger.info(f"    [DEBUG]   - 元URL (API/HTML): {original_url_for_debug}")
-                logger.info(f"    [DEBUG]   - 処理後URL (DL対象): {final_url_for_debug}")
-                if original_url_for_debug != final_url_for_debug:
-                     logger.info("    [DEBUG]   - (注) /_article/ から /_pdf/ へのURL変換が実行されました。")
-                # --- DEBUGGING END ---
-
-                job_data = {
-                    "pipeline": "rag_source",
-                    "url": article.get("url", ""), # Use .get for safety
-                    "metadata": {
-                        "title": article.get("title", "N/A"), # Use .get for safety
-                        "doi": doi,
-                        "journal": article.get("journal", "N/A"), # ★追加★
-                        "published_date": article.get("published_date", "N/A"), # ★追加★
-                        "debug_original_url": article.get("debug_original_url", "")
-                    },
-                }
-
-                try:
-                    result_content = process_pipeline_1(job_data, gemini_api_key)
-                    result_handler.save_result(
-                        job_id=f"p1_{safe_filename}", pipeline_name="rag_source",
-                        result_data=result_content, custom_filename=safe_filename,
-                    )
-                    log_processed_doi(PROCESSED_JSTAGE_LOG, doi)
-                    processed_dois.add(doi)
-                    new_files_created += 1
-                    time.sleep(PROCESS_DOI_SLEEP)
-                except Exception as e:
-                    logger.error(f"  -> !! 処理エラー: {doi} の処理中に失敗しました。詳細: {e}")
-            
-            # ループ継続判定: 次の開始位置を計算
-            start_index += search_count
+    return new_files_created
+
+
+def run_harvest(
+    queries_to_run: list,
+    jstage_client: JStageClient,
+    frontier: ArticleFrontier,
+    state_store: P1StateStore,
+    search_count: int,
+    max_papers_per_keyword: int,
+    prefetch_pages: int = DEFAULT_PREFETCH_PAGES,
+    start_indexes: dict | None = None,
+    yield_tracker: KeywordYieldTracker | None = None,
+) -> int:
+    """
+    収集フェーズ: 全クエリを検索し、ヒットした論文をDOIで重複排除してフロンティアに追加する。
+    LLMによる変換は行わないため、検索はレートリミッターの速度で進む。
+    各ページをフロンティアに追加した時点で、キーワードの検索位置を保存する。
+    新規に追加された論文数を返す。
+    """
+    total_queries = len(queries_to_run)
+    new_articles = 0
+
+    prefetcher = SearchPrefetcher(
+        jstage_client,
+        queries_to_run,
+        search_count=search_count,
+        max_papers_per_keyword=max_papers_per_keyword,
+        lookahead_pages=prefetch_pages,
+        search_sleep=SEARCH_API_SLEEP,
+        start_indexes=start_indexes,
+        on_page=yield_tracker.on_page if yield_tracker else None,
+    )
+
+    for page in prefetcher:
+        query = page["query"]
+        if page["is_first_page"]:
+            logger.info(f"\n[P1] ({page['query_number']}/{total_queries}) 収集中: '{query}'")
+
+        for level, message in page["messages"]:
+            getattr(logger, level)(message)
+
+        yield_page = [query, page["start_index"]]
+        page_new = sum(1 for article in page["articles"] if frontier.add({**article, "yield_page": yield_page}, query))
+        new_articles += page_new
+        last_doi = page["articles"][-1].get("doi") if page["articles"] else None
+        state_store.save_cursor(query, page["next_start_index"], last_doi, page["is_last_page"])
+        if page["articles"]:
+            logger.info(f"  -> {len(page['articles'])} 件中 {page_new} 件が新規の論文です。(フロンティア: {len(frontier)} 件)")
+
+    return new_articles
+
+
+def log_frontier_report(frontier: ArticleFrontier, state_store: P1StateStore) -> dict:
+    """収集結果のレポートをログに出力し、全キーワード分をJSONファイルに保存する。"""
+    report = frontier.build_report(state_store.get_done_dois())
+
+    logger.info("\n" + "=" * 50)
+    logger.info("収集結果レポート (LLM処理前)")
+    logger.info(f"ヒット件数 (重複込み): {report['total_hits']} 件")
+    logger.info(f"ユニークな論文数: {report['unique_articles']} 件")
+    logger.info(f"  - 処理済み: {report['already_processed']} 件")
+    logger.info(f"  - 未処理 (変換対象): {report['pending']} 件")
+
+    ranked = sorted(report["keywords"].items(), key=lambda item: item[1]["pending"], reverse=True)
+    if ranked:
+        logger.info(f"未処理の論文数が多いキーワード (上位 {min(len(ranked), FRONTIER_REPORT_TOP_KEYWORDS)} 件):")
+        for keyword, stats in ranked[:FRONTIER_REPORT_TOP_KEYWORDS]:
+            logger.info(
+                f"  - '{keyword}': ヒット {stats['hits']} / 未処理 {stats['pending']} / "
+                f"このキーワードのみ {stats['exclusive']}"
+            )
+    logger.info("=" * 50)
+
+    with open(FRONTIER_REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"[P1] 収集結果レポートを '{FRONTIER_REPORT_PATH}' に保存しました。")
+    return report
+
+
+def log_yield_report(state_store: P1StateStore, yield_tracker: KeywordYieldTracker) -> dict:
+    """
+    キーワードごとの収穫（新規/既知の DOI 数・変換の失敗数）のレポートをログに出力し、
+    全キーワード分をJSONファイルに保存する。
+    """
+    yields = state_store.get_keyword_yields()
+    for keyword, keyword_yield in yields.items():
+        keyword_yield["saturated"] = yield_tracker.is_saturated(keyword_yield)
+    ranked = sorted(yields.items(), key=lambda item: item[1]["new_dois"], reverse=True)
+    saturated = [keyword for keyword, keyword_yield in ranked if keyword_yield["saturated"]]
 
+    logger.info("\n" + "=" * 50)
+    logger.info("収穫レポート (キーワードごとの新規論文)")
+    logger.info(
+        f"キーワード数: {len(yields)} 件 / 新規 {sum(y['new_dois'] for y in yields.values())} 件 / "
+        f"既知 {sum(y['duplicate_dois'] for y in yields.values())} 件 / 変換失敗 {sum(y['failures'] for y in yields.values())} 件"
+    )
+    if ranked:
+        logger.info(f"新規論文が多いキーワード (上位 {min(len(ranked), YIELD_REPORT_TOP_KEYWORDS)} 件):")
+        for keyword, keyword_yield in ranked[:YIELD_REPORT_TOP_KEYWORDS]:
+            logger.info(
+                f"  - '{keyword}': ヒット {keyword_yield['total_hits']} / 検索 {keyword_yield['articles']} 件 "
+                f"({keyword_yield['pages']} ページ) / 新規 {keyword_yield['new_dois']} / 既知 {keyword_yield['duplicate_dois']} / "
+                f"変換失敗 {keyword_yield['failures']} / 新規率 {keyword_yield['novelty_ratio']:.0%}"
+            )
+    logger.info(f"飽和したキーワード (--yield-scheduling で検索しない): {len(saturated)} 件")
+    run_stats = yield_tracker.stats
+    if run_stats["pages"]:
+        logger.info(
+            f"今回の検索: {run_stats['pages']} ページ / 新規 {run_stats['new_dois']} 件 / 既知 {run_stats['duplicate_dois']} 件 / "
+            f"新規の割合が低くページ送りを終了したキーワード {run_stats['stopped_queries']} 件"
+        )
+    logger.info("=" * 50)
+
+    report = {
+        "saturation_novelty": yield_tracker.saturation_novelty,
+        "saturation_min_articles": yield_tracker.saturation_min_articles,
+        "keywords": dict(ranked),
+    }
+    with open(YIELD_REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"[P1] 収穫レポートを '{YIELD_REPORT_PATH}' に保存しました。")
+    return report
+
+
+def run_frontier_conversion(
+    frontier: ArticleFrontier,
+    result_handler: ResultHandler,
+    gemini_api_key: str,
+    state_store: P1StateStore,
+    article_store: RawArticleStore = None,
+    clients: ClientRegistry = None,
+    workers: int = 0,
+    download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    batch_backend: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    変換フェーズ: フロンティアの未処理の論文を1件ずつ変換する。
+    各論文は重複排除済みのため、複数キーワードでヒットした論文も1回だけ処理される。
+    """
+    pending = [
+        {**item, "article": {**item["article"], "source_keyword": ", ".join(item["keywords"])}}
+        for item in frontier.iter_pending(state_store.get_done_dois())
+    ]
+    logger.info(f"[P1] フロンティアから {len(pending)} 件の論文を変換します。")
+
+    if batch_backend:
+        return run_batch_conversion(
+            (item["article"] for item in pending), result_handler, gemini_api_key, state_store,
+            article_store=article_store, clients=clients, batch_backend=batch_backend, batch_size=batch_size,
+        )
+
+    if workers > 0:
+        return run_staged_conversion(
+            (item["article"] for item in pending), result_handler, gemini_api_key, state_store,
+            article_store=article_store, clients=clients, workers=workers, download_workers=download_workers,
+        )
+
+    new_files_created = 0
+    for i, item in enumerate(pending):
+        logger.info(f"\n[P1] ({i + 1}/{len(pending)}) キーワード: {', '.join(item['keywords'])}")
+        status = process_article(item["article"], result_handler, gemini_api_key, state_store, article_store, clients)
+        if status == "created":
+            new_files_created += 1
     return new_files_created
 
 
+def run_reconvert_from_store(
+    article_store: RawArticleStore, result_handler: ResultHandler, gemini_api_key: str, clients: ClientRegistry = None
+) -> int:
+    """
+    生データストアに保存済みの全論文について、J-STAGEへアクセスせずにMarkdownを再生成する。
+    (プロンプトやモデルを変更した場合に使用する)
+    """
+    dois = article_store.list_dois()
+    logger.info(f"[P1] 生データストアから {len(dois)} 件の論文を再変換します。")
+
+    reconverted = 0
+    for i, doi in enumerate(dois):
+        safe_filename = doi.replace("/", "_") + ".md"
+        logger.info(f"\n[P1] ({i + 1}/{len(dois)}) 再変換中: {doi}")
+        try:
+            result_content = reconvert_from_store(doi, article_store, gemini_api_key, clients=clients)
+            result_handler.save_result(
+                job_id=f"p1_{safe_filename}", pipeline_name="rag_source",
+                result_data=result_content, custom_filename=safe_filename,
+            )
+            reconverted += 1
+        except Exception as e:
+            logger.error(f"  -> !! 再変換エラー: {doi} の処理中に失敗しました。詳細: {e}")
+    return reconverted
+
+
 def run(args, keyword_list_map):
     """
     パイプライン1（RAGソース生成）を実行します。
     """
+    setup_logging()
     logger.info("[P1] J-STAGE論文の検索とRAGソースの生成を開始します...")
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
@@ -246,24 +776,107 @@ def run(args, keyword_list_map):
         return
 
     os.makedirs(RAG_SOURCE_DIR, exist_ok=True)
+    article_store = RawArticleStore()
+
+    # クライアントはプロセスで1つずつ生成し、各記事の処理で使い回す（接続プールとリミッターの状態を維持する）
+    # 検索結果ページはディスクにキャッシュし、再開・再実行時の再取得を避ける
+    clients = ClientRegistry(gemini_api_key=gemini_api_key, search_cache=SearchCache())
+    set_default_registry(clients)
+    if getattr(args, "record_llm", None):
+        # Gemini の応答を記録し、bench コマンドで再生できるようにする
+        clients.llm_backend = RecordingGeminiBackend(clients.get_genai_client(gemini_api_key), args.record_llm)
+        logger.info(f"[P1] Gemini の応答を '{args.record_llm}' に記録します。")
+
+    if getattr(args, "reconvert_from_store", False):
+        try:
+            reconverted = run_reconvert_from_store(
+                article_store, ResultHandler(base_output_dir="output"), gemini_api_key, clients=clients
+            )
+        finally:
+            article_store.close()
+            clients.flush()
+        logger.info("\n" + "=" * 50)
+        logger.info("パイプライン1 (生データストアからの再変換) 実行完了")
+        logger.info(f"再変換ファイル数: {reconverted} 件")
+        logger.info("=" * 50)
+        return
+
+    # 論文・キーワードの進捗は状態ストア（SQLite）に記録する
+    state_store = open_state_store(DEFAULT_STATE_DB_PATH)
+    try:
+        run_with_state_store(args, keyword_list_map, gemini_api_key, state_store, article_store, clients)
+    finally:
+        state_store.close()
+        # 生データストアのインデックス（最終アクセス日時を含む）・モデルの振り分けとPDF URLの書き換えの実績の未保存の変更を書き込む
+        article_store.close()
+        clients.flush()
 
-    # resumeオプションがない場合は、キーワード進捗ログをリセットする
-    if not args.resume and os.path.exists(PROCESSED_KEYWORDS_LOG):
-        os.remove(PROCESSED_KEYWORDS_LOG)
-        logger.info(f"[P1] --resumeオプションがないため、キーワード進捗ログ '{PROCESSED_KEYWORDS_LOG}' をリセットしました。")
 
-    processed_dois = load_processed_dois(PROCESSED_JSTAGE_LOG)
-    processed_keywords = load_processed_keywords(PROCESSED_KEYWORDS_LOG) if args.resume else set()
+def run_with_state_store(
+    args,
+    keyword_list_map,
+    gemini_api_key: str,
+    state_store: P1StateStore,
+    article_store: RawArticleStore,
+    clients: ClientRegistry,
+):
+    """状態ストアを開いた後の、検索・変換の本体。"""
+    # --yield-scheduling: 検索ページの実績から、飽和したキーワードを除外し、新規論文の少ないページでページ送りを終了する
+    yield_tracker = KeywordYieldTracker(
+        state_store,
+        scheduling=getattr(args, "yield_scheduling", False),
+        min_page_novelty=getattr(args, "min_page_novelty", DEFAULT_MIN_PAGE_NOVELTY),
+    )
+    if getattr(args, "yield_report", False):
+        log_yield_report(state_store, yield_tracker)
+        return
 
-    jstage_client = JStageClient()
+    # resumeオプションがない場合は、キーワードの検索位置をリセットする
+    if not args.resume and state_store.get_cursors():
+        state_store.reset_cursors()
+        logger.info("[P1] --resumeオプションがないため、キーワードの検索位置をリセットしました。")
+
+    # --frontier / --harvest-only: 先に全キーワードを検索し、重複排除したフロンティアから変換する
+    use_frontier = getattr(args, "frontier", False) or getattr(args, "harvest_only", False)
+    frontier = None
+    if use_frontier:
+        frontier = ArticleFrontier(DEFAULT_FRONTIER_PATH)
+        if not args.resume and len(frontier) > 0:
+            frontier.reset()
+            logger.info(f"[P1] --resumeオプションがないため、フロンティア '{DEFAULT_FRONTIER_PATH}' をリセットしました。")
+        # 前回収集したフロンティアの論文は、再び検索でヒットしても新規として数えない
+        yield_tracker.add_known_dois(item["doi"] for item in frontier.iter_pending(set()))
+
+    # --batch: 変換を Gemini Batch API（または --batch-backend local の代替）のジョブにまとめて行う
+    batch_backend = getattr(args, "batch_backend", "gemini") if getattr(args, "batch", False) else None
+    batch_size = getattr(args, "batch_size", DEFAULT_BATCH_SIZE)
+
+    # --resume: 検索が完了したキーワードは除外し、途中のキーワードは保存した検索位置のページから再開する
+    processed_keywords = state_store.get_completed_keywords() if args.resume else set()
+    start_indexes = state_store.get_resume_start_indexes() if args.resume else {}
+    if processed_keywords or start_indexes:
+        logger.info(
+            f"[P1] 状態ストアから、検索済みのキーワード {len(processed_keywords)} 件と、"
+            f"途中から再開するキーワード {len(start_indexes)} 件を読み込みました。"
+        )
+
+    jstage_client = clients.get_jstage_client()
     result_handler = ResultHandler(base_output_dir="output")
 
-    all_queries_list = get_queries_to_run(args, keyword_list_map, processed_keywords)
+    all_queries_list = get_queries_to_run(
+        args, keyword_list_map, processed_keywords, jstage_client, keyword_yields=state_store.get_keyword_yields()
+    )
+    all_queries_list, saturated_queries = yield_tracker.filter_queries(all_queries_list)
+    if saturated_queries:
+        logger.info(
+            f"[P1] --yield-scheduling: 過去の実績で新規論文がほとんどない {len(saturated_queries)} 件のキーワードを除外しました。"
+        )
 
     max_queries = args.max_queries
     if max_queries <= 0 or len(all_queries_list) < max_queries:
         max_queries = len(all_queries_list)
-        if len(all_queries_list) == 0:
+        # (--batch の場合は、前回送信したバッチジョブの結果を受け取るために続行する)
+        if len(all_queries_list) == 0 and not use_frontier and not batch_backend:
             logger.info("[P1] 実行対象の検索クエリが0件です。処理を終了します。")
             return
         logger.info(f"全 {max_queries} 件のクエリを実行します。")
@@ -272,19 +885,120 @@ def run(args, keyword_list_map):
 
     queries_to_run = all_queries_list[:max_queries]
 
-    new_files_created = run_search_loop(
-        queries_to_run=queries_to_run,
-        jstage_client=jstage_client,
-        result_handler=result_handler,
-        gemini_api_key=gemini_api_key,
-        processed_dois=processed_dois,
-        search_count=args.count,
-        max_papers_per_keyword=args.max_papers_per_keyword
-    )
+    if use_frontier:
+        run_harvest(
+            queries_to_run=queries_to_run,
+            jstage_client=jstage_client,
+            frontier=frontier,
+            state_store=state_store,
+            search_count=args.count,
+            max_papers_per_keyword=args.max_papers_per_keyword,
+            prefetch_pages=getattr(args, "prefetch_pages", DEFAULT_PREFETCH_PAGES),
+            start_indexes=start_indexes,
+            yield_tracker=yield_tracker,
+        )
+        frontier.close()
+        log_frontier_report(frontier, state_store)
+        if getattr(args, "harvest_only", False):
+            log_yield_report(state_store, yield_tracker)
+            logger.info("[P1] --harvest-only が指定されたため、変換は行わずに終了します。")
+            return
+        new_files_created = run_frontier_conversion(
+            frontier, result_handler, gemini_api_key, state_store, article_store=article_store, clients=clients,
+            workers=getattr(args, "workers", 0),
+            download_workers=getattr(args, "download_workers", DEFAULT_DOWNLOAD_WORKERS),
+            batch_backend=batch_backend,
+            batch_size=batch_size,
+        )
+    else:
+        new_files_created = run_search_loop(
+            queries_to_run=queries_to_run,
+            jstage_client=jstage_client,
+            result_handler=result_handler,
+            gemini_api_key=gemini_api_key,
+            state_store=state_store,
+            search_count=args.count,
+            max_papers_per_keyword=args.max_papers_per_keyword,
+            article_store=article_store,
+            clients=clients,
+            prefetch_pages=getattr(args, "prefetch_pages", DEFAULT_PREFETCH_PAGES),
+            start_indexes=start_indexes,
+            workers=getattr(args, "workers", 0),
+            download_workers=getattr(args, "download_workers", DEFAULT_DOWNLOAD_WORKERS),
+            batch_backend=batch_backend,
+            batch_size=batch_size,
+            yield_tracker=yield_tracker,
+        )
+
+    log_yield_report(state_store, yield_tracker)
 
     logger.info("\n" + "=" * 50)
     logger.info("パイプライン1 実行完了")
     logger.info(f"新規作成ファイル数: {new_files_created} 件")
     logger.info(f"RAGソースフォルダ: {RAG_SOURCE_DIR}")
+    # レーンごとの待機時間（どのレーンがボトルネックかの確認用）
+    for lane_name, stats in jstage_client.lanes.get_wait_stats().items():
+        logger.info(
+            f"レーン '{lane_name}': リクエスト {stats['acquire_count']} 回 / "
+            f"待機 {stats['wait_count']} 回 / 合計待機 {stats['total_wait_time']:.1f} 秒"
+        )
+    gemini_stats = clients.get_gemini_controller().get_stats()
+    logger.info(
+        f"Gemini同時実行数: 最終上限 {gemini_stats['limit']:.1f} / 最大 {gemini_stats['peak_limit']:.1f} / "
+        f"呼び出し {gemini_stats['calls']} 回 / レート制限 {gemini_stats['throttled']} 回 / 再試行 {gemini_stats['retries']} 回"
+    )
+    for purpose, stats in clients.get_llm_stats().items():
+        logger.info(
+            f"LLM呼び出し '{purpose}': {stats['calls']} 回 (失敗 {stats['failed']} / 再試行 {stats['retries']}, うち429/503 {stats['throttle_retries']}) / "
+            f"平均 {stats['avg_latency']:.1f} 秒 (p95 {stats['p95_latency']:.1f} 秒) / "
+            f"入力 {stats['prompt_tokens']} トークン (うちキャッシュ {stats['cached_tokens']}) / 出力 {stats['output_tokens']} トークン"
+        )
+    # Markdown変換プロンプトのコンテキストキャッシュ（実行の終わりに削除する）
+    context_cache_stats = clients.get_context_cache_stats()
+    if context_cache_stats:
+        logger.info(
+            f"コンテキストキャッシュ: 作成 {context_cache_stats['created']} / 再利用 {context_cache_stats['reused']} / "
+            f"対象外 {context_cache_stats['skipped']} / 失敗 {context_cache_stats['failed']}"
+        )
+        clients.release_context_caches()
+    resolver_counters = clients.get_article_resolver().counters
+    logger.info(
+        f"PDF/HTML判定: PDF直接 {resolver_counters['direct_pdf']} / プローブでPDF {resolver_counters['probed_pdf']} / "
+        f"プローブでHTML {resolver_counters['probed_html']} / 実績によりPDF省略 {resolver_counters['skipped_pdf']}"
+    )
+    file_cache_stats = clients.get_gemini_file_cache().stats
+    logger.info(
+        f"PDFアップロード: アップロード {file_cache_stats['uploads']} 回 / 再利用 {file_cache_stats['hits']} 回 / "
+        f"期限切れ {file_cache_stats['expired']} / 無効化 {file_cache_stats['invalidated']}"
+    )
+    # 変換の経路ごとの処理時間・入力トークン（1ページあたりの値で経路の選択による節約量を確認する）
+    for route, stats in clients.get_conversion_route_stats().get_stats().items():
+        logger.info(
+            f"変換経路 '{route}': {stats['calls']} 件 (失敗 {stats['failed']}) / 平均 {stats['avg_latency']:.1f} 秒 "
+            f"(p95 {stats['p95_latency']:.1f} 秒) / 入力 {stats['prompt_tokens']} トークン / "
+            f"1ページあたり {stats['prompt_tokens_per_page']:.0f} トークン, {stats['seconds_per_page']:.1f} 秒"
+        )
+    # モデル・思考予算の振り分けごとの処理時間・推定コストと、出力の検証による昇格の回数
+    model_router = clients.get_model_router()
+    for route_key, stats in model_router.get_stats().items():
+        logger.info(
+            f"モデル振り分け '{route_key}': {stats['calls']} 回 (失敗 {stats['failed']}) / 平均 {stats['avg_latency']:.1f} 秒 "
+            f"(p95 {stats['p95_latency']:.1f} 秒) / 入力 {stats['prompt_tokens']} トークン / 出力 {stats['output_tokens']} トークン / "
+            f"推定コスト ${stats['cost_usd']:.4f}"
+        )
+    for escalation, count in model_router.escalations.items():
+        logger.info(f"モデルの昇格 '{escalation}': {count} 回")
+    cache_stats = jstage_client.search_cache.stats
+    logger.info(
+        f"検索キャッシュ: ヒット {cache_stats['hits']} / 期限切れ {cache_stats['stale']} "
+        f"(再検証 {cache_stats['revalidated']}) / ミス {cache_stats['misses']}"
+    )
+    state_stats = state_store.get_stats()
+    logger.info(
+        f"状態ストア: 処理済み {state_stats['counts'].get('done', 0)} 件 / 失敗 {state_stats['counts'].get('failed', 0)} 件 / "
+        f"再試行した論文 {state_stats['retried']} 件 / 平均処理時間 {state_stats['done_avg_seconds']:.1f} 秒"
+    )
+    for error, count in state_stats["top_errors"]:
+        logger.info(f"  - 失敗 {count} 件: {error}")
     logger.info("=" * 50)
 
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.genai import errors as genai_errors
+
+from benchmarks.bench_adaptive_concurrency import FakeGeminiBackend
+from core.adaptive_concurrency import AdaptiveConcurrencyController
+
+
+def _controller(**kwargs) -> AdaptiveConcurrencyController:
+    params = {"min_limit": 1, "max_limit": 16, "base_backoff": 0.0, "max_backoff": 0.0, "sleep": lambda seconds: None}
+    params.update(kwargs)
+    return AdaptiveConcurrencyController("test", **params)
+
+
+def test_limit_drops_on_429_and_settles_within_capacity():
+    backend = FakeGeminiBackend(capacity=2, latency=0.02)
+    controller = _controller(initial_limit=8, max_retries=20)
+    start = threading.Barrier(8)
+
+    def one_call(_):
+        start.wait()
+        return controller.call(backend.generate_content, model="fake", contents="prompt")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(one_call, range(8)))
+
+    stats = controller.get_stats()
+    assert results == [{"text": "ok"}] * 8
+    assert backend.throttled > 0
+    assert stats["throttled"] == backend.throttled
+    assert stats["decreases"] >= 1
+    assert stats["limit"] < 8
+
+
+def test_limit_rises_additively_after_successes():
+    backend = FakeGeminiBackend(capacity=100, latency=0.0)
+    controller = _controller(initial_limit=2, increase_step=1.0)
+
+    # 上限1つ分の成功ごとに +1（1回の成功で +1/limit）
+    for _ in range(2):
+        controller.call(backend.generate_content)
+    assert controller.limit == pytest.approx(3.0, abs=0.25)
+    for _ in range(3):
+        controller.call(backend.generate_content)
+    assert controller.limit == pytest.approx(4.0, abs=0.25)
+    assert controller.get_stats()["peak_limit"] == controller.limit
+
+
+def test_call_fails_after_max_retries():
+    backend = FakeGeminiBackend(capacity=0, latency=0.0)
+    controller = _controller(initial_limit=4, max_retries=3)
+
+    with pytest.raises(genai_errors.ClientError):
+        controller.call(backend.generate_content)
+
+    stats = controller.get_stats()
+    assert backend.throttled == 4
+    assert stats["retries"] == 3
+    assert stats["throttled"] == 4
+    assert stats["in_flight"] == 0
@@ -0,0 +1,19 @@
+from core.article_frontier import ArticleFrontier
+
+
+def test_repeated_keyword_hit_is_counted_and_persisted_once(tmp_path):
+    path = str(tmp_path / "frontier.jsonl")
+    frontier = ArticleFrontier(path)
+    article = {"doi": "10.1/a", "title": "A"}
+    assert frontier.add(article, "膝") is True
+    assert frontier.add(article, "膝") is False
+    assert frontier.add(article, "股関節") is False
+    frontier.close()
+
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    reloaded = ArticleFrontier(path)
+    report = reloaded.build_report(set())
+    assert report["total_hits"] == 2
+    assert report["keywords"]["膝"]["hits"] == 1
+    assert reloaded.get_keywords("10.1/a") == ["膝", "股関節"]
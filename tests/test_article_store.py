@@ -0,0 +1,24 @@
+import os
+
+from utils.article_store import RawArticleStore
+
+
+def test_unreferenced_blobs_are_removed_on_startup(tmp_path):
+    store_dir = str(tmp_path / "raw_articles")
+    store = RawArticleStore(store_dir, flush_every=1)
+    kept = store.put("10.1/kept", b"kept", "application/pdf", "https://example.com/kept")
+    store.close()
+
+    # インデックスを保存する前に終了した put の本体と、書き込み途中の一時ファイル
+    store = RawArticleStore(store_dir, flush_every=100, flush_interval=3600)
+    orphan = store.put("10.1/orphan", b"orphan", "application/pdf", "https://example.com/orphan")
+    tmp_blob = os.path.join(store.blobs_dir, kept[:2], f"{kept}.tmp")
+    with open(tmp_blob, "wb") as f:
+        f.write(b"partial")
+
+    reopened = RawArticleStore(store_dir)
+    assert reopened.list_dois() == ["10.1/kept"]
+    assert os.path.exists(reopened._blob_path(kept))
+    assert not os.path.exists(reopened._blob_path(orphan))
+    assert not os.path.exists(tmp_blob)
+    assert reopened.total_bytes() == len(b"kept")
@@ -0,0 +1,58 @@
+from google.genai import types
+
+from core.batch_conversion import BatchConversionManager, LocalBatchBackend, estimate_request_bytes
+
+
+def _request(text: str) -> dict:
+    return {"model": "gemini-2.5-flash", "contents": text, "config": None}
+
+
+def test_pending_local_job_is_resumed_without_resubmitting(tmp_path):
+    state_dir = tmp_path / "batch_jobs"
+    generated = []
+
+    def generate(request: dict) -> str:
+        generated.append(request["contents"])
+        return f"# {request['contents']}"
+
+    def backend():
+        return LocalBatchBackend(generate, results_dir=str(state_dir / "local"))
+
+    first_results = []
+    first = BatchConversionManager(
+        backend(), lambda meta, text: first_results.append(meta), lambda meta, message: None,
+        state_dir=str(state_dir), batch_size=2,
+    )
+    first.add("10.1/a", {"doi": "10.1/a"}, _request("a"), 1)
+    first.add("10.1/b", {"doi": "10.1/b"}, _request("b"), 1)
+    # 送信後、結果を受け取る前に中断した状態
+    assert first.stats["submitted_jobs"] == 1
+    assert first_results == []
+
+    results, errors = [], []
+    second = BatchConversionManager(
+        backend(), lambda meta, text: results.append((meta["doi"], text)),
+        lambda meta, message: errors.append((meta["doi"], message)),
+        state_dir=str(state_dir), batch_size=2,
+    )
+    assert second.in_flight_keys() == {"10.1/a", "10.1/b"}
+    assert second.poll() == 0
+
+    assert results == [("10.1/a", "# a"), ("10.1/b", "# b")]
+    assert errors == []
+    assert generated == ["a", "b"]
+    assert second.stats["submitted_jobs"] == 0
+    assert second.in_flight_keys() == set()
+
+    # 完了したジョブは、さらに次の実行でも再開しない
+    third = BatchConversionManager(
+        backend(), lambda meta, text: results.append(meta), lambda meta, message: None, state_dir=str(state_dir)
+    )
+    assert third.in_flight_keys() == set()
+
+
+def test_request_size_counts_inline_pdf_as_base64():
+    pdf = b"%PDF" + b"\0" * 2996
+    request = {"contents": [types.Part.from_bytes(data=pdf, mime_type="application/pdf"), "変換"]}
+    assert estimate_request_bytes(request) == 4000 + len("変換".encode("utf-8"))
+    assert estimate_request_bytes(_request("本文")) == len("本文".encode("utf-8"))
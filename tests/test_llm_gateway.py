@@ -0,0 +1,33 @@
+import types
+
+from google.genai import errors as genai_errors
+
+from core.adaptive_concurrency import AdaptiveConcurrencyController
+from core.llm_gateway import LLMGateway
+
+
+class ThrottlingModels:
+    """最初の throttle_count 回は 429 を返す偽の models。"""
+
+    def __init__(self, throttle_count: int):
+        self.throttle_count = throttle_count
+
+    def generate_content(self, **kwargs):
+        if self.throttle_count > 0:
+            self.throttle_count -= 1
+            raise genai_errors.ClientError(429, {"error": {"code": 429, "message": "fake", "status": "RESOURCE_EXHAUSTED"}})
+        return types.SimpleNamespace(text="ok", usage_metadata=None)
+
+
+def test_controller_throttle_retries_are_counted_per_purpose():
+    controller = AdaptiveConcurrencyController("test", initial_limit=2, base_backoff=0.0, max_backoff=0.0, sleep=lambda seconds: None)
+    gateway = LLMGateway(types.SimpleNamespace(models=ThrottlingModels(2)), controller, sleep=lambda seconds: None)
+
+    assert gateway.generate("fake", "prompt", purpose="p2_plan")["text"] == "ok"
+    assert gateway.generate("fake", "prompt", purpose="p3_material")["text"] == "ok"
+
+    stats = gateway.get_stats()
+    assert stats["p2_plan"]["throttle_retries"] == 2
+    assert stats["p2_plan"]["retries"] == 2
+    assert stats["p3_material"]["throttle_retries"] == 0
+    assert stats["p3_material"]["retries"] == 0
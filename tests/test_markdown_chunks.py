@@ -0,0 +1,46 @@
+from utils.markdown_chunks import _split_blocks, stitch_markdown_chunks
+
+
+def test_split_blocks_separates_code_fence_from_paragraphs():
+    blocks = _split_blocks("段落\n```\ncode\n```\n後")
+    assert blocks == ["段落", "```\ncode\n```", "後"]
+
+
+def test_stitch_removes_overlapping_pages():
+    chunk_a = "## 序論\n\n本研究では歩行訓練の効果を検証した。\n\n対象は回復期の脳卒中患者20名である。"
+    chunk_b = "対象は回復期の脳卒中患者20名である。\n\n## 方法\n\n評価には10m歩行テストを用いた。"
+    stitched = stitch_markdown_chunks([chunk_a, chunk_b])
+    assert stitched.count("対象は回復期の脳卒中患者20名である。") == 1
+    assert stitched.endswith("## 方法\n\n評価には10m歩行テストを用いた。")
+
+
+def test_stitch_keeps_sections_with_repeated_subsection_names():
+    chunk_a = "\n\n".join([
+        "## 実験1", "実験1では座位での反応時間を測定した。",
+        "### 方法", "被験者10名に光刺激を提示した。",
+        "### 結果", "反応時間は平均320msであった。",
+    ])
+    chunk_b = "\n\n".join([
+        "## 実験2", "実験2では立位での反応時間を測定した。",
+        "### 方法", "被験者12名に音刺激を提示した。",
+        "### 結果", "反応時間は平均280msであった。",
+    ])
+    stitched = stitch_markdown_chunks([chunk_a, chunk_b])
+    assert stitched == chunk_a + "\n\n" + chunk_b
+
+
+def test_stitch_keeps_repeated_heading_when_following_block_is_new():
+    chunk_a = "\n\n".join(["## 結果", "歩行速度は有意に改善した。", "### 考察", "筋力の向上が要因と考えられる。"])
+    chunk_b = "\n\n".join(["歩行速度は有意に改善した。", "### 考察", "バランス能力の改善も寄与した可能性がある。"])
+    stitched = stitch_markdown_chunks([chunk_a, chunk_b])
+    assert stitched == "\n\n".join([
+        "## 結果", "歩行速度は有意に改善した。", "### 考察", "筋力の向上が要因と考えられる。",
+        "### 考察", "バランス能力の改善も寄与した可能性がある。",
+    ])
+
+
+def test_stitch_drops_heading_that_ends_previous_chunk():
+    chunk_a = "\n\n".join(["## 結果", "歩行速度は有意に改善した。", "### 考察"])
+    chunk_b = "\n\n".join(["歩行速度は有意に改善した。", "### 考察", "改善の要因として筋力の向上が考えられる。"])
+    stitched = stitch_markdown_chunks([chunk_a, chunk_b])
+    assert stitched == "\n\n".join(["## 結果", "歩行速度は有意に改善した。", "### 考察", "改善の要因として筋力の向上が考えられる。"])
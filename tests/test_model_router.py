@@ -0,0 +1,30 @@
+import json
+
+from core.model_router import ModelRouter
+
+
+def test_routing_log_is_buffered_until_flush(tmp_path):
+    log_path = tmp_path / "model_routing_log.jsonl"
+    router = ModelRouter(
+        path=str(tmp_path / "model_router_stats.json"), routing_log_path=str(log_path),
+        enabled=True, flush_every=100, flush_interval=3600,
+    )
+    decision = router.route_generation("p2_plan")
+    router.escalate(decision, "検証に失敗")
+    assert not log_path.exists()
+
+    router.flush()
+    events = [json.loads(line)["event"] for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert events == ["route", "escalate"]
+
+
+def test_routing_log_is_written_when_flush_every_is_reached(tmp_path):
+    log_path = tmp_path / "model_routing_log.jsonl"
+    router = ModelRouter(
+        path=str(tmp_path / "model_router_stats.json"), routing_log_path=str(log_path),
+        enabled=True, flush_every=2, flush_interval=3600,
+    )
+    router.route_generation("p2_plan")
+    assert not log_path.exists()
+    router.route_generation("p3_material")
+    assert len(log_path.read_text(encoding="utf-8").splitlines()) == 2
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.jstage_client import AsyncJStageClient, JStageClient
+from utils.rate_limiter import LimiterLanes
+
+INTERVAL = 0.2
+# サーバーに届くまでの時間のばらつきの許容幅（秒）
+TOLERANCE = 0.05
+SYNC_REQUESTS = 6
+ASYNC_REQUESTS = 4
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.arrivals_lock:
+            self.server.arrivals.append(time.monotonic())
+        body = b"<html><body>article</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RecordingHandler)
+    httpd.arrivals, httpd.arrivals_lock = [], threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_shared_lane_spaces_requests_across_threads_and_event_loop(server):
+    httpd, base_url = server
+    lanes = LimiterLanes({"search": {"interval": INTERVAL, "burst": 1}, "article": {"interval": INTERVAL, "burst": 1}})
+    sync_client = JStageClient(lanes=lanes)
+    async_ready, start = threading.Event(), threading.Event()
+
+    async def run_async():
+        async with AsyncJStageClient(lanes=lanes) as client:
+            # 接続の確立にかかる時間が計測に入らないよう、先に1件ずつリクエストしておく
+            await client.download_article_content(f"{base_url}/warmup/async")
+            async_ready.set()
+            await asyncio.to_thread(start.wait)
+            return await asyncio.gather(
+                *(client.download_article_content(f"{base_url}/async/{i}") for i in range(ASYNC_REQUESTS))
+            )
+
+    with ThreadPoolExecutor(max_workers=SYNC_REQUESTS + 1) as executor:
+        async_future = executor.submit(asyncio.run, run_async())
+        sync_client.download_article_content(f"{base_url}/warmup/sync")
+        assert async_ready.wait(timeout=10)
+        time.sleep(2 * INTERVAL)
+        before = lanes.get_wait_stats()["article:127.0.0.1"]
+        with httpd.arrivals_lock:
+            httpd.arrivals.clear()
+
+        start.set()
+        sync_results = list(executor.map(
+            lambda i: sync_client.download_article_content(f"{base_url}/sync/{i}"), range(SYNC_REQUESTS)
+        ))
+        async_results = async_future.result()
+
+    assert all(content for content, _ in sync_results + async_results)
+    arrivals = sorted(httpd.arrivals)
+    assert len(arrivals) == SYNC_REQUESTS + ASYNC_REQUESTS
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert min(gaps) >= INTERVAL - TOLERANCE
+
+    stats = lanes.get_wait_stats()
+    assert list(stats) == ["article:127.0.0.1"]
+    lane = stats["article:127.0.0.1"]
+    assert lane["acquire_count"] - before["acquire_count"] == SYNC_REQUESTS + ASYNC_REQUESTS
+    # バースト1のため、最初の1件以外はすべて待機する
+    assert lane["wait_count"] - before["wait_count"] == SYNC_REQUESTS + ASYNC_REQUESTS - 1
+    # 予約した待機時間の合計は 1 + 2 + ... + (n-1) 間隔分になる
+    expected_wait = INTERVAL * sum(range(SYNC_REQUESTS + ASYNC_REQUESTS))
+    assert lane["total_wait_time"] - before["total_wait_time"] == pytest.approx(expected_wait, abs=INTERVAL)
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import time
+import threading
+from urllib.parse import urlparse
+
+from utils.jstage_client import JStageClient
+
+DEFAULT_PDF_REWRITE_STATS_PATH = os.path.join("output", "cache", "pdf_rewrite_stats.json")
+# 統計をまとめて保存する件数・間隔（秒）
+DEFAULT_STATS_FLUSH_EVERY = 20
+DEFAULT_STATS_FLUSH_INTERVAL = 30.0
+
+# J-STAGEの論文URL (/article/<雑誌コード>/...) から雑誌コードを取り出す
+JSTAGE_JOURNAL_PATTERN = re.compile(r"/article/([^/]+)/")
+
+
+def journal_key_from_url(url: str) -> str:
+    """URLから雑誌を識別するキーを返す（J-STAGE以外のURLはホスト名）。"""
+    match = JSTAGE_JOURNAL_PATTERN.search(url or "")
+    if match:
+        return match.group(1)
+    return urlparse(url or "").netloc or "unknown"
+
+
+class PdfRewriteStats:
+    """
+    雑誌ごとの /_article/ → /_pdf/ 書き換えの成否を記録するテーブル。
+    JSONファイルに保存し、実行をまたいで引き継ぐ。
+
+    - 試行回数が min_samples 未満の雑誌は「不明」として、事前プローブで確認する。
+    - 成功率が pdf_rate 以上の雑誌は、プローブせずにPDFを直接ダウンロードする。
+    - 成功率が html_rate 以下の雑誌は、PDFを試さずにHTMLをダウンロードする。
+      ただし reprobe_every 回に1回はプローブし、PDF提供を始めた雑誌を取りこぼさないようにする。
+    - 保存は record の flush_every 回ごと、または flush_interval 秒ごとにまとめて行う（decide は書き込まない）。
+      実行の終わりに flush で未保存分を書き込む。
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PDF_REWRITE_STATS_PATH,
+        min_samples: int = 3,
+        pdf_rate: float = 0.9,
+        html_rate: float = 0.1,
+        reprobe_every: int = 50,
+        flush_every: int = DEFAULT_STATS_FLUSH_EVERY,
+        flush_interval: float = DEFAULT_STATS_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.min_samples = min_samples
+        self.pdf_rate = pdf_rate
+        self.html_rate = html_rate
+        self.reprobe_every = reprobe_every
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._table = self._load()
+        self._pending_writes = 0
+        self._last_flush_at = time.monotonic()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[PdfRewriteStats] 統計ファイルの読み込みに失敗しました（空の状態で開始します）: {self.path} ({e})")
+            return {}
+
+    def _save(self, table: dict):
+        """統計を保存する（_save_lock 内で呼び出すこと）。"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(table, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[PdfRewriteStats] 統計ファイルの書き込みに失敗しました: {self.path} ({e})")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _row(self, journal: str) -> dict:
+        return self._table.setdefault(journal, {"pdf": 0, "html": 0, "skipped": 0})
+
+    def record(self, journal: str, is_pdf: bool):
+        """書き換えたPDF URLの結果（PDFが返ったかどうか）を記録する。"""
+        with self._lock:
+            self._row(journal)["pdf" if is_pdf else "html"] += 1
+            self._pending_writes += 1
+            due = (
+                self._pending_writes >= self.flush_every
+                or time.monotonic() - self._last_flush_at >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """未保存の統計をファイルに書き込む（実行の終わりにも呼び出す）。"""
+        with self._save_lock:
+            with self._lock:
+                if not self._pending_writes:
+                    return
+                table = {journal: dict(row) for journal, row in self._table.items()}
+                self._pending_writes = 0
+                self._last_flush_at = time.monotonic()
+            self._save(table)
+
+    def decide(self, journal: str) -> str:
+        """
+        雑誌に対する方針を返す。
+        "pdf": PDFを直接ダウンロード / "html": PDFを試さない / "probe": 事前プローブで確認する
+        """
+        with self._lock:
+            row = self._table.get(journal)
+            samples = row["pdf"] + row["html"] if row else 0
+            if samples < self.min_samples:
+                return "probe"
+            rate = row["pdf"] / samples
+            if rate >= self.pdf_rate:
+                return "pdf"
+            if rate <= self.html_rate:
+                # スキップ回数はメモリ上で数え、次の record・flush で保存する
+                row["skipped"] += 1
+                self._pending_writes += 1
+                if self.reprobe_every > 0 and row["skipped"] % self.reprobe_every == 0:
+                    return "probe"
+                return "html"
+            return "probe"
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {journal: dict(row) for journal, row in self._table.items()}
+
+
+class ArticleResolver:
+    """
+    論文本体をダウンロードする前に、どのURL（書き換え後のPDF URL / 元のHTML URL）を取得するかを決めるクラス。
+    PdfRewriteStats の実績と、先頭1KBだけを読む軽量プローブを組み合わせ、
+    PDFを返さないURLの本体ダウンロード（とそのためのリミッター待機）を省く。
+    """
+
+    def __init__(self, jstage_client: JStageClient, stats: PdfRewriteStats | None = None):
+        self.jstage_client = jstage_client
+        self.stats = stats or PdfRewriteStats()
+        self._lock = threading.Lock()
+        self.counters = {"direct_pdf": 0, "probed_pdf": 0, "probed_html": 0, "skipped_pdf": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def choose_url(self, pdf_url: str, html_url: str | None) -> str:
+        """
+        最初に本体をダウンロードするURLを返す。
+        PDF URLが書き換えによるものでない（HTML URLがない・同じ）場合は、そのままPDF URLを返す。
+        """
+        if not html_url or html_url == pdf_url:
+            return pdf_url
+
+        journal = journal_key_from_url(pdf_url)
+        decision = self.stats.decide(journal)
+        if decision == "pdf":
+            self._count("direct_pdf")
+            return pdf_url
+        if decision == "html":
+            print(f"    [ArticleResolver] 雑誌 '{journal}' はHTMLのみ提供の実績があるため、PDFの取得を省略します。")
+            self._count("skipped_pdf")
+            return html_url
+
+        probed_type = self.jstage_client.probe_content_type(pdf_url)
+        if probed_type is None:
+            # 判定できなかった場合は従来どおりPDFから試す
+            return pdf_url
+        if "pdf" in probed_type:
+            self._count("probed_pdf")
+            return pdf_url
+
+        print(f"    [ArticleResolver] PDF URLがPDFを返さなかったため、HTML URLを取得します。(雑誌: '{journal}')")
+        self.stats.record(journal, is_pdf=False)
+        self._count("probed_html")
+        return html_url
+
+    def record_result(self, pdf_url: str, is_pdf: bool):
+        """書き換えたPDF URLを実際にダウンロードした結果を記録する。"""
+        self.stats.record(journal_key_from_url(pdf_url), is_pdf)
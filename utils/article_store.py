@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_ARTICLE_STORE_DIR = os.path.join("output", "raw_article_store")
+# インデックスをまとめて保存する件数・間隔（秒）
+DEFAULT_INDEX_FLUSH_EVERY = 50
+DEFAULT_INDEX_FLUSH_INTERVAL = 10.0
+
+
+class RawArticleStore:
+    """
+    ダウンロードした論文の生データ（PDF/HTML）を保存するコンテンツアドレス型ストア。
+
+    - 本体は sha256 をファイル名として blobs/<先頭2文字>/<sha256> に保存する（同一内容は1つだけ保持）。
+    - index.json に DOI ごとの sha256, content_type, final_url, サイズ, メタデータを記録する。
+    - 合計サイズが上限（環境変数 RAW_ARTICLE_STORE_MAX_BYTES, デフォルト: 10GiB）を超えた場合、
+      最終アクセスが古いDOIから削除する（LRU）。上限より大きい論文は保存しない。
+    - index.json の書き込みは flush_every 件ごと、または flush_interval 秒ごとにまとめて行う。
+      最終アクセス日時（get）はメモリ上で更新し、次の書き込み・flush・close で保存する。
+    - 起動時に、インデックスから参照されていない本体（保存前に中断した書き込みの一時ファイルや、
+      インデックスを保存する前に終了した put の本体）を削除する。
+
+    プロンプトやモデルを変更した際は、このストアからJ-STAGEへアクセスせずに再変換できる。
+    """
+
+    def __init__(
+        self,
+        store_dir: str = DEFAULT_ARTICLE_STORE_DIR,
+        max_bytes: int | None = None,
+        flush_every: int = DEFAULT_INDEX_FLUSH_EVERY,
+        flush_interval: float = DEFAULT_INDEX_FLUSH_INTERVAL,
+    ):
+        self.store_dir = store_dir
+        self.blobs_dir = os.path.join(store_dir, "blobs")
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("RAW_ARTICLE_STORE_MAX_BYTES", 10 * 1024**3))
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+        # sha256 ごとの参照しているDOIの数と、重複排除後の合計サイズ
+        self._refcounts: dict[str, int] = {}
+        self._total = 0
+        for record in self.index.values():
+            self._add_ref(record["sha256"], record["size"])
+        self._remove_orphan_blobs()
+        self._pending_writes = 0
+        self._dirty = False
+        self._last_flush_at = time.monotonic()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[RawArticleStore] インデックスの読み込みに失敗しました。空のストアとして扱います: {e}")
+            return {}
+
+    def _remove_orphan_blobs(self):
+        """インデックスから参照されていない本体・一時ファイルを削除する（初期化時に呼び出す）。"""
+        removed = 0
+        removed_bytes = 0
+        for prefix in os.listdir(self.blobs_dir):
+            prefix_dir = os.path.join(self.blobs_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name in self._refcounts:
+                    continue
+                path = os.path.join(prefix_dir, name)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError as e:
+                    print(f"[RawArticleStore] 参照されていないファイルの削除に失敗しました: {path} ({e})")
+                    continue
+                removed += 1
+                removed_bytes += size
+        if removed:
+            print(f"[RawArticleStore] インデックスから参照されていないファイルを {removed} 件 ({removed_bytes} バイト) 削除しました。")
+
+    def _save_index(self):
+        """インデックスをアトミックに保存する（ロック内で呼び出すこと）。"""
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self._pending_writes = 0
+        self._dirty = False
+        self._last_flush_at = time.monotonic()
+
+    def _mark_written(self):
+        """インデックスの変更を記録し、件数・間隔の条件を満たしたら保存する（ロック内で呼び出すこと）。"""
+        self._pending_writes += 1
+        self._dirty = True
+        if self._pending_writes >= self.flush_every or time.monotonic() - self._last_flush_at >= self.flush_interval:
+            self._save_index()
+
+    def flush(self):
+        """未保存のインデックスの変更（最終アクセス日時を含む）を保存する。"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def close(self):
+        self.flush()
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blobs_dir, sha256[:2], sha256)
+
+    def _too_large(self, doi: str, size: int) -> bool:
+        if size <= self.max_bytes:
+            return False
+        print(f"[RawArticleStore] 容量上限 ({self.max_bytes} バイト) より大きいため保存しません: {doi} ({size} バイト)")
+        return True
+
+    def put(
+        self, doi: str, content: bytes, content_type: str, final_url: str, metadata: dict | None = None
+    ) -> str | None:
+        """論文の生データを保存し、sha256 を返す（容量上限より大きい場合は保存せず None を返す）。"""
+        if self._too_large(doi, len(content)):
+            return None
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(sha256)
+
+        with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, blob_path)
+            self._record(doi, sha256, content_type, final_url, len(content), metadata)
+        return sha256
+
+    def put_file(
+        self, doi: str, path: str, content_type: str, final_url: str, metadata: dict | None = None
+    ) -> str | None:
+        """
+        ファイル（ストリーミングでダウンロードしたスプールファイルなど）を、メモリに読み込まずに保存する。
+        元のファイルはそのまま残る。sha256 を返す（容量上限より大きい場合は保存せず None を返す）。
+        """
+        if self._too_large(doi, os.path.getsize(path)):
+            return None
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        blob_path = self._blob_path(sha256)
+
+        with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.tmp"
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, blob_path)
+            self._record(doi, sha256, content_type, final_url, size, metadata)
+        return sha256
+
+    def _record(self, doi: str, sha256: str, content_type: str, final_url: str, size: int, metadata: dict | None):
+        """インデックスにDOIの記録を追加し、容量上限を確認する（ロック内で呼び出すこと）。"""
+        previous = self.index.get(doi)
+        now = time.time()
+        self.index[doi] = {
+            "sha256": sha256,
+            "content_type": content_type,
+            "final_url": final_url,
+            "size": size,
+            "stored_at": now,
+            "last_access": now,
+            "metadata": metadata or {},
+        }
+        self._add_ref(sha256, size)
+        if previous is not None:
+            # 同じDOIを再保存した場合、古い本体は参照がなくなれば削除する
+            self._release(previous)
+        self._evict_if_needed(keep=doi)
+        self._mark_written()
+
+    def get(self, doi: str) -> dict | None:
+        """DOIに対応する記録と本体（content）を返す。存在しない場合は None。"""
+        with self._lock:
+            record = self.index.get(doi)
+            if record is None:
+                return None
+            record["last_access"] = time.time()
+            self._dirty = True
+            record = dict(record)
+        try:
+            # 本体の読み込みは、他のワーカーを待たせないようロックの外で行う
+            with open(self._blob_path(record["sha256"]), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            print(f"[RawArticleStore] 本体ファイルが見つかりません。インデックスから削除します: {doi}")
+            with self._lock:
+                if self.index.get(doi, {}).get("sha256") == record["sha256"]:
+                    self._remove_locked(doi)
+                    self._mark_written()
+            return None
+        return {**record, "doi": doi, "content": content}
+
+    def list_dois(self) -> list:
+        """保存されている全DOIを返す。"""
+        with self._lock:
+            return list(self.index.keys())
+
+    def total_bytes(self) -> int:
+        """保存されている本体の合計サイズ（重複排除後）を返す。"""
+        with self._lock:
+            return self._total_bytes()
+
+    def _total_bytes(self) -> int:
+        return self._total
+
+    def _add_ref(self, sha256: str, size: int):
+        count = self._refcounts.get(sha256, 0)
+        if count == 0:
+            self._total += size
+        self._refcounts[sha256] = count + 1
+
+    def _remove_locked(self, doi: str):
+        """DOIの記録を削除し、同じ内容を参照するDOIが残っていなければ本体も削除する（ロック内で呼び出すこと）。"""
+        self._release(self.index.pop(doi))
+
+    def _release(self, record: dict):
+        """記録が参照する本体の参照数を減らし、参照がなくなれば本体を削除する（ロック内で呼び出すこと）。"""
+        sha256 = record["sha256"]
+        count = self._refcounts.get(sha256, 0) - 1
+        if count > 0:
+            self._refcounts[sha256] = count
+            return
+        self._refcounts.pop(sha256, None)
+        self._total -= record["size"]
+        try:
+            os.remove(self._blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _evict_if_needed(self, keep: str):
+        """
+        合計サイズが上限を超えている間、最終アクセスが古いDOIから削除する（ロック内で呼び出すこと）。
+        保存したばかりのDOI（keep）は削除しない。
+        """
+        if self._total <= self.max_bytes:
+            return
+
+        for doi, _ in sorted(self.index.items(), key=lambda item: item[1]["last_access"]):
+            if self._total <= self.max_bytes:
+                break
+            if doi == keep:
+                continue
+            self._remove_locked(doi)
+            print(f"[RawArticleStore] 容量上限のため削除しました: {doi}")
@@ -0,0 +1,424 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+import fitz  # PyMuPDF
+from google.genai import errors as genai_errors
+
+from utils.article_resolver import journal_key_from_url
+from utils.article_store import RawArticleStore
+
+# p95 の分位点に対応する標準正規分布の値（対数正規分布のパラメータの計算用）
+_Z_95 = 1.6448536269514722
+
+# 偽の J-STAGE の論文URL (/article/<雑誌コード>/<巻>/0/<論文ID>/_pdf/ または /_article/...)
+_ARTICLE_PATH_PATTERN = re.compile(r"^/article/([^/]+)/([^/]+)/0/([^/]+)/(_pdf|_article)")
+
+
+class LatencyModel:
+    """
+    偽のバックエンドの応答時間の分布。
+    samples（記録した実際の応答時間）があればその中から選び、なければ中央値と p95 から決めた対数正規分布から選ぶ。
+    """
+
+    def __init__(self, median: float = 0.0, p95: Optional[float] = None, samples: Optional[list] = None, seed=None):
+        self.median = max(0.0, median)
+        self.p95 = max(self.median, p95 if p95 is not None else self.median)
+        self.samples = [sample for sample in (samples or []) if sample is not None]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec: Optional[str], samples: Optional[list] = None, seed=None) -> "LatencyModel":
+        """
+        "中央値,p95"（秒）の文字列から生成する（例: "1.5,6"）。
+        spec が空の場合は samples（記録した応答時間）をそのまま使う。
+        """
+        if not spec:
+            return cls(samples=samples, seed=seed)
+        values = [float(value) for value in spec.split(",")]
+        return cls(median=values[0], p95=values[1] if len(values) > 1 else None, seed=seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.samples:
+                return self._random.choice(self.samples)
+            if self.median <= 0:
+                return 0.0
+            sigma = math.log(self.p95 / self.median) / _Z_95 if self.p95 > self.median else 0.0
+            return self._random.lognormvariate(math.log(self.median), sigma)
+
+    def chance(self, rate: float) -> bool:
+        """確率 rate で True を返す（エラーの発生の判定用）。"""
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+
+def _schema_name(config) -> Optional[str]:
+    schema = getattr(config, "response_schema", None) if config is not None else None
+    if isinstance(config, dict):
+        schema = config.get("response_schema")
+    return getattr(schema, "__name__", None) if schema is not None else None
+
+
+def _estimate_prompt_tokens(contents) -> int:
+    """偽の応答の usage_metadata 用に、入力トークン数を概算する（文字列は2文字で1トークン、ファイルは1ページ分とする）。"""
+    parts = contents if isinstance(contents, list) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) // 2
+        elif getattr(part, "text", None):
+            tokens += len(part.text) // 2
+        else:
+            tokens += 560
+    return tokens
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    """偽の Gemini の応答。パイプラインが参照する text / parsed / candidates / usage_metadata を持つ。"""
+
+    def __init__(self, text: str, usage_metadata: FakeUsageMetadata):
+        self.text = text
+        self.parsed = None
+        self.candidates = None
+        self.prompt_feedback = None
+        self.usage_metadata = usage_metadata
+
+
+class RecordingGeminiBackend:
+    """
+    実際の Gemini のバックエンド（genai.Client）への generate_content を中継し、
+    応答テキスト・応答時間・トークン数を JSONL ファイルに記録する。記録は FakeGeminiBackend で再生する。
+    """
+
+    def __init__(self, backend, path: str):
+        self.backend = backend
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model: str, contents, config=None):
+        started_at = time.monotonic()
+        response = self.backend.models.generate_content(model=model, contents=contents, config=config)
+        usage = getattr(response, "usage_metadata", None)
+        record = {
+            "model": model,
+            "schema": _schema_name(config),
+            "text": getattr(response, "text", None),
+            "latency": time.monotonic() - started_at,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return response
+
+
+class FakeGeminiBackend:
+    """
+    APIを使わずに generate_content に応答する偽のバックエンド（LLMGateway / ClientRegistry の llm_backend に渡す）。
+
+    - recording_path（RecordingGeminiBackend の記録）があれば、同じモデル・スキーマの記録を順に再生する。
+      記録がない呼び出しには、見出しと本文からなる合成のMarkdownを返す（構造化出力は記録がある場合のみ対応）。
+    - latency の分布で応答時間を模擬する（未指定の場合は記録の応答時間を使う）。
+    - error_rate の確率で 500 (ServerError)、throttle_rate の確率で 429 を返す。
+    """
+
+    def __init__(
+        self,
+        recording_path: Optional[str] = None,
+        latency: Optional[LatencyModel] = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed=None,
+    ):
+        self._recordings: dict = {}
+        if recording_path:
+            with open(recording_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._recordings.setdefault((record["model"], record.get("schema")), []).append(record)
+        recorded_latencies = [record["latency"] for records in self._recordings.values() for record in records]
+        self.latency = latency or LatencyModel(samples=recorded_latencies, seed=seed)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._cursors: dict = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "replayed": 0, "synthesized": 0, "errors": 0, "throttled": 0}
+        self.models = self
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _next_recording(self, key) -> Optional[dict]:
+        with self._lock:
+            records = self._recordings.get(key)
+            if not records:
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            return records[index % len(records)]
+
+    def generate_content(self, model: str, contents, config=None):
+        self._count("calls")
+        time.sleep(self.latency.sample())
+        if self.latency.chance(self.throttle_rate):
+            self._count("throttled")
+            raise genai_errors.ClientError(429, {"error": {"code": 429, "message": "fake rate limit", "status": "RESOURCE_EXHAUSTED"}})
+        if self.latency.chance(self.error_rate):
+            self._count("errors")
+            raise genai_errors.ServerError(500, {"error": {"code": 500, "message": "fake server error", "status": "INTERNAL"}})
+
+        schema = _schema_name(config)
+        record = self._next_recording((model, schema))
+        if record is not None:
+            self._count("replayed")
+            return FakeResponse(record["text"], FakeUsageMetadata(record["prompt_tokens"], record["output_tokens"]))
+        if schema is not None:
+            raise ValueError(f"[FakeGeminiBackend] スキーマ '{schema}' の記録がないため、構造化出力に応答できません (model={model})。")
+
+        self._count("synthesized")
+        # 出力の長さは入力に比例させる（ModelRouter の出力の検証で、長い論文が要約とみなされないようにする）
+        prompt_tokens = _estimate_prompt_tokens(contents)
+        text = synthesize_markdown(seed=prompt_tokens, sections=max(4, prompt_tokens // 400))
+        return FakeResponse(text, FakeUsageMetadata(prompt_tokens, len(text) // 2))
+
+
+def synthesize_markdown(seed: int = 0, sections: int = 4) -> str:
+    """偽の応答用に、P1の出力形式（## / ### 見出しと本文）に沿ったMarkdownを合成する。"""
+    lines = []
+    for section in range(1, sections + 1):
+        lines.append(f"## セクション{section}")
+        lines.append(f"### 項目{section}-{seed % 97}")
+        lines.append("本文のテキストです。" * 20)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def synthesize_pdf(pages: int = 2) -> bytes:
+    """テキストレイヤーを持つ合成のPDFを作る（ベンチマーク用の論文本体）。"""
+    with fitz.open() as doc:
+        for page_number in range(pages):
+            page = doc.new_page()
+            text = "\n".join(f"Page {page_number + 1} line {line}: synthetic article body text." for line in range(40))
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+def synthesize_html(title: str) -> bytes:
+    paragraphs = "".join(f"<h2>Section {n}</h2><p>{'Synthetic article body text. ' * 40}</p>" for n in range(1, 5))
+    return f"<html><head><title>{escape(title)}</title></head><body><h1>{escape(title)}</h1>{paragraphs}</body></html>".encode("utf-8")
+
+
+def build_synthetic_corpus(count: int, pdf_content: Optional[bytes] = None, pdf_ratio: float = 0.8, journals: int = 5) -> list:
+    """
+    ベンチマーク用の合成の論文一覧を作る。pdf_ratio の割合の論文はPDFを、残りはHTMLのみを提供する雑誌に割り当てる。
+    """
+    pdf_content = pdf_content or synthesize_pdf()
+    pdf_journals = max(1, round(journals * pdf_ratio)) if pdf_ratio > 0 else 0
+    corpus = []
+    for index in range(count):
+        journal_index = index % journals
+        title = f"合成論文 {index + 1}"
+        is_pdf = journal_index < pdf_journals
+        corpus.append({
+            "doi": f"10.99999/bench.{index + 1}",
+            "title": title,
+            "journal": f"bench{journal_index + 1}",
+            "published_date": "2024-01-01",
+            "content_type": "application/pdf" if is_pdf else "text/html",
+            "content": pdf_content if is_pdf else synthesize_html(title),
+        })
+    return corpus
+
+
+def build_corpus_from_store(article_store: RawArticleStore, limit: Optional[int] = None) -> list:
+    """
+    生データストア（実際にダウンロードした論文の記録）から、偽の J-STAGE で再生する論文一覧を作る。
+    """
+    corpus = []
+    for doi in article_store.list_dois()[:limit]:
+        record = article_store.get(doi)
+        if record is None:
+            continue
+        metadata = record.get("metadata") or {}
+        source_url = metadata.get("debug_original_url") or record.get("final_url")
+        corpus.append({
+            "doi": doi,
+            "title": metadata.get("title", "N/A"),
+            "journal": journal_key_from_url(source_url),
+            "published_date": metadata.get("published_date", "N/A"),
+            "content_type": record["content_type"],
+            "content": record["content"],
+        })
+    return corpus
+
+
+class FakeJStageServer:
+    """
+    J-STAGE の検索API（/searchapi/do）と論文ページ（/_pdf/・/_article/）を模擬するローカルHTTPサーバー。
+    ClientRegistry(jstage_base_url=server.search_url) で使う。
+
+    - 検索: キーワードのハッシュから決まる corpus の hits_per_keyword 件を、start / count でページ分けして Atom XML で返す。
+    - /_pdf/: PDFの論文は %PDF の本体を、HTMLのみの論文はHTMLを返す（PDFを提供しない雑誌の挙動）。
+    - latency の分布で応答時間を模擬し、error_rate の確率で 503 を返す。
+    """
+
+    def __init__(
+        self,
+        corpus: list,
+        latency: Optional[LatencyModel] = None,
+        error_rate: float = 0.0,
+        hits_per_keyword: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        if not corpus:
+            raise ValueError("偽の J-STAGE に提供する論文がありません。")
+        self.corpus = corpus
+        self._by_id = {f"a{index + 1}": article for index, article in enumerate(corpus)}
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.hits_per_keyword = min(len(corpus), hits_per_keyword or len(corpus))
+        self.stats = {"search": 0, "pdf": 0, "article": 0, "errors": 0, "not_found": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.base_url}/searchapi/do"
+
+    def start(self) -> "FakeJStageServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-jstage", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _keyword_hits(self, keyword: str) -> list:
+        """キーワードに対応する論文ID（キーワードごとに異なる開始位置から hits_per_keyword 件）を返す。"""
+        offset = int(hashlib.sha256(keyword.encode("utf-8")).hexdigest(), 16) % len(self.corpus)
+        return [f"a{(offset + index) % len(self.corpus) + 1}" for index in range(self.hits_per_keyword)]
+
+    def _article_url(self, article_id: str) -> str:
+        article = self._by_id[article_id]
+        return f"{self.base_url}/article/{article['journal']}/1/0/{article_id}/_article/-char/ja"
+
+    def build_search_xml(self, keyword: str, start: int, count: int) -> bytes:
+        hits = self._keyword_hits(keyword)
+        entries = []
+        for article_id in hits[max(0, start - 1): max(0, start - 1) + count]:
+            article = self._by_id[article_id]
+            entries.append(
+                "<entry>"
+                f"<title>{escape(article['title'])}</title>"
+                f"<link type=\"text/html\" href=\"{escape(self._article_url(article_id))}\"/>"
+                f"<article_title><ja>{escape(article['title'])}</ja></article_title>"
+                f"<material_title><ja>{escape(article['journal'])}</ja></material_title>"
+                f"<prism:doi>{escape(article['doi'])}</prism:doi>"
+                f"<prism:publicationDate>{escape(article['published_date'])}</prism:publicationDate>"
+                "</entry>"
+            )
+        return (
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+            "<feed xmlns=\"http://www.w3.org/2005/Atom\" xmlns:prism=\"http://prismstandard.org/namespaces/basic/2.0/\""
+            " xmlns:opensearch=\"http://a9.com/-/spec/opensearch/1.1/\">"
+            f"<opensearch:totalResults>{len(hits)}</opensearch:totalResults>"
+            f"{''.join(entries)}</feed>"
+        ).encode("utf-8")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # プローブ（先頭だけ読んで切断）の場合
+                    pass
+
+            def do_GET(self):
+                time.sleep(server.latency.sample())
+                if server.latency.chance(server.error_rate):
+                    server._count("errors")
+                    self._send(503, b"Service Unavailable", "text/plain")
+                    return
+
+                parsed = urlparse(self.path)
+                if parsed.path.startswith("/searchapi/do"):
+                    server._count("search")
+                    params = parse_qs(parsed.query)
+                    body = server.build_search_xml(
+                        params.get("keyword", [""])[0],
+                        int(params.get("start", ["1"])[0]),
+                        int(params.get("count", ["1000"])[0]),
+                    )
+                    self._send(200, body, "application/xml; charset=utf-8")
+                    return
+
+                match = _ARTICLE_PATH_PATTERN.match(parsed.path)
+                article = server._by_id.get(match.group(3)) if match else None
+                if article is None:
+                    server._count("not_found")
+                    self._send(404, b"Not Found", "text/plain")
+                    return
+                wants_pdf = match.group(4) == "_pdf"
+                server._count("pdf" if wants_pdf else "article")
+                if "pdf" in article["content_type"]:
+                    if wants_pdf:
+                        self._send(200, article["content"], "application/pdf")
+                    else:
+                        self._send(200, synthesize_html(article["title"]), "text/html; charset=utf-8")
+                else:
+                    self._send(200, article["content"], "text/html; charset=utf-8")
+
+        return Handler
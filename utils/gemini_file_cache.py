@@ -0,0 +1,174 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from google import genai
+
+load_dotenv()
+
+DEFAULT_GEMINI_FILE_CACHE_PATH = os.path.join("output", "cache", "gemini_files.json")
+# このサイズ以上のPDFはインラインで送らず、Files API にアップロードしたファイルを参照する
+DEFAULT_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_PDF_MAX_BYTES", 4 * 1024**2))
+# アップロードしたファイルの保持期間（Files API の保持期間は48時間。expiration_time が返らない場合に使用）
+DEFAULT_FILE_TTL_SECONDS = 48 * 3600
+# 期限切れ直前のファイルは使わない（変換中に削除されるのを避ける）
+EXPIRY_MARGIN_SECONDS = 3600
+# アップロード後、ファイルが利用可能（ACTIVE）になるまで待つ最大時間（秒）
+UPLOAD_ACTIVE_TIMEOUT = 120
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    bytes / メモリマップを、コピーせずに読み込み可能なファイルオブジェクトとして扱うラッパー。
+    Files API のアップロードは file.read(チャンクサイズ) で読むため、読んだチャンク分のメモリしか使わない
+    （io.BytesIO(bytes(content)) のようにファイル全体を複製しない）。
+    """
+
+    def __init__(self, content):
+        super().__init__()
+        self._view = memoryview(content).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position:self._position + len(buffer)]
+        size = len(data)
+        memoryview(buffer).cast("B")[:size] = data
+        self._position += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class GeminiFileCache:
+    """
+    Gemini Files API にアップロードしたファイルのハンドルを、内容の sha256 をキーに保存するキャッシュ。
+    同じPDFの再試行・再変換ではアップロードを省略し、キャッシュしたハンドル（URI）を参照する。
+    エントリは有効期限（expires_at）付きでディスクに保存し、期限が近いものは再アップロードする。
+    """
+
+    def __init__(self, path: str = DEFAULT_GEMINI_FILE_CACHE_PATH, inline_max_bytes: int | None = None):
+        self.path = path
+        self.inline_max_bytes = inline_max_bytes if inline_max_bytes is not None else DEFAULT_INLINE_MAX_BYTES
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._upload_locks: dict[str, threading.Lock] = {}
+        self._entries = self._load()
+        self.stats = {"hits": 0, "uploads": 0, "expired": 0, "invalidated": 0}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[GeminiFileCache] キャッシュファイルの読み込みに失敗しました（無視します）: {self.path} ({e})")
+            return {}
+
+    def _save(self):
+        """インデックスを一時ファイル経由で書き込む（ロック内で呼び出すこと）。"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def should_upload(self, size: int) -> bool:
+        """このサイズのファイルをアップロードして参照すべきかどうかを返す（小さいファイルはインラインで送る）。"""
+        return size >= self.inline_max_bytes
+
+    def get(self, sha256: str) -> dict | None:
+        """有効期限内のエントリを返す（存在しない・期限切れの場合は None）。"""
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is None:
+                return None
+            if entry["expires_at"] - EXPIRY_MARGIN_SECONDS <= time.time():
+                del self._entries[sha256]
+                self._save()
+                self.stats["expired"] += 1
+                return None
+            return entry
+
+    def invalidate(self, sha256: str):
+        """サーバー側で利用できなくなったファイルのエントリを削除する。"""
+        with self._lock:
+            if self._entries.pop(sha256, None) is not None:
+                self._save()
+                self.stats["invalidated"] += 1
+
+    def get_or_upload(self, client: genai.Client, content, mime_type: str, controller=None) -> dict:
+        """
+        content（bytes またはメモリマップ）をアップロード済みであればそのエントリを、
+        なければアップロードしてエントリを返す。エントリは sha256 / name / uri / mime_type / expires_at を持つ。
+        controller（AdaptiveConcurrencyController）を渡した場合、アップロードはその同時実行数の制御下で行う。
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(sha256, threading.Lock())
+
+        # 同じファイルを複数のワーカーが同時にアップロードしないよう、内容ごとに直列化する
+        with upload_lock:
+            entry = self.get(sha256)
+            if entry is not None:
+                with self._lock:
+                    self.stats["hits"] += 1
+                return entry
+
+            upload_config = {"mime_type": mime_type, "display_name": f"kcr-{sha256[:16]}"}
+            with _BufferReader(content) as reader:
+                if controller is not None:
+                    uploaded = controller.call(client.files.upload, file=reader, config=upload_config)
+                else:
+                    uploaded = client.files.upload(file=reader, config=upload_config)
+            uploaded = self._wait_until_active(client, uploaded)
+
+            expires_at = uploaded.expiration_time.timestamp() if uploaded.expiration_time else time.time() + DEFAULT_FILE_TTL_SECONDS
+            entry = {
+                "sha256": sha256,
+                "name": uploaded.name,
+                "uri": uploaded.uri,
+                "mime_type": uploaded.mime_type or mime_type,
+                "size": len(content),
+                "uploaded_at": time.time(),
+                "expires_at": expires_at,
+            }
+            with self._lock:
+                self._entries[sha256] = entry
+                self._save()
+                self.stats["uploads"] += 1
+            print(f"[GeminiFileCache] ファイルをアップロードしました: {uploaded.name} ({len(content) / 1024**2:.1f}MB)")
+            return entry
+
+    @staticmethod
+    def _wait_until_active(client: genai.Client, uploaded):
+        """アップロードしたファイルの処理（PROCESSING）が終わるまで待つ。"""
+        deadline = time.monotonic() + UPLOAD_ACTIVE_TIMEOUT
+        while uploaded.state is not None and uploaded.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"アップロードしたファイルが利用可能になりませんでした: {uploaded.name}")
+            time.sleep(2)
+            uploaded = client.files.get(name=uploaded.name)
+        if uploaded.state is not None and uploaded.state.name == "FAILED":
+            raise RuntimeError(f"アップロードしたファイルの処理に失敗しました: {uploaded.name}")
+        return uploaded
@@ -1,11 +1,15 @@
 import os
 import time
-import re
 # import requests
 import httpx
 import xml.etree.ElementTree as ET
 from dotenv import load_dotenv
 
+from utils.rate_limiter import LimiterLanes, get_shared_jstage_lanes
+from utils.search_cache import SearchCache
+from utils.jstage_search_parser import parse_search_response
+from utils.spooled_article import SpooledArticle, DEFAULT_SPOOL_DIR, DEFAULT_MAX_DOWNLOAD_BYTES, DOWNLOAD_CHUNK_BYTES
+
 # --- リトライ機能のために追加 ---
 # from requests.adapters import HTTPAdapter
 # from urllib3.util.retry import Retry
@@ -13,19 +17,66 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+JSTAGE_SEARCH_API_URL = "https://api.jstage.jst.go.jp/searchapi/do"
+JSTAGE_HEADERS = {
+    "User-Agent": "DatasetGenerator/1.0 (https://github.com/YouSayH/kcr_Rehab-Plan-Generator; mailto:your-email@example.com)"
+}
+
+
+class JStageSearchError(Exception):
+    """J-STAGEの検索に失敗したことを示す例外（ヒット0件の検索結果とは区別する）。"""
+
+
+# 本体をダウンロードする前に、PDFかどうかを判定するために読む先頭バイト数
+PROBE_BYTES = 1024
+PDF_MAGIC = b"%PDF"
+
+
+def _detect_content_type_from_head(headers: httpx.Headers, head: bytes) -> str:
+    """
+    応答ヘッダーと本文の先頭バイトから、PDFかHTMLかを判定する。
+    (同期版・非同期版クライアント、および事前プローブで共通)
+    """
+    content_type = headers.get("Content-Type", "").lower()
+
+    if "application/pdf" in content_type or headers.get("Content-Disposition", "").endswith(".pdf"):
+        return "application/pdf"
+    elif "text/html" in content_type:
+        return "text/html"
+    else:
+        # PDFかHTMLか不明な場合、内容で判断する簡易チェック
+        if head.strip().startswith(PDF_MAGIC):
+            return "application/pdf"
+        else:
+            return "text/html" # デフォルトはHTML扱い
+
+
+def _detect_content_type(response: httpx.Response) -> str:
+    """
+    ダウンロードした応答がPDFかHTMLかを判定する。
+    (同期版・非同期版クライアントで共通)
+    """
+    return _detect_content_type_from_head(response.headers, response.content)
+
 
 class JStageClient:
     """
     J-STAGEからの論文ダウンロードを管理するクライアント。
     自動リトライ機能（エクスポネンシャル・バックオフ）を実装。
+    アクセス間隔は、検索APIと論文ホストで独立したレーン（既定ではプロセス全体で共有）で制御する。
+    search_cache を渡した場合、検索結果ページはディスクにキャッシュされる。
     """
 
-    def __init__(self):
-        self.request_interval = float(os.getenv("JSTAGE_REQUEST_INTERVAL", 10))
-        self.headers = {
-            "User-Agent": "DatasetGenerator/1.0 (https://github.com/YouSayH/kcr_Rehab-Plan-Generator; mailto:your-email@example.com)"
-        }
-        self.base_url = "https://api.jstage.jst.go.jp/searchapi/do"
+    def __init__(
+        self,
+        lanes: LimiterLanes | None = None,
+        base_url: str = JSTAGE_SEARCH_API_URL,
+        search_cache: SearchCache | None = None,
+    ):
+        self.lanes = lanes or get_shared_jstage_lanes()
+        self.headers = JSTAGE_HEADERS
+        self.base_url = base_url
+        self.search_cache = search_cache
         self.last_request_time = 0
 
         # # BAN対策：リトライ戦略の定義
@@ -54,166 +105,151 @@ class JStageClient:
             transport=httpx.HTTPTransport(retries=retries) # シンプルなリトライ設定
         )
 
-    def _wait_for_interval(self):
+    def _wait_for_interval(self, url: str):
         """
-        前回のアクセスから指定した間隔が経過するまで待機する。
+        URLに対応するレーンからトークンを取得できるまで待機する。
         """
-        elapsed_time = time.time() - self.last_request_time
-        wait_time = self.request_interval - elapsed_time
-        if wait_time > 0:
-            print(f"    -> (待機: {wait_time:.2f}秒)")
-            time.sleep(wait_time)
+        self.lanes.acquire(url)
         self.last_request_time = time.time()
 
     def download_article_content(self, url: str) -> tuple[bytes | None, str | None]:
         """
         指定されたURLから論文のコンテンツをダウンロードする。
         """
-        self._wait_for_interval()
+        result = self.fetch_article(url)
+        if result is None:
+            return None, None
+        return result["content"], result["content_type"]
+
+    def fetch_article(self, url: str) -> dict | None:
+        """
+        指定されたURLから論文のコンテンツをダウンロードし、
+        content / content_type / final_url（リダイレクト後のURL）を辞書で返す。失敗時は None。
+        (本体をメモリに読み込む互換用。大きなPDFを扱う場合は stream_article を使う)
+        """
+        result = self.stream_article(url)
+        if result is None:
+            return None
+        with result["body"] as body:
+            content = body.read_bytes()
+        return {"content": content, "content_type": result["content_type"], "final_url": result["final_url"]}
+
+    def stream_article(self, url: str, expect_pdf: bool = False, max_bytes: int | None = None) -> dict | None:
+        """
+        指定されたURLから論文の本体をチャンク単位でスプールファイルに書き出す。
+        body（SpooledArticle）/ content_type / final_url を辞書で返す。失敗時は None。
+
+        - 本体が max_bytes（デフォルト: 環境変数 ARTICLE_DOWNLOAD_MAX_BYTES）を超える場合は中断し、None を返す。
+        - expect_pdf=True の場合、先頭バイトが %PDF でなければ本体を読まずに中断し、
+          body=None, content_type="text/html" の辞書を返す（HTMLへのフォールバック判定用）。
+        """
+        max_bytes = max_bytes or DEFAULT_MAX_DOWNLOAD_BYTES
+        self._wait_for_interval(url)
+        body = None
         try:
             print(f"[JStageClient] URLからコンテンツをダウンロード中: {url}")
-            # response = self.session.get(url, timeout=30, allow_redirects=True)
-            response = self.client.get(url)
-            response.raise_for_status()
-            content_type = response.headers.get("Content-Type", "").lower()
-
-            if "application/pdf" in content_type or response.headers.get("Content-Disposition", "").endswith(".pdf"):
-                return response.content, "application/pdf"
-            elif "text/html" in content_type:
-                return response.content, "text/html"
-            else:
-                # PDFかHTMLか不明な場合、内容で判断する簡易チェック
-                if response.content.strip().startswith(b"%PDF"):
-                    return response.content, "application/pdf"
-                else:
-                    return response.content, "text/html" # デフォルトはHTML扱い
+            with self.client.stream("GET", url) as response:
+                response.raise_for_status()
+                declared_size = int(response.headers.get("Content-Length") or 0)
+                if declared_size > max_bytes:
+                    print(f"[JStageClient] サイズが上限を超えるためダウンロードを中止します: {declared_size} > {max_bytes} bytes")
+                    return None
+
+                body, spool_file = SpooledArticle.create(DEFAULT_SPOOL_DIR)
+                head = b""
+                head_checked = False
+                with spool_file:
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_BYTES):
+                        if not head_checked:
+                            head += chunk[: PROBE_BYTES - len(head)]
+                            if len(head) >= PROBE_BYTES:
+                                head_checked = True
+                                if expect_pdf and not head.lstrip().startswith(PDF_MAGIC):
+                                    break
+                        body.size += len(chunk)
+                        if body.size > max_bytes:
+                            print(f"[JStageClient] サイズが上限 ({max_bytes} bytes) を超えたためダウンロードを中止します。")
+                            body.close()
+                            return None
+                        spool_file.write(chunk)
+
+                content_type = _detect_content_type_from_head(response.headers, head)
+                if expect_pdf and not head.lstrip().startswith(PDF_MAGIC):
+                    print("[JStageClient] 先頭がPDFではないため、本体のダウンロードを中止しました。")
+                    body.close()
+                    return {"body": None, "content_type": "text/html", "final_url": str(response.url)}
+
+                return {"body": body, "content_type": content_type, "final_url": str(response.url)}
         # except requests.exceptions.RequestException as e:
         except (httpx.RequestError, httpx.HTTPStatusError) as e:
             print(f"[JStageClient] ダウンロード中にエラーが発生しました: {e}")
-            return None, None
+            if body is not None:
+                body.close()
+            return None
+
+    def probe_content_type(self, url: str) -> str | None:
+        """
+        本体をダウンロードせずに、URLがPDFを返すかHTMLを返すかを判定する。
+        Range ヘッダー付きのGETで先頭 PROBE_BYTES バイトだけを読み、接続を閉じる
+        （Range を無視するサーバーでも、先頭を読んだ時点で打ち切る）。
+        判定できなかった場合は None。
+        """
+        self._wait_for_interval(url)
+        try:
+            print(f"[JStageClient] コンテンツの種類を確認中: {url}")
+            with self.client.stream("GET", url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}) as response:
+                response.raise_for_status()
+                head = b""
+                for chunk in response.iter_bytes():
+                    head += chunk
+                    if len(head) >= PROBE_BYTES:
+                        break
+                return _detect_content_type_from_head(response.headers, head)
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            print(f"[JStageClient] コンテンツの種類の確認中にエラーが発生しました: {e}")
+            return None
 
-    def search_articles(self, keyword: str, count: int = 1000, start: int = 1) -> tuple[list, int]:
+    def search_articles(
+        self, keyword: str, count: int = 1000, start: int = 1, raise_on_error: bool = False
+    ) -> tuple[list, int]:
         """
         J-STAGEの論文検索APIを叩き、論文メタデータのリストと総ヒット件数を返す。
         (雑誌名・発行年/日を含むように修正)
+        キャッシュが有効な場合、TTL内のページはAPIにアクセスせずに返す。
+        検索に失敗した場合は ([], 0) を返す。raise_on_error=True の場合は、ヒット0件と区別できるよう JStageSearchError を送出する。
         """
-        self._wait_for_interval()
         params = {"service": "3", "keyword": keyword, "count": count, "start": start}
+
+        cache_entry = None
+        if self.search_cache:
+            cache_entry = self.search_cache.get(keyword, start, count, params["service"])
+            if cache_entry and self.search_cache.is_fresh(cache_entry):
+                print(f"[JStageClient] 検索結果をキャッシュから取得 (keyword): '{keyword}', (start): {start}, (count): {count}")
+                return cache_entry["articles"], cache_entry["total_results"]
+
+        self._wait_for_interval(self.base_url)
         print(f"[JStageClient] APIで論文を検索中 (keyword): '{keyword}', (start): {start}, (count): {count}")
 
         try:
             # response = self.session.get(self.base_url, params=params, timeout=30)
-            response = self.client.get(self.base_url, params=params)
+            response = self.client.get(
+                self.base_url, params=params, headers=SearchCache.conditional_headers(cache_entry)
+            )
+            if response.status_code == 304 and cache_entry:
+                # 古いキャッシュがサーバー側でも変更されていない -> 再検証済みとして使う
+                print("  -> 検索結果は未更新です (304)。キャッシュを再利用します。")
+                self.search_cache.touch(cache_entry)
+                return cache_entry["articles"], cache_entry["total_results"]
             response.raise_for_status()
             # response.encoding = response.apparent_encoding
-            root = ET.fromstring(response.text)
-
-            ns = {
-                "atom": "http://www.w3.org/2005/Atom",
-                "prism": "http://prismstandard.org/namespaces/basic/2.0/",
-                "opensearch": "http://a9.com/-/spec/opensearch/1.1/"
-            }
-
-            total_results_elem = root.find("opensearch:totalResults", ns)
-            total_results = int(total_results_elem.text) if total_results_elem is not None else 0
-
-            articles = []
-            for entry in root.findall("atom:entry", ns):
-                # 既存の抽出 (タイトル)
-                title_elem_ja = entry.find(".//atom:article_title/atom:ja", ns)
-                title_elem_en = entry.find(".//atom:article_title/atom:en", ns)
-                title_elem_atom = entry.find("atom:title", ns) # フォールバック
-                title = "N/A"
-                # 日本語タイトルがあれば優先、なければ英語、それもなければatom:title
-                if title_elem_ja is not None and title_elem_ja.text:
-                    title = title_elem_ja.text.strip()
-                elif title_elem_en is not None and title_elem_en.text:
-                    title = title_elem_en.text.strip()
-                elif title_elem_atom is not None and title_elem_atom.text:
-                    title = title_elem_atom.text.strip()
-
-                # 既存の抽出 (DOI)
-                doi_elem = entry.find("prism:doi", ns)
-                doi = doi_elem.text.strip() if doi_elem is not None and doi_elem.text else None
-
-                # 既存の抽出 (URL)
-                link_url = None
-                # PDFリンクを最優先
-                pdf_link_elem = entry.find('atom:link[@type="application/pdf"]', ns)
-                if pdf_link_elem is not None:
-                    link_url = pdf_link_elem.get("href")
-
-                # PDFがなければHTMLリンクを探し、PDF URLへの変換を試みる
-                # if link_url is None:
-                #     html_link_elem = entry.find('atom:link[@type="text/html"]', ns)
-                #     if html_link_elem is not None:
-                #         html_url = html_link_elem.get("href")
-                #         # PDF URLへの変換ロジック (成功するとは限らない)
-                #         if html_url and "/_article/" in html_url:
-                #             # link_url = html_url.replace("/_article/", "/_pdf/").replace("-char/ja", "")
-                #             link_url = html_url.replace("/_article/", "/_pdf/")
-                #         else:
-                #              link_url = html_url # 変換できなければHTML URLをそのまま使う
-                if link_url is None:
-                    html_link_elem = entry.find('atom:link[@type="text/html"]', ns)
-                    if html_link_elem is not None:
-                        link_url = html_link_elem.get("href")
-
-
-                # 上記で見つからなければ、最初のatom:linkをフォールバックとして使う
-                if link_url is None:
-                    fallback_link_elem = entry.find("atom:link", ns)
-                    if fallback_link_elem is not None:
-                        link_url = fallback_link_elem.get("href")
-
-                original_link_url = link_url
-                
-                # if link_url and "/_article/" in link_url:
-                #     link_url = link_url.replace("/_article/", "/_pdf/")
-
-                if link_url and "/_article/" in link_url:
-                    # 新ロジック: /_article/ と、それに続く余計な文字列（例: /-char/ja/）を
-                    # まとめて /_pdf/ に置換する
-                    link_url = re.sub(r'/_article/.*', '/_pdf/', link_url)
-
-
-                # 追加情報の抽出 (テストスクリプトの結果を反映)
-                # 1. 雑誌名/会議録名 (日本語 -> 英語 -> prism:publicationName の順で探す)
-                journal_name = "N/A"
-                journal_ja_elem = entry.find(".//atom:material_title/atom:ja", ns)
-                journal_en_elem = entry.find(".//atom:material_title/atom:en", ns)
-                prism_pub_name_elem = entry.find("prism:publicationName", ns) # フォールバック用
-
-                if journal_ja_elem is not None and journal_ja_elem.text:
-                    journal_name = journal_ja_elem.text.strip()
-                elif journal_en_elem is not None and journal_en_elem.text:
-                    journal_name = journal_en_elem.text.strip()
-                elif prism_pub_name_elem is not None and prism_pub_name_elem.text:
-                     journal_name = prism_pub_name_elem.text.strip()
-
-                # 2. 発行年/日 (prism:publicationDate -> atom:pubyear の順で探す)
-                published_date = "N/A"
-                pub_date_elem = entry.find("prism:publicationDate", ns) # YYYY-MM-DD形式
-                pub_year_elem = entry.find("atom:pubyear", ns) # YYYY形式
-
-                if pub_date_elem is not None and pub_date_elem.text: # 日付形式があれば優先
-                    published_date = pub_date_elem.text.strip()
-                elif pub_year_elem is not None and pub_year_elem.text: # 年だけでも取得
-                    published_date = pub_year_elem.text.strip()
-
-
-                # DOI と URL が取得できた場合のみリストに追加
-                if doi and link_url:
-                    articles.append(
-                        {
-                            "title": title,
-                            "doi": doi,
-                            "url": link_url,
-                            "journal": journal_name,
-                            "published_date": published_date,
-                            "debug_original_url": original_link_url,
-                        }
-                    )
+            articles, total_results = parse_search_response(response.content)
+
+            if self.search_cache:
+                self.search_cache.put(
+                    keyword, start, count, params["service"], articles, total_results,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
 
             # ログ表示
             if start == 1:
@@ -225,11 +261,139 @@ class JStageClient:
         # except requests.exceptions.RequestException as e:
         except httpx.RequestError as e:
             print(f"[JStageClient] 論文検索APIへのリクエスト中にエラーが発生しました（リトライ後）: {e}")
-            return [], 0
+            error = e
         except ET.ParseError as e:
             print(f"[JStageClient] 論文検索APIの応答XMLの解析に失敗しました: {e}")
             print(f"  -> 受信したテキスト: {response.text[:500]}") # デバッグ用に受信内容の一部を表示
-            return [], 0
+            error = e
         except Exception as e: # 予期せぬエラー
              print(f"[JStageClient] 予期せぬエラーが発生しました: {e}")
-             return [], 0
\ No newline at end of file
+             error = e
+        if raise_on_error:
+            raise JStageSearchError(f"検索に失敗しました (keyword: '{keyword}', start: {start}): {error}") from error
+        return [], 0
+
+
+class AsyncJStageClient:
+    """
+    JStageClient の asyncio 版。httpx.AsyncClient を使用する。
+    リミッターの待機中もイベントループは止まらないため、
+    ダウンロードや検索の待機と、先行記事の Gemini 変換などを並行して進められる。
+    同期版と同じレーンを共有するため、各レーンに設定した間隔は維持される。
+    """
+
+    def __init__(
+        self,
+        lanes: LimiterLanes | None = None,
+        base_url: str = JSTAGE_SEARCH_API_URL,
+        search_cache: SearchCache | None = None,
+    ):
+        self.lanes = lanes or get_shared_jstage_lanes()
+        self.headers = JSTAGE_HEADERS
+        self.base_url = base_url
+        self.search_cache = search_cache
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            follow_redirects=True,
+            timeout=30.0,
+            transport=httpx.AsyncHTTPTransport(retries=3),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """コネクションプールを閉じる。"""
+        await self.client.aclose()
+
+    async def download_article_content(self, url: str) -> tuple[bytes | None, str | None]:
+        """
+        指定されたURLから論文のコンテンツをダウンロードする（非同期版）。
+        """
+        await self.lanes.acquire_async(url)
+        try:
+            print(f"[AsyncJStageClient] URLからコンテンツをダウンロード中: {url}")
+            response = await self.client.get(url)
+            response.raise_for_status()
+            return response.content, _detect_content_type(response)
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            print(f"[AsyncJStageClient] ダウンロード中にエラーが発生しました: {e}")
+            return None, None
+
+    async def probe_content_type(self, url: str) -> str | None:
+        """
+        本体をダウンロードせずに、URLがPDFを返すかHTMLを返すかを判定する（非同期版）。
+        """
+        await self.lanes.acquire_async(url)
+        try:
+            print(f"[AsyncJStageClient] コンテンツの種類を確認中: {url}")
+            async with self.client.stream("GET", url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}) as response:
+                response.raise_for_status()
+                head = b""
+                async for chunk in response.aiter_bytes():
+                    head += chunk
+                    if len(head) >= PROBE_BYTES:
+                        break
+                return _detect_content_type_from_head(response.headers, head)
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            print(f"[AsyncJStageClient] コンテンツの種類の確認中にエラーが発生しました: {e}")
+            return None
+
+    async def search_articles(
+        self, keyword: str, count: int = 1000, start: int = 1, raise_on_error: bool = False
+    ) -> tuple[list, int]:
+        """
+        J-STAGEの論文検索APIを叩き、論文メタデータのリストと総ヒット件数を返す（非同期版）。
+        検索に失敗した場合は ([], 0) を返す。raise_on_error=True の場合は JStageSearchError を送出する。
+        """
+        params = {"service": "3", "keyword": keyword, "count": count, "start": start}
+
+        cache_entry = None
+        if self.search_cache:
+            cache_entry = self.search_cache.get(keyword, start, count, params["service"])
+            if cache_entry and self.search_cache.is_fresh(cache_entry):
+                print(f"[AsyncJStageClient] 検索結果をキャッシュから取得 (keyword): '{keyword}', (start): {start}, (count): {count}")
+                return cache_entry["articles"], cache_entry["total_results"]
+
+        await self.lanes.acquire_async(self.base_url)
+        print(f"[AsyncJStageClient] APIで論文を検索中 (keyword): '{keyword}', (start): {start}, (count): {count}")
+
+        try:
+            response = await self.client.get(
+                self.base_url, params=params, headers=SearchCache.conditional_headers(cache_entry)
+            )
+            if response.status_code == 304 and cache_entry:
+                print("  -> 検索結果は未更新です (304)。キャッシュを再利用します。")
+                self.search_cache.touch(cache_entry)
+                return cache_entry["articles"], cache_entry["total_results"]
+            response.raise_for_status()
+            articles, total_results = parse_search_response(response.content)
+
+            if self.search_cache:
+                self.search_cache.put(
+                    keyword, start, count, params["service"], articles, total_results,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
+
+            if start == 1:
+                print(f"  -> 総ヒット件数: {total_results} 件。")
+            print(f"  -> {len(articles)} 件の論文メタデータを取得しました。")
+            return articles, total_results
+
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            print(f"[AsyncJStageClient] 論文検索APIへのリクエスト中にエラーが発生しました（リトライ後）: {e}")
+            error = e
+        except ET.ParseError as e:
+            print(f"[AsyncJStageClient] 論文検索APIの応答XMLの解析に失敗しました: {e}")
+            print(f"  -> 受信したテキスト: {response.text[:500]}")
+            error = e
+        except Exception as e:
+            print(f"[AsyncJStageClient] 予期せぬエラーが発生しました: {e}")
+            error = e
+        if raise_on_error:
+            raise JStageSearchError(f"検索に失敗しました (keyword: '{keyword}', start: {start}): {error}") from error
+        return [], 0
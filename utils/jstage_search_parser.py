@@ -0,0 +1,247 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+
+# 名前空間付きタグ名（iterparse で比較するため事前に組み立てておく）
+ATOM_NS = "http://www.w3.org/2005/Atom"
+PRISM_NS = "http://prismstandard.org/namespaces/basic/2.0/"
+OPENSEARCH_NS = "http://a9.com/-/spec/opensearch/1.1/"
+
+TAG_ENTRY = f"{{{ATOM_NS}}}entry"
+TAG_TITLE = f"{{{ATOM_NS}}}title"
+TAG_LINK = f"{{{ATOM_NS}}}link"
+TAG_JA = f"{{{ATOM_NS}}}ja"
+TAG_EN = f"{{{ATOM_NS}}}en"
+TAG_ARTICLE_TITLE = f"{{{ATOM_NS}}}article_title"
+TAG_MATERIAL_TITLE = f"{{{ATOM_NS}}}material_title"
+TAG_PUBYEAR = f"{{{ATOM_NS}}}pubyear"
+TAG_DOI = f"{{{PRISM_NS}}}doi"
+TAG_PUBLICATION_NAME = f"{{{PRISM_NS}}}publicationName"
+TAG_PUBLICATION_DATE = f"{{{PRISM_NS}}}publicationDate"
+TAG_TOTAL_RESULTS = f"{{{OPENSEARCH_NS}}}totalResults"
+
+# /_article/ と、それに続く余計な文字列（例: /-char/ja/）をまとめて /_pdf/ に置換する
+ARTICLE_TO_PDF_PATTERN = re.compile(r"/_article/.*")
+
+# エントリの直下の要素のうち、テキストを記録するもの
+_ENTRY_CHILD_TEXT_FIELDS = {
+    TAG_TITLE: "atom_title",
+    TAG_DOI: "doi",
+    TAG_PUBLICATION_NAME: "publication_name",
+    TAG_PUBLICATION_DATE: "publication_date",
+    TAG_PUBYEAR: "pubyear",
+}
+
+# 「.//article_title/ja」のような子孫検索に相当する (親タグ, 子タグ, 記録先のフィールド名)
+_NESTED_TEXT_FIELDS = (
+    (TAG_ARTICLE_TITLE, TAG_JA, "title_ja"),
+    (TAG_ARTICLE_TITLE, TAG_EN, "title_en"),
+    (TAG_MATERIAL_TITLE, TAG_JA, "journal_ja"),
+    (TAG_MATERIAL_TITLE, TAG_EN, "journal_en"),
+)
+
+
+def _first_text(fields: dict, *names: str) -> str | None:
+    """fields のうち、最初に見つかった空でない値を（前後の空白を除いて）返す。"""
+    for name in names:
+        value = fields.get(name)
+        if value:
+            return value.strip()
+    return None
+
+
+def _build_article(fields: dict) -> dict | None:
+    """1エントリ分の抽出結果から論文メタデータを組み立てる。DOI と URL がなければ None。"""
+    # 日本語タイトルがあれば優先、なければ英語、それもなければatom:title
+    title = _first_text(fields, "title_ja", "title_en", "atom_title") or "N/A"
+    doi = fields["doi"].strip() if fields.get("doi") else None
+
+    # PDFリンクを最優先 -> HTMLリンク -> 最初のatom:link
+    link_url = fields.get("pdf_link") or fields.get("html_link") or fields.get("first_link")
+    original_link_url = link_url
+    if link_url and "/_article/" in link_url:
+        link_url = ARTICLE_TO_PDF_PATTERN.sub("/_pdf/", link_url)
+
+    # 雑誌名/会議録名 (日本語 -> 英語 -> prism:publicationName の順)
+    journal_name = _first_text(fields, "journal_ja", "journal_en", "publication_name") or "N/A"
+    # 発行年/日 (prism:publicationDate -> atom:pubyear の順)
+    published_date = _first_text(fields, "publication_date", "pubyear") or "N/A"
+
+    if not (doi and link_url):
+        return None
+    return {
+        "title": title,
+        "doi": doi,
+        "url": link_url,
+        "journal": journal_name,
+        "published_date": published_date,
+        "debug_original_url": original_link_url,
+    }
+
+
+def _extract_entry_fields(entry: ET.Element) -> dict:
+    """1エントリの子要素を1回走査し、必要な項目の生テキスト／リンクを集める。"""
+    fields = {}
+    for child in entry:
+        tag = child.tag
+        if tag == TAG_LINK:
+            href = child.get("href")
+            link_type = child.get("type")
+            fields.setdefault("first_link", href)
+            if link_type == "application/pdf":
+                fields.setdefault("pdf_link", href)
+            elif link_type == "text/html":
+                fields.setdefault("html_link", href)
+        else:
+            name = _ENTRY_CHILD_TEXT_FIELDS.get(tag)
+            if name and name not in fields:
+                fields[name] = child.text
+
+    # ElementPath の find と同様、文書順で最初に出現した要素を採用する
+    for parent_tag, child_tag, name in _NESTED_TEXT_FIELDS:
+        for parent in entry.iter(parent_tag):
+            elem = parent.find(child_tag)
+            if elem is not None:
+                fields[name] = elem.text
+                break
+    return fields
+
+
+def parse_search_response(xml_bytes: bytes) -> tuple[list, int]:
+    """
+    J-STAGE検索APIの応答XMLを解析し、論文メタデータのリストと総ヒット件数を返す。
+    iterparse で受信バイト列を先頭から1回だけ走査し、エントリが閉じた時点で必要な項目を抽出する。
+    処理済みのエントリは都度破棄するため、count=1000 のページでもツリー全体を保持しない。
+    """
+    total_results = 0
+    articles = []
+
+    for _, elem in ET.iterparse(io.BytesIO(xml_bytes), events=("end",)):
+        tag = elem.tag
+        if tag == TAG_ENTRY:
+            article = _build_article(_extract_entry_fields(elem))
+            if article:
+                articles.append(article)
+            elem.clear()
+        elif tag == TAG_TOTAL_RESULTS and elem.text:
+            total_results = int(elem.text.strip())
+
+    return articles, total_results
+
+
+def parse_search_response_etree(xml_text: str) -> tuple[list, int]:
+    """
+    J-STAGE検索APIの応答XMLを解析し、論文メタデータのリストと総ヒット件数を返す。
+    (旧実装: ツリー全体を構築し、エントリごとに ElementPath で検索する。
+     ベンチマークでの比較用に残している。通常は parse_search_response を使用する)
+    """
+    root = ET.fromstring(xml_text)
+
+    ns = {
+        "atom": "http://www.w3.org/2005/Atom",
+        "prism": "http://prismstandard.org/namespaces/basic/2.0/",
+        "opensearch": "http://a9.com/-/spec/opensearch/1.1/"
+    }
+
+    total_results_elem = root.find("opensearch:totalResults", ns)
+    total_results = int(total_results_elem.text) if total_results_elem is not None else 0
+
+    articles = []
+    for entry in root.findall("atom:entry", ns):
+        # 既存の抽出 (タイトル)
+        title_elem_ja = entry.find(".//atom:article_title/atom:ja", ns)
+        title_elem_en = entry.find(".//atom:article_title/atom:en", ns)
+        title_elem_atom = entry.find("atom:title", ns) # フォールバック
+        title = "N/A"
+        # 日本語タイトルがあれば優先、なければ英語、それもなければatom:title
+        if title_elem_ja is not None and title_elem_ja.text:
+            title = title_elem_ja.text.strip()
+        elif title_elem_en is not None and title_elem_en.text:
+            title = title_elem_en.text.strip()
+        elif title_elem_atom is not None and title_elem_atom.text:
+            title = title_elem_atom.text.strip()
+
+        # 既存の抽出 (DOI)
+        doi_elem = entry.find("prism:doi", ns)
+        doi = doi_elem.text.strip() if doi_elem is not None and doi_elem.text else None
+
+        # 既存の抽出 (URL)
+        link_url = None
+        # PDFリンクを最優先
+        pdf_link_elem = entry.find('atom:link[@type="application/pdf"]', ns)
+        if pdf_link_elem is not None:
+            link_url = pdf_link_elem.get("href")
+
+        # PDFがなければHTMLリンクを探し、PDF URLへの変換を試みる
+        # if link_url is None:
+        #     html_link_elem = entry.find('atom:link[@type="text/html"]', ns)
+        #     if html_link_elem is not None:
+        #         html_url = html_link_elem.get("href")
+        #         # PDF URLへの変換ロジック (成功するとは限らない)
+        #         if html_url and "/_article/" in html_url:
+        #             # link_url = html_url.replace("/_article/", "/_pdf/").replace("-char/ja", "")
+        #             link_url = html_url.replace("/_article/", "/_pdf/")
+        #         else:
+        #              link_url = html_url # 変換できなければHTML URLをそのまま使う
+        if link_url is None:
+            html_link_elem = entry.find('atom:link[@type="text/html"]', ns)
+            if html_link_elem is not None:
+                link_url = html_link_elem.get("href")
+
+
+        # 上記で見つからなければ、最初のatom:linkをフォールバックとして使う
+        if link_url is None:
+            fallback_link_elem = entry.find("atom:link", ns)
+            if fallback_link_elem is not None:
+                link_url = fallback_link_elem.get("href")
+
+        original_link_url = link_url
+
+        # if link_url and "/_article/" in link_url:
+        #     link_url = link_url.replace("/_article/", "/_pdf/")
+
+        if link_url and "/_article/" in link_url:
+            # 新ロジック: /_article/ と、それに続く余計な文字列（例: /-char/ja/）を
+            # まとめて /_pdf/ に置換する
+            link_url = re.sub(r'/_article/.*', '/_pdf/', link_url)
+
+
+        # 追加情報の抽出 (テストスクリプトの結果を反映)
+        # 1. 雑誌名/会議録名 (日本語 -> 英語 -> prism:publicationName の順で探す)
+        journal_name = "N/A"
+        journal_ja_elem = entry.find(".//atom:material_title/atom:ja", ns)
+        journal_en_elem = entry.find(".//atom:material_title/atom:en", ns)
+        prism_pub_name_elem = entry.find("prism:publicationName", ns) # フォールバック用
+
+        if journal_ja_elem is not None and journal_ja_elem.text:
+            journal_name = journal_ja_elem.text.strip()
+        elif journal_en_elem is not None and journal_en_elem.text:
+            journal_name = journal_en_elem.text.strip()
+        elif prism_pub_name_elem is not None and prism_pub_name_elem.text:
+             journal_name = prism_pub_name_elem.text.strip()
+
+        # 2. 発行年/日 (prism:publicationDate -> atom:pubyear の順で探す)
+        published_date = "N/A"
+        pub_date_elem = entry.find("prism:publicationDate", ns) # YYYY-MM-DD形式
+        pub_year_elem = entry.find("atom:pubyear", ns) # YYYY形式
+
+        if pub_date_elem is not None and pub_date_elem.text: # 日付形式があれば優先
+            published_date = pub_date_elem.text.strip()
+        elif pub_year_elem is not None and pub_year_elem.text: # 年だけでも取得
+            published_date = pub_year_elem.text.strip()
+
+
+        # DOI と URL が取得できた場合のみリストに追加
+        if doi and link_url:
+            articles.append(
+                {
+                    "title": title,
+                    "doi": doi,
+                    "url": link_url,
+                    "journal": journal_name,
+                    "published_date": published_date,
+                    "debug_original_url": original_link_url,
+                }
+            )
+
+    return articles, total_results
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+
+from pydantic import BaseModel
+
+load_dotenv()
+
+DEFAULT_LLM_RESPONSE_CACHE_DIR = os.path.join("output", "cache", "llm_responses")
+# キャッシュ全体のサイズ上限。超えた場合は最後に使われたのが古いエントリから削除する
+DEFAULT_LLM_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", 256 * 1024**2))
+# 上限を超えたときに、上限のこの割合まで削除する（削除が毎回の書き込みで起きないようにする）
+EVICTION_TARGET_RATIO = 0.9
+
+
+class LLMCacheMissError(LookupError):
+    """リプレイモードで、キャッシュにない呼び出しが行われたことを示す例外。"""
+
+
+class CachedUsageMetadata:
+    """キャッシュした応答のトークン数（Gemini の usage_metadata と同じ属性名）。"""
+
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class CachedResponse:
+    """キャッシュから返す応答。呼び出し側が参照する text / parsed / candidates / usage_metadata だけを持つ。"""
+
+    def __init__(self, text: str, usage_metadata: CachedUsageMetadata):
+        self.text = text
+        self.parsed = None
+        self.candidates = None
+        self.prompt_feedback = None
+        self.usage_metadata = usage_metadata
+
+
+def _canonical(value):
+    """キーのハッシュ用に、リクエストの内容をJSONにできる値に変換する（バイト列は内容のハッシュにする）。"""
+    if isinstance(value, BaseModel):
+        return _canonical(value.model_dump(exclude_none=True))
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return {"schema": value.__name__, "json_schema": value.model_json_schema()}
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class LLMResponseCache:
+    """
+    LLM の応答を、リクエストの内容（モデル・プロンプト・スキーマ・生成設定）のハッシュをキーに保存するキャッシュ。
+    1応答 = 1 JSONファイルとして保存し、全体のサイズが max_bytes を超えたら最後に使われたのが古いものから削除する（LRU）。
+
+    - 同じプロンプトの再実行（クラッシュ後の再実行など）では API を呼ばずにキャッシュの応答を返す。
+    - replay=True の場合はキャッシュからのみ応答し、キャッシュにない呼び出しは LLMCacheMissError にする
+      （APIを使わない再実行・後段の処理のデバッグ用）。
+    - ヒット率と、呼び出しを省略したことで節約したトークン数を stats に集計する。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_LLM_RESPONSE_CACHE_DIR,
+        max_bytes: Optional[int] = None,
+        replay: bool = False,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_LLM_RESPONSE_CACHE_MAX_BYTES
+        self.replay = replay
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # digest -> [ファイルサイズ, 最終利用時刻]
+        self._index: dict = {}
+        self._total_bytes = 0
+        self._load_index()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+            "saved_prompt_tokens": 0,
+            "saved_output_tokens": 0,
+        }
+
+    def _load_index(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                self._index[entry.name[:-5]] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+
+    @staticmethod
+    def make_key(model: str, contents, config=None, schema=None) -> str:
+        """リクエストの内容からキャッシュのキー（sha256）を作る。タイムアウトなどの通信設定はキーに含めない。"""
+        if isinstance(config, BaseModel):
+            config = config.model_dump(exclude_none=True, exclude={"http_options"})
+        elif isinstance(config, dict):
+            config = {key: value for key, value in config.items() if key != "http_options"}
+        key = {
+            "model": model,
+            "contents": _canonical(contents),
+            "config": _canonical(config),
+            "schema": _canonical(schema),
+        }
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def get(self, digest: str) -> Optional[CachedResponse]:
+        """キャッシュした応答を返す（存在しない場合は None）。"""
+        path = self._path_for(digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[LLMResponseCache] キャッシュファイルの読み込みに失敗しました（無視します）: {path} ({e})")
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        usage = CachedUsageMetadata(entry.get("prompt_tokens", 0), entry.get("output_tokens", 0))
+        now = time.time()
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["saved_prompt_tokens"] += usage.prompt_token_count
+            self.stats["saved_output_tokens"] += usage.candidates_token_count
+            if digest in self._index:
+                self._index[digest][1] = now
+        try:
+            # 最終利用時刻をファイルの更新時刻に残し、次回の起動時も LRU の順序を保つ
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return CachedResponse(entry["text"], usage)
+
+    def put(self, digest: str, response, model: str = "", purpose: str = ""):
+        """応答のテキストとトークン数を保存する。書き込みは一時ファイル経由でアトミックに行う。"""
+        text = getattr(response, "text", None)
+        if not text:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "model": model,
+            "purpose": purpose,
+            "text": text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+            "created_at": time.time(),
+        }
+        path = self._path_for(digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[LLMResponseCache] キャッシュの書き込みに失敗しました: {path} ({e})")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            previous = self._index.get(digest)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._index[digest] = [size, time.time()]
+            self._total_bytes += size
+            self.stats["writes"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """最後に使われたのが古いエントリから、合計サイズが上限の EVICTION_TARGET_RATIO 以下になるまで削除する（ロック内で呼び出すこと）。"""
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        for digest, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(self._path_for(digest))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[LLMResponseCache] キャッシュの削除に失敗しました: {digest} ({e})")
+                continue
+            del self._index[digest]
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        """ヒット率・節約したトークン数・キャッシュのサイズを含む集計を返す。"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._index),
+                "total_bytes": self._total_bytes,
+            }
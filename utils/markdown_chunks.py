@@ -0,0 +1,192 @@
+import re
+from difflib import SequenceMatcher
+
+import fitz  # PyMuPDF
+
+from utils.text_extractor import open_pdf
+
+# 重複の判定に使う、前のチャンクの末尾のブロック数
+OVERLAP_SEARCH_BLOCKS = 40
+# 重複とみなすブロックの類似度（LLMの出力は重複部分でも完全には一致しないため）
+OVERLAP_SIMILARITY = 0.85
+# 類似度で重複を判定するブロックの最小文字数（短いブロックは偶然一致しやすいため、完全一致のみを重複とする）
+OVERLAP_MIN_CHARS = 10
+# 重複部分の照合で読み飛ばせる、前のチャンクの末尾のブロック数（LLMが重なったページの一部を省略することがあるため）
+OVERLAP_MAX_SKIP = 2
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def plan_page_ranges(page_count: int, chunk_pages: int, overlap_pages: int) -> list:
+    """
+    page_count ページを、chunk_pages ページずつ overlap_pages ページ重ねた範囲に分ける。
+    (開始ページ, 終了ページ) のタプル（0始まり・終了ページは含まない）のリストを返す。
+    """
+    chunk_pages = max(1, chunk_pages)
+    step = max(1, chunk_pages - max(0, overlap_pages))
+    ranges = []
+    start = 0
+    while start < page_count:
+        end = min(page_count, start + chunk_pages)
+        ranges.append((start, end))
+        if end >= page_count:
+            break
+        start += step
+    return ranges
+
+
+def split_text_into_pages(text: str, page_chars: int) -> list:
+    """
+    ページ情報のないテキスト（HTMLから抽出したものなど）を、行の区切りで約 page_chars 文字ずつの疑似ページに分ける。
+    """
+    pages, current, current_chars = [], [], 0
+    for line in text.splitlines():
+        if current and current_chars + len(line) > page_chars:
+            pages.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(line)
+        current_chars += len(line)
+    if current:
+        pages.append("\n".join(current))
+    return pages
+
+
+def extract_pdf_pages(source, start: int, end: int) -> bytes:
+    """
+    開いたPDF（source。open_pdf で開いた fitz.Document）の start ページから end ページの手前までを、
+    新しいPDFとして返す（0始まり）。MuPDF はスレッドセーフではないため、複数のスレッドから呼ぶ場合は呼び出し側で排他する。
+    """
+    with fitz.open() as chunk:
+        chunk.insert_pdf(source, from_page=start, to_page=end - 1)
+        return chunk.tobytes(garbage=3, deflate=True)
+
+
+def count_pdf_pages(content) -> int:
+    """PDFのページ数を返す（開けない場合は0）。"""
+    try:
+        with open_pdf(content) as doc:
+            return doc.page_count
+    except Exception as e:
+        print(f"[MarkdownChunks] PDFのページ数を取得できませんでした: {e}")
+        return 0
+
+
+def _split_blocks(markdown: str) -> list:
+    """Markdownを空行区切りのブロックに分ける（コードブロックは1つのブロックにまとめ、見出しは単独のブロックにする）。"""
+    blocks, current, in_fence = [], [], False
+    for line in markdown.strip().splitlines():
+        if line.strip().startswith("```"):
+            if not in_fence and current:
+                # コードブロックの直前の段落は別のブロックにする
+                blocks.append("\n".join(current))
+                current = []
+            current.append(line)
+            in_fence = not in_fence
+            if not in_fence:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        if in_fence:
+            current.append(line)
+            continue
+        if not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        if _HEADING_PATTERN.match(line.strip()):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            blocks.append(line.strip())
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _heading(block: str):
+    """見出しのブロックであれば (レベル, 正規化したテキスト) を、そうでなければ None を返す。"""
+    match = _HEADING_PATTERN.match(block) if "\n" not in block else None
+    if match is None:
+        return None
+    return len(match.group(1)), _normalize(match.group(2))
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+def _fix_heading_level(block: str) -> str:
+    """論文タイトル用の H1 見出しは本文に含めない方針のため、チャンク内の H1 は H2 にする。"""
+    heading = _HEADING_PATTERN.match(block) if "\n" not in block else None
+    if heading and len(heading.group(1)) == 1:
+        return f"## {heading.group(2)}"
+    return block
+
+
+def _matches(block: str, candidate: str) -> bool:
+    """ブロックが前のチャンクのブロック（正規化済み）と（ほぼ）一致するかを返す。"""
+    normalized = _normalize(block)
+    if normalized == candidate:
+        return True
+    if _heading(block) is not None or len(normalized) < OVERLAP_MIN_CHARS:
+        # 見出しは「第2章」と「第3章」のように1文字違いでも別物のため、短いブロックとともに完全一致のみを重複とする
+        return False
+    matcher = SequenceMatcher(None, normalized, candidate, autojunk=False)
+    return matcher.real_quick_ratio() >= OVERLAP_SIMILARITY and matcher.ratio() >= OVERLAP_SIMILARITY
+
+
+def _leading_overlap(blocks: list, tail: list) -> int:
+    """
+    チャンクの先頭から、前のチャンクの末尾と同じ順序で連続して一致するブロックの数を返す。
+
+    - 一致しないブロックが現れた時点で打ち切る（その後に一致するブロックがあっても、手前のブロックは除かない）。
+    - 見出しは、その下のブロックも重複している場合のみ除くため、一致した範囲の最後の見出しは数えない
+      （前のチャンクが見出しで終わっている場合は、その下の本文がないため除く）。
+    - 見出しや短いブロックだけの一致は偶然の可能性があるため、重複とみなさない。
+    """
+    tail_normalized = [_normalize(block) for block in tail]
+    best = 0
+    for start, candidate in enumerate(tail_normalized):
+        if not blocks or not _matches(blocks[0], candidate):
+            continue
+        positions = [start]
+        while len(positions) < len(blocks):
+            window = range(positions[-1] + 1, min(len(tail_normalized), positions[-1] + 2 + OVERLAP_MAX_SKIP))
+            matched = next((index for index in window if _matches(blocks[len(positions)], tail_normalized[index])), None)
+            if matched is None:
+                break
+            positions.append(matched)
+        length = len(positions)
+        while length and _heading(blocks[length - 1]) is not None and positions[length - 1] < len(tail) - 1:
+            length -= 1
+        substantive = any(
+            _heading(block) is None and len(_normalize(block)) >= OVERLAP_MIN_CHARS for block in blocks[:length]
+        )
+        if substantive and length > best:
+            best = length
+    return best
+
+
+def stitch_markdown_chunks(chunks: list) -> str:
+    """
+    重なりのあるページ範囲ごとに変換したMarkdownを1つにつなぐ。
+
+    - 各チャンクの先頭のうち、前のチャンクの末尾と同じ順序で連続して重複するブロック（重なったページの変換結果）を取り除く。
+    - 「方法」「結果」のように同じ名前の見出しが別の節に現れることがあるため、見出しはその下の本文も重複している場合のみ取り除く。
+    - H1 見出しは H2 にする（## / ### の階層を保つため）。
+    """
+    stitched = []
+    previous_blocks: list = []
+    for chunk in chunks:
+        blocks = [_fix_heading_level(block) for block in _split_blocks(chunk or "")]
+        if previous_blocks:
+            overlap = _leading_overlap(blocks, previous_blocks[-OVERLAP_SEARCH_BLOCKS:])
+            new_blocks = blocks[overlap:]
+        else:
+            new_blocks = blocks
+        stitched.extend(new_blocks)
+        previous_blocks = blocks
+    return "\n\n".join(stitched)
@@ -3,11 +3,11 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Optional, Type # Type をインポート
 from datetime import date
-from google import genai
 from google.genai import types # types をインポート
-from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable # エラーハンドリング用
 import json
-import time # sleep用にインポート
+from core.client_registry import get_default_registry
+from core.adaptive_concurrency import is_throttling_error
+from core.model_router import apply_route_config
 
 # schemas.py から PatientMasterSchema と分割スキーマ群をインポート
 # from schemas import PatientMasterSchema, PATIENT_INFO_EXTRACTION_GROUPS
@@ -21,6 +21,16 @@ from schemas import (
     PersonaStage_Goal_ContextFactors                                   # ステージ7用
 )
 
+# ペルソナ・P2計画書・P3資料の生成で共通して渡す論文の長さ（文字数）。
+# 3つの呼び出しで同じ内容を先頭に置き、Gemini のコンテキストキャッシュを論文ごとに1つだけ作って使い回す
+PAPER_CONTEXT_CHARS = 10000
+
+
+def build_paper_context(markdown_text: str) -> str:
+    """LLMGateway.generate の cache_prefix に渡す、論文の内容（論文ごとに共通の先頭部分）を作る。"""
+    return f"【関連論文の内容】\n{markdown_text[:PAPER_CONTEXT_CHARS]}"
+
+
 # --- 1. Pydanticによるペルソナのスキーマ定義 ---
 # (PatientPersonaクラスの定義は変更なしのため省略)
 class PatientPersona(BaseModel):
@@ -330,11 +340,10 @@ class PatientPersona(BaseModel):
 
 def _build_staged_persona_prompt(
     paper_theme: str,
-    paper_content: str,
     group_schema: Type[BaseModel],
     generated_data_so_far: dict
 ) -> str:
-    """段階的ペルソナ生成用のプロンプトを構築する"""
+    """段階的ペルソナ生成用のプロンプトを構築する（論文の内容は cache_prefix として先頭に置くため含めない）"""
 
     # これまでに生成されたデータを簡潔なサマリーにする
     summary = json.dumps(generated_data_so_far, indent=2, ensure_ascii=False, default=str) if generated_data_so_far else "まだありません。"
@@ -343,7 +352,7 @@ def _build_staged_persona_prompt(
     schema_json = json.dumps(group_schema.model_json_schema(), indent=2, ensure_ascii=False)
 
     return f"""あなたは経験豊富な臨床家であり、脚本家でもあります。
-以下の【関連論文の内容】とその【テーマ】、そして【これまでに生成されたペルソナ情報】を読み、**続きとなる**リアルな架空の患者プロフィールを創作してください。
+先頭の【関連論文の内容】とその【テーマ】、そして【これまでに生成されたペルソナ情報】を読み、**続きとなる**リアルな架空の患者プロフィールを創作してください。
 
 今回のタスクでは、以下の【JSONスキーマ】で定義されている項目**のみ**を生成対象とします。
 スキーマで定義されている全ての項目について、臨床的に妥当な値を創作または判断して埋めてください。特にブール型 (`_chk` で終わる項目など) は `true` か `false` を明確に設定してください。情報がない場合は `null` としてください。
@@ -351,9 +360,6 @@ def _build_staged_persona_prompt(
 【関連論文のテーマ】
 {paper_theme}
 
-【関連論文の内容】
-{paper_content}
-
 【これまでに生成されたペルソナ情報】
 {summary}
 
@@ -371,17 +377,23 @@ def _build_staged_persona_prompt(
 """
 
 
-def generate_persona(paper_theme: str, paper_content: str, gemini_api_key: str) -> dict: # 戻り値を PatientPersona から dict に変更
+def generate_persona(paper_theme: str, paper_content: str, gemini_api_key: str, clients=None) -> dict: # 戻り値を PatientPersona から dict に変更
     """
     【修正版】論文テーマと内容から、Geminiを使って患者ペルソナを段階的に生成する。
+    clients (ClientRegistry) が指定されない場合は、プロセス既定のレジストリのクライアントを使う。
     """
-    client = genai.Client(api_key=gemini_api_key)
+    clients = clients or get_default_registry()
+    gateway = clients.get_llm_gateway(gemini_api_key)
+    # モデルはルーターが選ぶ（flash-lite から始め、構造化出力の解析に失敗したステージだけ上位のモデルで再実行する）
+    router = clients.get_model_router()
     final_persona_data = {} # 最終的な結果を格納する辞書
 
     print("\n～～～ ペルソナ生成リクエスト（段階的生成 - 4段階） ～～～") # メッセージを修正
     print(f"テーマ: {paper_theme}")
     print(f"関連論文(冒頭):\n{paper_content[:300]}...")
     print("～～～～～～～～～～～～～～～～～～")
+    # 論文の内容は全ステージで共通のため、コンテキストキャッシュに1度だけ登録して参照する
+    paper_context = build_paper_context(paper_content)
 
     # PATIENT_INFO_EXTRACTION_GROUPS の代わりに PERSONA_GENERATION_STAGES をループ
     for group_schema in PERSONA_GENERATION_STAGES_7:
@@ -391,61 +403,50 @@ def generate_persona(paper_theme: str, paper_content: str, gemini_api_key: str)
         # プロンプトを構築
         prompt = _build_staged_persona_prompt(
             paper_theme=paper_theme,
-            paper_content=paper_content[:10000], # トークン数制限を考慮
             group_schema=group_schema,
             generated_data_so_far=final_persona_data
         )
 
         # API呼び出し実行 (JSONモード)
         generation_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=group_schema,
             temperature=1.5 # 創造性と安定性のバランス
         )
 
-        # APIリトライ処理
-        max_retries = 3
-        backoff_factor = 2
-        response = None
-
-        for attempt in range(max_retries):
-            try:
-                response = client.models.generate_content(
-                    model="gemini-2.5-flash-lite", # スキーマが少し大きくなったので Flash で試行継続
+        # API呼び出し（429/503 の再試行と同時実行数の調整・JSONの解析はゲートウェイが行う）
+        parsed = None
+        try:
+            result, _ = router.call(
+                router.route_generation("persona"),
+                lambda decision: gateway.generate(
+                    model=decision["model"],
                     contents=prompt,
-                    config=generation_config
-                )
-                break # 成功したらループを抜ける
-            except (ResourceExhausted, ServiceUnavailable) as e:
-                if attempt < max_retries - 1:
-                    wait_time = backoff_factor * (2 ** attempt)
-                    print(f"     [警告] APIレート制限またはサーバーエラー。{wait_time}秒後に再試行します... ({attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"     [エラー] API呼び出しが{max_retries}回失敗しました。ステージ '{group_schema.__name__}' をスキップします。")
-                    response = None # エラーが発生したことを示す
-                    break # ループを抜ける
-            except Exception as e: # その他の予期せぬエラー
+                    config=apply_route_config(decision, generation_config),
+                    schema=group_schema,
+                    purpose="persona",
+                    cache_prefix=paper_context,
+                ),
+            )
+            parsed = result["parsed"]
+        except Exception as e:
+            if is_throttling_error(e):
+                print(f"     [エラー] API呼び出しの再試行がすべて失敗しました。ステージ '{group_schema.__name__}' をスキップします。")
+            else: # その他の予期せぬエラー
                 print(f"     [エラー] ステージ '{group_schema.__name__}' の生成中に予期せぬエラー: {e}")
-                response = None
-                break
+            parsed = None
 
-        if response and response.parsed:
+        if parsed:
             try:
                 # Pydanticオブジェクトを辞書に変換してマージ
-                group_result = response.parsed.model_dump(mode='json')
+                group_result = parsed.model_dump(mode='json')
                 # 値がNoneのキーはマージしない
                 final_persona_data.update({k: v for k, v in group_result.items() if v is not None})
                 print(f"  -> ステージ '{group_schema.__name__}' 完了。")
             except Exception as parse_e:
                 print(f"     [エラー] ステージ '{group_schema.__name__}' の結果パースまたはマージ中にエラー: {parse_e}")
         else:
-            # response が None の場合 (APIエラー後) または response.parsed がない場合
+            # parsed が None の場合 (APIエラー後)
             print(f"  -> ステージ '{group_schema.__name__}' の生成に失敗またはスキップされました。")
 
-
-        # APIレート制限対策 (ステージ間の待機時間は少し長めにしても良いかもしれません)
-        time.sleep(3) # 各ステージ生成後に待機
         
     if not final_persona_data:
         raise ValueError("ペルソナ生成に失敗しました: どのステージからも有効なデータが得られませんでした。")
@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import threading
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレートリミッター。
+    スレッド（同期）と asyncio（非同期）の両方から同じバケットを共有できる。
+
+    - interval: トークン1個が補充されるまでの秒数（= 平均リクエスト間隔）
+    - burst: バケットの容量。1 の場合、連続する2リクエストの間隔は必ず interval 以上になる。
+
+    待機時間は「予約」方式で計算する（トークンが不足している場合は残高をマイナスにして
+    将来のトークンを先取りする）ため、同時に待機している呼び出し元同士が
+    同じトークンを奪い合うことはなく、到着順に間隔が確保される。
+    """
+
+    def __init__(self, interval: float, burst: int = 1, name: str = "default"):
+        self.name = name
+        self.interval = max(0.0, float(interval))
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 計測用カウンター
+        self.acquire_count = 0
+        self.wait_count = 0
+        self.total_wait_time = 0.0
+
+    def _refill(self, now: float):
+        """経過時間に応じてトークンを補充する（ロック内で呼び出すこと）。"""
+        if self.interval <= 0:
+            self._tokens = float(self.capacity)
+        else:
+            elapsed = now - self._last_refill
+            self._tokens = min(float(self.capacity), self._tokens + elapsed / self.interval)
+        self._last_refill = now
+
+    def reserve(self) -> float:
+        """
+        トークンを1個予約し、実際に使えるようになるまでの待機秒数を返す。
+        待機自体は呼び出し元が行う（acquire / acquire_async）。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            wait_time = 0.0 if self._tokens >= 0 else -self._tokens * self.interval
+
+            self.acquire_count += 1
+            if wait_time > 0:
+                self.wait_count += 1
+                self.total_wait_time += wait_time
+            return wait_time
+
+    def acquire(self) -> float:
+        """トークンを取得するまでブロックする（同期版）。待機した秒数を返す。"""
+        wait_time = self.reserve()
+        if wait_time > 0:
+            print(f"    -> (待機: {wait_time:.2f}秒)")
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        """トークンを取得するまで待機する（非同期版）。待機中も他のタスクは実行される。"""
+        wait_time = self.reserve()
+        if wait_time > 0:
+            print(f"    -> (待機: {wait_time:.2f}秒)")
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+    def get_stats(self) -> dict:
+        """リミッターの計測値を返す。"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "interval": self.interval,
+                "burst": self.capacity,
+                "acquire_count": self.acquire_count,
+                "wait_count": self.wait_count,
+                "total_wait_time": round(self.total_wait_time, 3),
+            }
+
+
+class LimiterLanes:
+    """
+    エンドポイント／ホストごとに独立したトークンバケット（レーン）を管理する。
+    検索API（searchapi/do）と論文ホスト（/_pdf/ など）は互いの待機に影響しない。
+
+    レーンの設定は環境変数で行う（未設定の場合は JSTAGE_REQUEST_INTERVAL / JSTAGE_REQUEST_BURST）。
+    - search レーン: JSTAGE_SEARCH_INTERVAL, JSTAGE_SEARCH_BURST
+    - article レーン（ホストごと）: JSTAGE_ARTICLE_INTERVAL, JSTAGE_ARTICLE_BURST
+    """
+
+    SEARCH_LANE = "search"
+    ARTICLE_LANE_PREFIX = "article"
+
+    def __init__(self, lane_config: dict | None = None):
+        # lane_config: {"search": {"interval": 10, "burst": 1}, "article": {...}}
+        self.lane_config = lane_config if lane_config is not None else self._load_config_from_env()
+        self._lanes: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_config_from_env() -> dict:
+        """環境変数からレーンごとの間隔とバースト数を読み込む。"""
+        default_interval = float(os.getenv("JSTAGE_REQUEST_INTERVAL", 10))
+        default_burst = int(os.getenv("JSTAGE_REQUEST_BURST", 1))
+        return {
+            "search": {
+                "interval": float(os.getenv("JSTAGE_SEARCH_INTERVAL", default_interval)),
+                "burst": int(os.getenv("JSTAGE_SEARCH_BURST", default_burst)),
+            },
+            "article": {
+                "interval": float(os.getenv("JSTAGE_ARTICLE_INTERVAL", default_interval)),
+                "burst": int(os.getenv("JSTAGE_ARTICLE_BURST", default_burst)),
+            },
+        }
+
+    @classmethod
+    def lane_for_url(cls, url: str) -> str:
+        """URLから使用するレーン名を決定する。"""
+        parsed = urlparse(url)
+        if "/searchapi/" in parsed.path:
+            return cls.SEARCH_LANE
+        return f"{cls.ARTICLE_LANE_PREFIX}:{parsed.hostname or 'unknown'}"
+
+    def get_lane(self, lane_name: str) -> TokenBucket:
+        """レーン名に対応するバケットを返す（初回アクセス時に作成）。"""
+        with self._lock:
+            bucket = self._lanes.get(lane_name)
+            if bucket is None:
+                config_key = lane_name.split(":", 1)[0]
+                config = self.lane_config.get(config_key) or self.lane_config.get("article", {})
+                bucket = TokenBucket(
+                    interval=config.get("interval", 10),
+                    burst=config.get("burst", 1),
+                    name=lane_name,
+                )
+                self._lanes[lane_name] = bucket
+            return bucket
+
+    def acquire(self, url: str) -> float:
+        """URLに対応するレーンでトークンを取得する（同期版）。"""
+        return self.get_lane(self.lane_for_url(url)).acquire()
+
+    async def acquire_async(self, url: str) -> float:
+        """URLに対応するレーンでトークンを取得する（非同期版）。"""
+        return await self.get_lane(self.lane_for_url(url)).acquire_async()
+
+    def get_wait_stats(self) -> dict:
+        """レーンごとの待機時間カウンターを返す。どのレーンがボトルネックかの確認に使う。"""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return {bucket.name: bucket.get_stats() for bucket in lanes}
+
+
+_shared_jstage_lanes = None
+_shared_jstage_lanes_lock = threading.Lock()
+
+
+def get_shared_jstage_lanes() -> LimiterLanes:
+    """
+    プロセス全体で共有する J-STAGE 用のレーン群を返す。
+    同期版・非同期版どちらのクライアントも、既定ではこのレーン群を使う。
+    """
+    global _shared_jstage_lanes
+    with _shared_jstage_lanes_lock:
+        if _shared_jstage_lanes is None:
+            _shared_jstage_lanes = LimiterLanes()
+        return _shared_jstage_lanes
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_SEARCH_CACHE_DIR = os.path.join("output", "cache", "jstage_search")
+
+
+class SearchCache:
+    """
+    J-STAGE検索APIの結果ページをディスクに保存するキャッシュ。
+    (keyword, start, count, service) をキーとし、1ページ = 1 JSONファイルとして保存する。
+
+    - TTL内のエントリは、APIへアクセスせず（待機もせず）即座に返す。
+    - TTLを過ぎたエントリは、ETag / Last-Modified があれば条件付きリクエストで再検証する。
+    TTLは環境変数 JSTAGE_SEARCH_CACHE_TTL（秒, デフォルト: 7日）で設定する。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_SEARCH_CACHE_DIR, ttl_seconds: float | None = None):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("JSTAGE_SEARCH_CACHE_TTL", 7 * 24 * 3600))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0}
+
+    @staticmethod
+    def _make_key(keyword: str, start: int, count: int, service: str) -> dict:
+        return {"keyword": keyword, "start": int(start), "count": int(count), "service": str(service)}
+
+    def _path_for(self, key: dict) -> str:
+        digest = hashlib.sha256(json.dumps(key, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, keyword: str, start: int, count: int, service: str = "3") -> dict | None:
+        """キャッシュエントリを返す（存在しない場合は None）。鮮度の判定は is_fresh で行う。"""
+        path = self._path_for(self._make_key(keyword, start, count, service))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[SearchCache] キャッシュファイルの読み込みに失敗しました（無視します）: {path} ({e})")
+            self._count("misses")
+            return None
+
+        if self.is_fresh(entry):
+            self._count("hits")
+        else:
+            self._count("stale")
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        """エントリがTTL内かどうかを返す。"""
+        return (time.time() - entry.get("fetched_at", 0)) < self.ttl_seconds
+
+    @staticmethod
+    def conditional_headers(entry: dict | None) -> dict:
+        """古いエントリを再検証するための条件付きリクエストヘッダーを返す。"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(
+        self,
+        keyword: str,
+        start: int,
+        count: int,
+        service: str,
+        articles: list,
+        total_results: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        """検索結果ページを保存する。書き込みは一時ファイル経由でアトミックに行う。"""
+        key = self._make_key(keyword, start, count, service)
+        entry = {
+            "key": key,
+            "articles": articles,
+            "total_results": total_results,
+            "fetched_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        self._write(self._path_for(key), entry)
+
+    def touch(self, entry: dict):
+        """304 (Not Modified) で再検証できたエントリの取得時刻を更新する。"""
+        entry["fetched_at"] = time.time()
+        self._write(self._path_for(entry["key"]), entry)
+        self._count("revalidated")
+
+    def _write(self, path: str, entry: dict):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[SearchCache] キャッシュの書き込みに失敗しました: {path} ({e})")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,75 @@
+import os
+import mmap
+import hashlib
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_SPOOL_DIR = os.path.join("output", "cache", "spool")
+# ダウンロードする論文本体の最大サイズ（バイト, デフォルト: 100MiB）
+DEFAULT_MAX_DOWNLOAD_BYTES = int(os.getenv("ARTICLE_DOWNLOAD_MAX_BYTES", 100 * 1024**2))
+# ストリーミング時に1回で読むバイト数
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class SpooledArticle:
+    """
+    ストリーミングでダウンロードした論文本体を保持する一時ファイル（スプールファイル）。
+    本体をメモリに載せずにディスクへ書き出し、変換時はメモリマップで参照する。
+    使い終わったら close() で一時ファイルを削除する（with 文でも使用可能）。
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._file = None
+        self._mmap = None
+
+    @classmethod
+    def create(cls, spool_dir: str = DEFAULT_SPOOL_DIR) -> tuple["SpooledArticle", object]:
+        """空のスプールファイルを作成し、(SpooledArticle, 書き込み用ファイル) を返す。"""
+        os.makedirs(spool_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=spool_dir, suffix=".part")
+        return cls(path, 0), os.fdopen(fd, "wb")
+
+    def open_mmap(self):
+        """本体を読み取り専用のメモリマップとして返す（空ファイルの場合は b""）。"""
+        if self.size == 0:
+            return b""
+        if self._mmap is None:
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read_bytes(self) -> bytes:
+        """本体をすべて読み込んで返す（小さなファイルや互換用）。"""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def sha256(self) -> str:
+        """本体の sha256 をファイルから逐次計算する。"""
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def close(self):
+        """メモリマップを閉じ、一時ファイルを削除する。"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
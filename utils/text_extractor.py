@@ -1,5 +1,42 @@
+import re
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
 from bs4 import BeautifulSoup
 
+# ページ幅に対してこの割合以上の幅を持つブロックは、段組をまたぐ（タイトル・図表など）ものとして扱う
+FULL_WIDTH_BLOCK_RATIO = 0.6
+# 段の境界（ページ中央）からのはみ出しの許容幅（ページ幅に対する割合）
+COLUMN_GUTTER_RATIO = 0.05
+# テキスト層があるとみなす、1ページあたりの最小文字数
+MIN_PAGE_CHARS = 50
+
+# 文字化けとみなす文字: 置換文字、私用領域、制御文字（改行・タブを除く）
+_GARBLED_CHAR_PATTERN = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]")
+# フォントの対応表がないPDFで出力される "(cid:123)" 形式の文字
+_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+# 論文の本文として想定する文字: ASCII、ラテン文字、ひらがな・カタカナ・漢字、全角記号、一般的な記号
+_EXPECTED_CHAR_PATTERN = re.compile(
+    r"[\x20-\x7e\u00a0-\u024f\u0370-\u03ff\u2000-\u22ff\u2460-\u24ff\u2500-\u27bf"
+    r"\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+)
+
+
+@contextmanager
+def open_pdf(content):
+    """
+    PDFの中身（bytes または mmap）をコピーせずに開く。
+    mmap は memoryview として MuPDF に渡すため、ファイルサイズ分のメモリを新たに確保しない。
+    ビューはドキュメントを閉じた後に解放する（解放しないと mmap を閉じられない）。
+    """
+    view = content if isinstance(content, bytes) else memoryview(content)
+    try:
+        with fitz.open(stream=view, filetype="pdf") as doc:
+            yield doc
+    finally:
+        if isinstance(view, memoryview):
+            view.release()
+
 
 def extract_text_from_html(content: bytes) -> str:
     """
@@ -26,3 +63,88 @@ def extract_text_from_html(content: bytes) -> str:
     except Exception as e:
         print(f"[TextExtractor] HTMLの解析中にエラーが発生しました: {e}")
         return ""
+
+
+def extract_text_from_pdf(content) -> dict:
+    """
+    PDFコンテンツ（テキスト層）から、ページごとにテキストを抽出する。
+    2段組のページは、段をまたぐブロック（タイトル・図表など）で区切った範囲ごとに、左の段→右の段の順に結合する。
+
+    Args:
+        content (bytes | mmap.mmap): ダウンロードしたPDFファイルの中身。
+
+    Returns:
+        {"text": 抽出したテキスト, "pages": ページごとのテキスト, "page_count": ページ数,
+         "page_chars": ページごとの文字数（空白を除く）} の辞書。PDFを開けない場合は text が空になる。
+    """
+    try:
+        with open_pdf(content) as doc:
+            pages = [_extract_page_text(page) for page in doc]
+    except Exception as e:
+        print(f"[TextExtractor] PDFの解析中にエラーが発生しました: {e}")
+        return {"text": "", "pages": [], "page_count": 0, "page_chars": []}
+
+    return {
+        "text": "\n\n".join(page for page in pages if page),
+        "pages": pages,
+        "page_count": len(pages),
+        "page_chars": [len(re.sub(r"\s", "", page)) for page in pages],
+    }
+
+
+def _extract_page_text(page) -> str:
+    """1ページ分のテキストを、段組を考慮した読み順で結合する。"""
+    width = page.rect.width
+    middle = page.rect.x0 + width / 2
+    gutter = width * COLUMN_GUTTER_RATIO
+
+    # (x0, y0, x1, y1, text, block_no, block_type)。block_type 1 は画像
+    blocks = [block for block in page.get_text("blocks") if block[6] == 0 and block[4].strip()]
+    blocks.sort(key=lambda block: (block[1], block[0]))
+
+    ordered = []
+    left, right = [], []
+    for block in blocks:
+        x0, _, x1 = block[0], block[1], block[2]
+        if x1 - x0 >= width * FULL_WIDTH_BLOCK_RATIO or (x0 < middle - gutter and x1 > middle + gutter):
+            # 段をまたぐブロックの手前までの段を出力してから、このブロックを出力する
+            ordered.extend(left + right)
+            left, right = [], []
+            ordered.append(block)
+        elif x1 <= middle + gutter:
+            left.append(block)
+        else:
+            right.append(block)
+    ordered.extend(left + right)
+
+    return "\n".join(block[4].strip() for block in ordered)
+
+
+def assess_text_quality(extraction: dict) -> dict:
+    """
+    extract_text_from_pdf の結果から、テキスト層の品質を評価する。
+
+    Args:
+        extraction (dict): extract_text_from_pdf の戻り値。
+
+    Returns:
+        以下のキーを持つ辞書。
+        - chars_per_page: 1ページあたりの平均文字数（空白を除く。スキャンPDFでは0に近い）
+        - text_page_ratio: テキスト層がある（MIN_PAGE_CHARS 文字以上の）ページの割合
+        - garbled_ratio: 文字化けとみなす文字（置換文字・私用領域・制御文字・(cid:N)）の割合
+        - unexpected_ratio: 論文の本文として想定しない文字の割合
+    """
+    text = re.sub(r"\s", "", extraction["text"])
+    page_count = extraction["page_count"]
+    if not text or page_count == 0:
+        return {"chars_per_page": 0.0, "text_page_ratio": 0.0, "garbled_ratio": 1.0, "unexpected_ratio": 1.0}
+
+    cid_chars = sum(len(match) for match in _CID_PATTERN.findall(text))
+    garbled_chars = len(_GARBLED_CHAR_PATTERN.findall(text)) + cid_chars
+    expected_chars = len(_EXPECTED_CHAR_PATTERN.findall(_CID_PATTERN.sub("", text)))
+    return {
+        "chars_per_page": len(text) / page_count,
+        "text_page_ratio": sum(1 for chars in extraction["page_chars"] if chars >= MIN_PAGE_CHARS) / page_count,
+        "garbled_ratio": garbled_chars / len(text),
+        "unexpected_ratio": 1.0 - expected_chars / max(1, len(text) - cid_chars),
+    }